@@ -0,0 +1,75 @@
+import os
+import random
+
+from PyQt6.QtCore import QBuffer, QByteArray, QIODevice
+from PyQt6.QtGui import QImage, QColor
+
+# MPEG-1 Layer III, 128 kbit/s, 44.1 kHz, no padding: 417 byte frames of silence, about 26 ms each
+MPEG_FRAME = b"\xff\xfb\x90\x00" + b"\x00" * 413
+FRAMES_PER_SECOND = 38
+
+# Extra text in the tag, from a bare tag to one with long comments and lyrics
+TAG_SIZES = {"small": 0, "medium": 16 * 1024, "large": 256 * 1024}
+# Embedded cover edge in pixels; noise keeps the JPEG from compressing, 2400px is several MB
+COVER_SIZES = {"none": 0, "thumb": 300, "cd": 1000, "print": 2400}
+
+
+def cover_jpeg(size, seed=0):
+    # Random pixels so the encoded size is close to a real high-resolution scan
+    rng = random.Random(seed)
+    image = QImage(size, size, QImage.Format.Format_RGB32)
+    image.fill(QColor(rng.randrange(256), rng.randrange(256), rng.randrange(256)))
+    bits = image.bits()
+    bits.setsize(image.sizeInBytes())
+    bits[:] = os.urandom(image.sizeInBytes())
+    data = QByteArray()
+    buffer = QBuffer(data)
+    buffer.open(QIODevice.OpenModeFlag.WriteOnly)
+    image.save(buffer, "JPG", 92)
+    return bytes(data)
+
+
+def write_mp3(path, title, artist, album, genre="Benchmark", seconds=5, tag_bytes=0, cover=None):
+    from mutagen.id3 import ID3, TIT2, TPE1, TALB, TCON, COMM, USLT, APIC
+
+    with open(path, "wb") as f:
+        f.write(MPEG_FRAME * (seconds * FRAMES_PER_SECOND))
+    tags = ID3()
+    tags.add(TIT2(encoding=3, text=title))
+    tags.add(TPE1(encoding=3, text=artist))
+    tags.add(TALB(encoding=3, text=album))
+    tags.add(TCON(encoding=3, text=genre))
+    if tag_bytes:
+        tags.add(COMM(encoding=3, lang="eng", desc="", text="c" * (tag_bytes // 2)))
+        tags.add(USLT(encoding=3, lang="eng", desc="", text="l" * (tag_bytes // 2)))
+    if cover:
+        tags.add(APIC(encoding=3, mime="image/jpeg", type=3, desc="", data=cover))
+    tags.save(path)
+
+
+def make_matrix(directory, seconds=5):
+    # One file per tag size and cover size; returns {(tag, cover): path}
+    os.makedirs(directory, exist_ok=True)
+    covers = {name: cover_jpeg(size, seed=i) if size else None for i, (name, size) in enumerate(COVER_SIZES.items())}
+    files = {}
+    for tag_name, tag_bytes in TAG_SIZES.items():
+        for cover_name, cover in covers.items():
+            path = os.path.join(directory, f"{tag_name}-{cover_name}.mp3")
+            write_mp3(path, f"{tag_name} {cover_name}", "Bench Artist", "Bench Album",
+                      seconds=seconds, tag_bytes=tag_bytes, cover=cover)
+            files[(tag_name, cover_name)] = path
+    return files, covers
+
+
+def make_library(directory, count, albums=20, seconds=2):
+    # A folder tree shaped like a real library: artist/album/track, one shared cover per album
+    covers = [cover_jpeg(300, seed=i) for i in range(albums)]
+    paths = []
+    for i in range(count):
+        album = i % albums
+        folder = os.path.join(directory, f"Artist {album % 7}", f"Album {album}")
+        os.makedirs(folder, exist_ok=True)
+        path = os.path.join(folder, f"{i:05}.mp3")
+        write_mp3(path, f"Track {i}", f"Artist {album % 7}", f"Album {album}", seconds=seconds, cover=covers[album])
+        paths.append(path)
+    return paths
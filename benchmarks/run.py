@@ -0,0 +1,588 @@
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import platform
+import tempfile
+import statistics
+import subprocess
+
+# Benchmarks run headless; an explicit platform from the environment still wins
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+
+from PyQt6.QtCore import QCoreApplication, QStandardPaths, QT_VERSION_STR, PYQT_VERSION_STR
+from PyQt6.QtWidgets import QApplication
+
+from benchmarks.fixtures import make_matrix, make_library, cover_jpeg, COVER_SIZES
+
+# Allowed slowdown against the baseline before a metric counts as a regression
+DEFAULT_THRESHOLD = 0.25
+# Metrics that are noisy on shared machines get more room
+THRESHOLDS = {
+    "scan.cold_files_per_s": 0.4,
+    "scan.uncached_files_per_s": 0.5,
+    "playback.transition_gap_ms": 0.5,
+    "remote.playback_blocked_ms.read_ahead": 0.5,
+}
+# Files from the fixture matrix read over the throttled mount
+REMOTE_FILES = (("small", "none"), ("medium", "cd"), ("large", "print"))
+# Decoder pace for the playback comparison, well above real time to keep the run short
+PLAYBACK_RATE = 4 * 1024 * 1024
+PLAYBACK_BYTES = 2 * 1024 * 1024
+PLAYBACK_READ = 16 * 1024
+# Planted near-copies in the synthetic fingerprint set, and the share of bits flipped in them
+DUPLICATE_PAIRS = 100
+DUPLICATE_BIT_ERROR = 0.1
+# Album grid: distinct covers spread over the albums, and scroll frames measured
+GRID_COVERS = 200
+GRID_FRAMES = 300
+# DSP engine: 44.1 kHz sources rendered at 48 kHz through a crossfade and five equalizer bands
+DSP_SOURCE_RATE = 44100
+DSP_RATE = 48000
+DSP_CROSSFADE_MS = 2000
+DSP_BANDS = "lowshelf:100:4:0.7, peak:250:-2:1, peak:1000:3:1.4, peak:3000:2:2, highshelf:8000:-3:0.7"
+# The real-time run: a small ring, emptied by an output pulling this often
+DSP_BUFFER_MS = 50
+DSP_PULL_MS = 10
+
+
+def measure(function, repeat, warmup=1):
+    for _ in range(warmup):
+        function()
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        function()
+        samples.append((time.perf_counter() - started) * 1000)
+    return samples
+
+
+def summary(samples, unit="ms"):
+    samples = sorted(samples)
+    return {
+        "value": statistics.median(samples),
+        "p95": samples[min(len(samples) - 1, int(len(samples) * 0.95))],
+        "unit": unit,
+        "better": "lower",
+        "samples": len(samples),
+    }
+
+
+def throughput(value, unit):
+    return {"value": value, "unit": unit, "better": "higher"}
+
+
+def wait_for(condition, timeout=60.0):
+    app = QCoreApplication.instance()
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            raise TimeoutError("benchmark step did not finish in time")
+        app.processEvents()
+        time.sleep(0.001)
+
+
+def bench_metadata(results, files, repeat):
+    from components.metadata import read_tags
+    from components.metadata_loader import MetadataLoader
+    from components.cover_cache import CoverCache
+    from components.cover_store import CoverStore
+
+    for (tag_name, cover_name), path in sorted(files.items()):
+        results[f"metadata.read_tags.{tag_name}_tag.{cover_name}_cover"] = summary(
+            measure(lambda: read_tags(path), repeat))
+
+    # End to end through the loader: tags, cover thumbnail and the signal back to the GUI thread
+    path = files[("medium", "print")]
+    for state in ("cold", "warm"):
+        samples = []
+        cache = CoverCache()
+        for _ in range(repeat):
+            with tempfile.TemporaryDirectory() as cover_dir:
+                if state == "cold":
+                    cache = CoverCache()
+                loader = MetadataLoader(cover_cache=cache, cover_store=CoverStore(cover_dir))
+                loaded = []
+                loader.loaded.connect(loaded.append)
+                started = time.perf_counter()
+                loader.load(path)
+                wait_for(lambda: loaded)
+                samples.append((time.perf_counter() - started) * 1000)
+                loader.pool.waitForDone()
+        results[f"metadata.loader.{state}"] = summary(samples)
+
+
+def bench_covers(results, covers, repeat):
+    from PyQt6.QtGui import QImage
+    from components.cover_store import CoverStore, COVER_SIZE, scale_cover
+    from components.thumbnails import ThumbnailService, decode_data
+
+    main_module = __import__("main")
+    album_cover = main_module.albumCover(ThumbnailService())
+    for name, data in covers.items():
+        if not data:
+            continue
+        results[f"cover.decode_scale.{name}"] = summary(
+            measure(lambda: scale_cover(QImage.fromData(data), COVER_SIZE), repeat))
+        # Decoding at the target size, as the thumbnail service does
+        results[f"cover.decode_scaled.{name}"] = summary(measure(lambda: decode_data(data, COVER_SIZE), repeat))
+        with tempfile.TemporaryDirectory() as cover_dir:
+            store = CoverStore(cover_dir)
+            results[f"cover.store.{name}"] = summary(measure(lambda: store.store(name, data), repeat))
+            image = store.load(name)
+            results[f"cover.load_thumbnail.{name}"] = summary(measure(lambda: store.load(name), repeat))
+        # What the window does once the loader hands over the scaled image
+        results[f"cover.album_cover_update.{name}"] = summary(measure(lambda: album_cover.update(image), repeat))
+
+
+def drop_page_cache(paths):
+    # Ask the kernel to forget cached file pages so the next read goes to the disk
+    if not hasattr(os, "posix_fadvise"):
+        return False
+    for path in paths:
+        try:
+            fd = os.open(path, os.O_RDONLY)
+        except OSError:
+            continue
+        try:
+            os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_DONTNEED)
+        finally:
+            os.close(fd)
+    return True
+
+
+def run_scan(db_path, root, workers):
+    from components.scanner import LibraryScanner
+
+    scanner = LibraryScanner(db_path, [root], workers=workers)
+    finished = []
+    scanner.finished_scan.connect(finished.append)
+    started = time.perf_counter()
+    scanner.start()
+    wait_for(lambda: finished and scanner.isFinished(), timeout=600)
+    return time.perf_counter() - started, finished[0]
+
+
+def bench_scan(results, root, paths, workers):
+    with tempfile.TemporaryDirectory() as db_dir:
+        db_path = os.path.join(db_dir, "library.sqlite3")
+        elapsed, stats = run_scan(db_path, root, workers)
+        results["scan.cold_files_per_s"] = throughput(stats["added"] / elapsed, "files/s")
+        # A rescan of an unchanged tree only stats files
+        elapsed, stats = run_scan(db_path, root, workers)
+        results["scan.rescan_files_per_s"] = throughput(stats["unchanged"] / elapsed, "files/s")
+
+    # Files that are not in the page cache, as on a slow or network drive after a reboot
+    if drop_page_cache(paths):
+        with tempfile.TemporaryDirectory() as db_dir:
+            elapsed, stats = run_scan(os.path.join(db_dir, "library.sqlite3"), root, workers)
+            results["scan.uncached_files_per_s"] = throughput(stats["added"] / elapsed, "files/s")
+
+
+def bench_position(results, ticks):
+    main_module = __import__("main")
+    window = main_module.MainWindow()
+    window.update_duration(ticks * 50)
+    # Ticks arrive about every 50 ms; only whole-second changes reach the widgets
+    position = 0
+
+    def tick():
+        nonlocal position
+        position += 50
+        window.update_position(position)
+
+    samples = measure(tick, ticks, warmup=10)
+    results["ui.update_position_per_tick"] = summary([sample * 1000 for sample in samples], unit="us")
+    window.close()
+
+
+def bench_transition(results, files):
+    try:
+        from PyQt6.QtMultimedia import QMediaPlayer  # noqa: F401
+    except ImportError as e:
+        results["playback.transition_gap_ms"] = {"skipped": f"QtMultimedia unavailable: {e}"}
+        return
+    from components.playback_queue import PlaybackQueue
+    from components.gapless_player import GaplessPlayer
+
+    # Two short tracks back to back; the player reports the gap itself
+    queue = PlaybackQueue()
+    player = GaplessPlayer(queue, preload_ms=1500)
+    player.setVolume(0.0)
+    gaps = []
+    player.transitionMeasured.connect(gaps.append)
+    queue.replace([files[("small", "none")], files[("small", "thumb")]])
+    player.play_current()
+    try:
+        wait_for(lambda: gaps, timeout=30)
+    except TimeoutError:
+        results["playback.transition_gap_ms"] = {"skipped": "no transition within 30 s"}
+        return
+    finally:
+        player.stop()
+    results["playback.transition_gap_ms"] = summary(gaps)
+
+
+def bench_albums(results, count):
+    from components.library import Library
+    from components.cover_store import CoverStore
+    from components.thumbnails import ThumbnailService
+    from components.album_grid import AlbumGrid
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        store = CoverStore(os.path.join(work_dir, "covers"))
+        hashes = [f"{i:032x}" for i in range(GRID_COVERS)]
+        for i, cover_hash in enumerate(hashes):
+            store.store(cover_hash, cover_jpeg(300, seed=i))
+        library = Library(os.path.join(work_dir, "library.sqlite3"))
+        library.store({
+            "path": f"/music/Artist {i % 97}/Album {i}/01.mp3", "mtime": 0, "size": 0, "duration": 200.0,
+            "title": "Track", "artist": f"Artist {i % 97}", "album": f"Album {i}", "genre": "Benchmark",
+            "cover_hash": hashes[i % GRID_COVERS], "track_gain": None, "track_peak": None,
+            "album_gain": None, "album_peak": None, "gain_source": None} for i in range(count))
+        library.close()
+
+        thumbnails = ThumbnailService(store)
+        grid = AlbumGrid(library.db_path, thumbnails)
+        grid.resize(700, 350)
+        grid.show()
+        wait_for(lambda: grid.model.rowCount() == count)
+        view = grid.gridView
+        scroll_bar = view.verticalScrollBar()
+        app = QCoreApplication.instance()
+
+        # A steady fling through the grid; covers land between frames as they are decoded
+        step = max(scroll_bar.maximum() // GRID_FRAMES, 1)
+
+        def frame():
+            scroll_bar.setValue(scroll_bar.value() + step)
+            app.processEvents()
+            view.viewport().repaint()
+
+        results["albums.scroll_frame_ms"] = summary(measure(frame, GRID_FRAMES, warmup=0))
+        results["albums.decoded"] = {"value": thumbnails.cache.stats()["entries"], "unit": "covers", "better": "higher"}
+
+        # Jump somewhere new and wait until every visible cover is shown
+        samples = []
+        for fraction in (0.1, 0.5, 0.9):
+            started = time.perf_counter()
+            scroll_bar.setValue(int(scroll_bar.maximum() * fraction))
+            view.viewport().repaint()
+            wait_for(lambda: not thumbnails.pending and not thumbnails.running)
+            samples.append((time.perf_counter() - started) * 1000)
+        results["albums.covers_after_jump_ms"] = summary(samples)
+        grid.close()
+        thumbnails.pool.waitForDone()
+
+
+def bench_session(results, count, repeat):
+    from components.player_engine import PlayerEngine
+    from components.session import SessionStore
+
+    paths = [f"/music/Artist {i % 97}/Album {i // 12}/{i % 12:02}.mp3" for i in range(count)]
+    with tempfile.TemporaryDirectory() as session_dir:
+        engine = PlayerEngine()
+        store = SessionStore(engine, session_dir)
+        engine.queue.replace(paths, count // 2)
+
+        # What the GUI thread pays per save, the write itself runs on the session thread
+        def snapshot():
+            store.queue_dirty = True
+            store.save()
+
+        results["session.save_gui_thread"] = summary(measure(snapshot, repeat))
+        store.pool.waitForDone()
+        results["session.save_unchanged"] = summary(measure(store.save, repeat))
+        results["session.save_total"] = summary(measure(lambda: (snapshot(), store.pool.waitForDone()), repeat))
+
+        # From reading the files to a queue the player can resume
+        def restore():
+            restored = PlayerEngine()
+            restored.player.load_current = lambda position=0: None
+            loader = SessionStore(restored, session_dir)
+            states = []
+            loader.loaded.connect(states.append)
+            loader.load()
+            wait_for(lambda: states)
+            loader.restore(states[0])
+
+        results["session.restore"] = summary(measure(restore, repeat))
+
+
+def write_tone(path, seconds, frequency):
+    import wave
+    import numpy as np
+
+    times = np.arange(int(seconds * DSP_SOURCE_RATE)) / DSP_SOURCE_RATE
+    tone = (np.sin(2 * np.pi * frequency * times) * 0.5 * 32767).astype("<i2")
+    with wave.open(path, "wb") as writer:
+        writer.setnchannels(2)
+        writer.setsampwidth(2)
+        writer.setframerate(DSP_SOURCE_RATE)
+        writer.writeframes(np.repeat(tone[:, None], 2, axis=1).tobytes())
+    return path
+
+
+def bench_dsp(results, seconds):
+    from components.dsp import Renderer, RingBuffer, BLOCK_FRAMES, parse_bands
+    from components.dsp_player import RenderThread
+
+    bands = parse_bands(DSP_BANDS)
+    with tempfile.TemporaryDirectory() as work_dir:
+        paths = [write_tone(os.path.join(work_dir, f"{i}.wav"), seconds, 440 * (i + 1)) for i in range(2)]
+
+        # Everything the render thread does per block: decode, resample, crossfade, equalizer
+        renderer = Renderer(DSP_RATE, crossfade_ms=DSP_CROSSFADE_MS, bands=bands)
+        renderer.load(paths[0])
+        renderer.set_next(paths[0], paths[1])
+        samples = []
+        while True:
+            started = time.perf_counter()
+            result = renderer.render()
+            if result is None:
+                break
+            samples.append((time.perf_counter() - started) * 1000)
+        block_ms = BLOCK_FRAMES * 1000 / DSP_RATE
+        results["dsp.render_block_us"] = summary([sample * 1000 for sample in samples], unit="us")
+        results["dsp.realtime_factor"] = throughput(block_ms / statistics.mean(samples), "x")
+
+        # The render thread against an output pulling at real-time pace, both on one core
+        affinity = os.sched_getaffinity(0) if hasattr(os, "sched_setaffinity") else None
+        if affinity:
+            os.sched_setaffinity(0, {min(affinity)})
+        ring = RingBuffer(max(DSP_RATE * DSP_BUFFER_MS // 1000 // BLOCK_FRAMES, 2) * BLOCK_FRAMES)
+        thread = RenderThread(Renderer(DSP_RATE, crossfade_ms=DSP_CROSSFADE_MS, bands=bands), ring)
+        thread.start()
+        try:
+            thread.send("load", 1, paths[0], 0, 1.0)
+            thread.send("next", paths[0], paths[1], 1.0)
+            wait_for(lambda: ring.free() < BLOCK_FRAMES, timeout=10)
+            pull = DSP_RATE * DSP_PULL_MS // 1000
+            underruns = pulled = 0
+            end = None
+            started = time.perf_counter()
+            while end is None or ring.read_pos < end:
+                delay = started + pulled / DSP_RATE - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+                frames = ring.read(pull)
+                thread.wake.set()
+                pulled += pull
+                if end is None and len(frames) < pull:
+                    underruns += 1
+                if end is None:
+                    end = thread.end[0] if thread.end is not None else None
+        finally:
+            thread.close()
+            if affinity:
+                os.sched_setaffinity(0, affinity)
+        results["dsp.underruns"] = {"value": underruns, "unit": "underruns", "better": "lower"}
+        results["dsp.played_s"] = {"value": pulled / DSP_RATE, "unit": "s", "better": "higher"}
+
+
+def consume(device_read, total, rate):
+    # Reads at a fixed pace like a decoder would; returns the time spent blocked in reads
+    blocked = 0.0
+    started = time.perf_counter()
+    done = 0
+    while done < total:
+        before = time.perf_counter()
+        data = device_read(PLAYBACK_READ)
+        blocked += time.perf_counter() - before
+        if not data:
+            break
+        done += len(data)
+        delay = started + done / rate - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+    return blocked * 1000
+
+
+def bench_remote(results, files, repeat):
+    from PyQt6.QtCore import QIODevice
+    from components.metadata import read_tags, read_mp3
+    from components.read_ahead import ReadAheadDevice
+    from benchmarks.throttled_fs import throttled_mount, open_plain
+
+    root = os.path.dirname(files[REMOTE_FILES[0]])
+    repeat = max(repeat // 4, 3)
+    with throttled_mount(root) as throttle:
+        for tag_name, cover_name in REMOTE_FILES:
+            path = files[(tag_name, cover_name)]
+            name = f"{tag_name}_tag.{cover_name}_cover"
+
+            def plain():
+                with open_plain(path, throttle) as f:
+                    read_mp3(path, f)
+
+            for variant, function in (("ranged", lambda: read_tags(path)), ("plain_open", plain)):
+                throttle.reset()
+                function()
+                results[f"remote.round_trips.{variant}.{name}"] = {
+                    "value": throttle.calls, "unit": "reads", "better": "lower"}
+                results[f"remote.read_tags.{variant}.{name}"] = summary(measure(function, repeat, warmup=0))
+
+        path = files[("large", "print")]
+
+        samples = []
+        for _ in range(repeat):
+            device = ReadAheadDevice(path)
+            started = time.perf_counter()
+            device.open(QIODevice.OpenModeFlag.ReadOnly)
+            device.read(4096)
+            samples.append((time.perf_counter() - started) * 1000)
+            # Closing waits for the chunk being read ahead, that is not start-up latency
+            device.close()
+        results["remote.playback_first_read_ms"] = summary(samples)
+
+        blocked = []
+        for _ in range(repeat):
+            device = ReadAheadDevice(path)
+            device.open(QIODevice.OpenModeFlag.ReadOnly)
+            blocked.append(consume(lambda size: bytes(device.read(size)), PLAYBACK_BYTES, PLAYBACK_RATE))
+            device.close()
+        results["remote.playback_blocked_ms.read_ahead"] = summary(blocked)
+
+        blocked = []
+        for _ in range(repeat):
+            with open_plain(path, throttle) as f:
+                blocked.append(consume(f.read, PLAYBACK_BYTES, PLAYBACK_RATE))
+        results["remote.playback_blocked_ms.plain_open"] = summary(blocked)
+
+
+def bench_duplicates(results, tracks, repeat):
+    import numpy as np
+    from components.fingerprint import find_duplicates, FINGERPRINT_SECONDS, TARGET_RATE, FRAME_SIZE, HOP_SIZE
+
+    # Fingerprints stand in for decoded audio here, the index and verification are what is measured
+    rng = np.random.default_rng(0)
+    frames = (FINGERPRINT_SECONDS * TARGET_RATE - FRAME_SIZE) // HOP_SIZE + 1
+    fingerprints = rng.integers(0, 2 ** 32, (tracks, frames), dtype=np.uint32)
+    rows = [(f"/bench/{i}.mp3", 200.0, None, fingerprints[i].tobytes()) for i in range(tracks)]
+    for i in range(DUPLICATE_PAIRS):
+        flips = rng.random((frames, 32)) < DUPLICATE_BIT_ERROR
+        noise = (flips * (1 << np.arange(32, dtype=np.uint64))).sum(axis=1).astype(np.uint32)
+        rows.append((f"/bench/copy-{i}.mp3", 200.0, None, (fingerprints[i] ^ noise).tobytes()))
+
+    groups = []
+    samples = measure(lambda: groups.append(find_duplicates(rows)), max(repeat // 5, 1), warmup=0)
+    results["duplicates.search_ms"] = summary(samples)
+    found = {tuple(group["paths"]) for group in groups[-1]}
+    recall = sum((f"/bench/{i}.mp3", f"/bench/copy-{i}.mp3") in found for i in range(DUPLICATE_PAIRS))
+    results["duplicates.recall"] = {"value": recall / DUPLICATE_PAIRS, "unit": "ratio", "better": "higher"}
+    results["duplicates.false_groups"] = {"value": len(found) - recall, "unit": "groups", "better": "lower"}
+
+
+def git_revision():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results, baseline, threshold):
+    regressions = []
+    for name, current in results.items():
+        previous = baseline.get("results", {}).get(name)
+        if not previous or "value" not in previous or "value" not in current or not previous["value"]:
+            continue
+        allowed = THRESHOLDS.get(name, threshold)
+        change = current["value"] / previous["value"] - 1
+        if current["better"] == "higher":
+            change = -change
+        current["change"] = change
+        if change > allowed:
+            regressions.append((name, previous["value"], current["value"], current["unit"], change))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark metadata, cover, scan and UI hot paths")
+    parser.add_argument("--output", help="write results as JSON to this file")
+    parser.add_argument("--baseline", help="JSON results of an earlier run to compare against")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD,
+                        help="allowed relative slowdown before a metric fails (default %(default)s)")
+    parser.add_argument("--quick", action="store_true", help="fewer repetitions and a smaller library")
+    parser.add_argument("--only", nargs="+",
+                        choices=("metadata", "covers", "scan", "position", "transition", "remote", "duplicates", "albums", "session", "dsp"))
+    parser.add_argument("--workers", type=int, default=None, help="scanner processes (default: all cores)")
+    args = parser.parse_args()
+
+    repeat = 5 if args.quick else 20
+    library_size = 200 if args.quick else 2000
+    selected = set(args.only or ("metadata", "covers", "scan", "position", "transition", "remote", "duplicates", "albums", "session", "dsp"))
+
+    app = QApplication(sys.argv[:1])
+    # Keeps the window's library, settings and caches out of the user's real ones
+    QStandardPaths.setTestModeEnabled(True)
+    app.setApplicationName("qt-music-player-benchmarks")
+
+    results = {}
+    work_dir = tempfile.mkdtemp(prefix="qmp-bench-")
+    try:
+        started = time.perf_counter()
+        files, covers = make_matrix(os.path.join(work_dir, "matrix"))
+        library_root = os.path.join(work_dir, "library")
+        library_paths = make_library(library_root, library_size) if "scan" in selected else []
+        print(f"Fixtures ready in {time.perf_counter() - started:.1f} s "
+              f"(largest cover {max(len(c) for c in covers.values() if c) / 1e6:.1f} MB)", file=sys.stderr)
+
+        if "metadata" in selected:
+            bench_metadata(results, files, repeat)
+        if "covers" in selected:
+            bench_covers(results, covers, repeat)
+        if "scan" in selected:
+            bench_scan(results, library_root, library_paths, args.workers)
+        if "position" in selected:
+            bench_position(results, repeat * 50)
+        if "transition" in selected:
+            bench_transition(results, files)
+        if "remote" in selected:
+            bench_remote(results, files, repeat)
+        if "duplicates" in selected:
+            bench_duplicates(results, library_size * 5, repeat)
+        if "albums" in selected:
+            bench_albums(results, library_size * 5)
+        if "session" in selected:
+            bench_session(results, library_size * 50, repeat)
+        if "dsp" in selected:
+            bench_dsp(results, 4 if args.quick else 10)
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    regressions = []
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.threshold)
+
+    report = {
+        "meta": {
+            "revision": git_revision(),
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "qt": QT_VERSION_STR,
+            "pyqt": PYQT_VERSION_STR,
+            "quick": args.quick,
+            "cover_sizes": COVER_SIZES,
+        },
+        "results": results,
+    }
+    text = json.dumps(report, indent=2, sort_keys=True)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+
+    for name, before, after, unit, change in regressions:
+        print(f"REGRESSION {name}: {before:.3f} -> {after:.3f} {unit} ({change:+.0%})", file=sys.stderr)
+    return 1 if regressions else 0
+
+
+# The scan benchmark spawns worker processes that import this module
+if __name__ == "__main__":
+    sys.exit(main())
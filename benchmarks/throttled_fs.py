@@ -0,0 +1,86 @@
+import io
+import os
+import time
+import threading
+from contextlib import contextmanager
+
+from components import file_io
+
+# Roughly a NAS over Wi-Fi or an SMB share across a VPN
+DEFAULT_LATENCY_MS = 20
+DEFAULT_MBIT_S = 100
+
+
+class Throttle:
+    def __init__(self, latency_ms=DEFAULT_LATENCY_MS, mbit_s=DEFAULT_MBIT_S):
+        self.latency = latency_ms / 1000
+        self.bandwidth = mbit_s * 1e6 / 8
+        self.lock = threading.Lock()
+        self.calls = 0
+        self.bytes = 0
+
+    def pay(self, size):
+        # Every read is a round trip plus the transfer time for what it asked for
+        with self.lock:
+            self.calls += 1
+            self.bytes += size
+        time.sleep(self.latency + size / self.bandwidth)
+
+    def reset(self):
+        with self.lock:
+            self.calls = 0
+            self.bytes = 0
+
+
+class ThrottledRaw(io.RawIOBase):
+    # A plain open() on the slow mount: wrapped in a BufferedReader this is what
+    # mutagen or the media backend get when they are handed a path
+    def __init__(self, file_name, throttle):
+        super().__init__()
+        self.name = file_name
+        self.throttle = throttle
+        self.f = open(file_name, "rb", buffering=0)
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        return self.f.seek(offset, whence)
+
+    def tell(self):
+        return self.f.tell()
+
+    def readinto(self, buffer):
+        self.throttle.pay(len(buffer))
+        return self.f.readinto(buffer)
+
+    def close(self):
+        self.f.close()
+        super().close()
+
+
+def open_plain(file_name, throttle):
+    return io.BufferedReader(ThrottledRaw(file_name, throttle))
+
+
+@contextmanager
+def throttled_mount(root, latency_ms=DEFAULT_LATENCY_MS, mbit_s=DEFAULT_MBIT_S):
+    # Stands in for a network mount at root: it counts as remote storage and every
+    # os.pread, which is how file_io and ReadAheadDevice read, pays the throttle
+    throttle = Throttle(latency_ms, mbit_s)
+    real_pread = os.pread
+
+    def pread(fd, size, offset):
+        throttle.pay(size)
+        return real_pread(fd, size, offset)
+
+    os.pread = pread
+    file_io.REMOTE_ROOTS.append(root)
+    try:
+        yield throttle
+    finally:
+        os.pread = real_pread
+        file_io.REMOTE_ROOTS.remove(root)
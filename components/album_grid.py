@@ -0,0 +1,180 @@
+import os
+
+from PyQt6.QtCore import Qt, QAbstractListModel, QModelIndex, QObject, QRunnable, QThreadPool, QTimer, QRect, QSize, pyqtSignal
+from PyQt6.QtWidgets import (QWidget, QVBoxLayout, QLabel, QListView, QStyledItemDelegate, QStyle,
+                             QAbstractItemView)
+
+from components.library import Library
+
+ALBUM_ICON_SIZE = 128
+CELL_WIDTH = 150
+CELL_HEIGHT = 180
+PADDING = 6
+THUMBNAIL_FLUSH_MS = 50
+# Scanner updates arrive in batches, the album list is rebuilt once they settle
+RELOAD_DELAY_MS = 2000
+ALBUM_ROLE = Qt.ItemDataRole.UserRole
+
+
+def album_title(album):
+    if album["album"] == "Unknown":
+        return os.path.basename(album["directory"]) or album["directory"]
+    return album["album"]
+
+
+class AlbumSignals(QObject):
+    ready = pyqtSignal(object)
+
+
+class AlbumListTask(QRunnable):
+    def __init__(self, db_path):
+        super().__init__()
+        self.db_path = db_path
+        self.signals = AlbumSignals()
+
+    def run(self):
+        library = Library(self.db_path)
+        try:
+            albums = library.albums()
+        finally:
+            library.close()
+        self.signals.ready.emit(albums)
+
+
+class AlbumGridModel(QAbstractListModel):
+    def __init__(self, thumbnails, parent=None):
+        super().__init__(parent)
+        self.thumbnails = thumbnails
+        self.albums = []
+        self.thumbnails.thumbnailReady.connect(self.thumbnail_ready)
+        self.thumbnail_timer = QTimer(self)
+        self.thumbnail_timer.setSingleShot(True)
+        self.thumbnail_timer.setInterval(THUMBNAIL_FLUSH_MS)
+        self.thumbnail_timer.timeout.connect(self.refresh_thumbnails)
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.albums)
+
+    def data(self, index, role=Qt.ItemDataRole.DisplayRole):
+        if not index.isValid():
+            return None
+        album = self.albums[index.row()]
+        if role == Qt.ItemDataRole.DisplayRole:
+            return album_title(album)
+        if role == Qt.ItemDataRole.DecorationRole:
+            # Only asked for items being painted, so only those are decoded
+            pixmap = self.thumbnails.cover(album["cover_hash"], album["path"], ALBUM_ICON_SIZE)
+            return pixmap if pixmap is not None else self.thumbnails.placeholder(ALBUM_ICON_SIZE)
+        if role == Qt.ItemDataRole.ToolTipRole:
+            return f"{album_title(album)}\n{album['artist']}\n{album['tracks']} tracks"
+        if role == ALBUM_ROLE:
+            return album
+        return None
+
+    def set_albums(self, albums):
+        self.beginResetModel()
+        self.albums = albums
+        self.endResetModel()
+
+    def thumbnail_ready(self, key, size):
+        if size == ALBUM_ICON_SIZE and not self.thumbnail_timer.isActive():
+            self.thumbnail_timer.start()
+
+    def refresh_thumbnails(self):
+        rows = self.rowCount()
+        if rows:
+            self.dataChanged.emit(self.index(0), self.index(rows - 1), [Qt.ItemDataRole.DecorationRole])
+
+
+class AlbumDelegate(QStyledItemDelegate):
+    # Fixed cells painted from cached pixmaps: no layout or decoding while scrolling
+    def paint(self, painter, option, index):
+        painter.save()
+        rect = option.rect
+        selected = option.state & QStyle.StateFlag.State_Selected
+        if selected:
+            painter.fillRect(rect, option.palette.highlight())
+
+        pixmap = index.data(Qt.ItemDataRole.DecorationRole)
+        cover = QRect(rect.x() + (rect.width() - ALBUM_ICON_SIZE) // 2, rect.y() + PADDING, ALBUM_ICON_SIZE, ALBUM_ICON_SIZE)
+        # Covers that are not square are centered in the square
+        painter.drawPixmap(cover.x() + (cover.width() - pixmap.width()) // 2,
+                           cover.y() + (cover.height() - pixmap.height()) // 2, pixmap)
+
+        album = index.data(ALBUM_ROLE)
+        metrics = option.fontMetrics
+        width = rect.width() - 2 * PADDING
+        line = QRect(rect.x() + PADDING, cover.bottom() + PADDING, width, metrics.height())
+        painter.setPen(option.palette.highlightedText().color() if selected else option.palette.text().color())
+        painter.drawText(line, Qt.AlignmentFlag.AlignHCenter,
+                         metrics.elidedText(album_title(album), Qt.TextElideMode.ElideRight, width))
+        if not selected:
+            painter.setPen(option.palette.placeholderText().color())
+        painter.drawText(line.translated(0, metrics.height()), Qt.AlignmentFlag.AlignHCenter,
+                         metrics.elidedText(album["artist"], Qt.TextElideMode.ElideRight, width))
+        painter.restore()
+
+    def sizeHint(self, option, index):
+        return QSize(CELL_WIDTH, CELL_HEIGHT)
+
+
+class AlbumGrid(QWidget):
+    albumActivated = pyqtSignal(str, str)
+
+    def __init__(self, db_path, thumbnails):
+        super().__init__()
+        self.db_path = db_path
+        self.loading = False
+
+        layout = QVBoxLayout()
+        layout.setSpacing(5)
+        layout.setContentsMargins(10, 0, 10, 10)
+
+        self.summaryLabel = QLabel("Loading albums...")
+
+        self.model = AlbumGridModel(thumbnails, self)
+        self.gridView = QListView()
+        self.gridView.setModel(self.model)
+        self.gridView.setItemDelegate(AlbumDelegate(self.gridView))
+        # A wrapping list of uniform cells lays out 10k albums without measuring any of them
+        self.gridView.setViewMode(QListView.ViewMode.ListMode)
+        self.gridView.setFlow(QListView.Flow.LeftToRight)
+        self.gridView.setWrapping(True)
+        self.gridView.setResizeMode(QListView.ResizeMode.Adjust)
+        self.gridView.setUniformItemSizes(True)
+        self.gridView.setGridSize(QSize(CELL_WIDTH, CELL_HEIGHT))
+        self.gridView.setVerticalScrollMode(QAbstractItemView.ScrollMode.ScrollPerPixel)
+        self.gridView.verticalScrollBar().setSingleStep(CELL_HEIGHT // 4)
+        self.gridView.setEditTriggers(QAbstractItemView.EditTrigger.NoEditTriggers)
+        self.gridView.activated.connect(self.activate)
+
+        self.reload_timer = QTimer(self)
+        self.reload_timer.setSingleShot(True)
+        self.reload_timer.setInterval(RELOAD_DELAY_MS)
+        self.reload_timer.timeout.connect(self.reload)
+
+        layout.addWidget(self.summaryLabel)
+        layout.addWidget(self.gridView)
+        self.setLayout(layout)
+        self.reload()
+
+    def reload(self):
+        if self.loading:
+            self.reload_timer.start()
+            return
+        self.loading = True
+        task = AlbumListTask(self.db_path)
+        task.signals.ready.connect(self.albums_ready)
+        QThreadPool.globalInstance().start(task)
+
+    def invalidate(self):
+        self.reload_timer.start()
+
+    def albums_ready(self, albums):
+        self.loading = False
+        self.model.set_albums(albums)
+        self.summaryLabel.setText(f"{len(albums)} albums")
+
+    def activate(self, index):
+        album = index.data(ALBUM_ROLE)
+        self.albumActivated.emit(album["album"], album["directory"])
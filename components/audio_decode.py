@@ -0,0 +1,160 @@
+import wave
+
+import numpy as np
+
+# Frames per chunk on the WAV path, about a second at CD rate
+WAV_CHUNK_FRAMES = 1 << 16
+
+
+# Created in processes that decode without a Qt application of their own, such as pool workers
+decoder_app = None
+
+
+class DecodeCancelled(Exception):
+    pass
+
+
+def iter_pcm(file_name, cancelled=None, channels=1, rate=None, start=0.0, chunk_frames=WAV_CHUNK_FRAMES):
+    # Yields (samples, sample_rate) with float32 samples shaped (frames, channels); channels=None keeps the source layout,
+    # rate resamples to that rate and start skips that many seconds
+    chunks = iter_source(file_name, cancelled, channels, rate, start, chunk_frames)
+    yield from (resample_linear(chunks, rate) if rate is not None else chunks)
+
+
+def iter_source(file_name, cancelled, channels, rate, start, chunk_frames):
+    try:
+        with wave.open(file_name, "rb") as reader:
+            if reader.getsampwidth() in (1, 2, 4):
+                if start:
+                    reader.setpos(min(int(start * reader.getframerate()), reader.getnframes()))
+                yield from iter_wav(reader, cancelled, channels, chunk_frames)
+                return
+    except (wave.Error, EOFError):
+        pass
+    # QAudioDecoder cannot seek, so a start is decoded and thrown away
+    yield from skip_seconds(iter_decoder(file_name, cancelled, channels, rate), start)
+
+
+def skip_seconds(chunks, seconds):
+    skipped = 0.0
+    for samples, rate in chunks:
+        if skipped < seconds:
+            frames = int(round((seconds - skipped) * rate))
+            skipped += min(frames, len(samples)) / rate
+            samples = samples[frames:]
+            if not len(samples):
+                continue
+            skipped = seconds
+        yield samples, rate
+
+
+def resample_linear(chunks, rate):
+    # Linear interpolation across chunk borders, for WAV files and decoders that ignore the requested rate
+    previous = None
+    # Source position of the next output frame, relative to the first frame held
+    position = 0.0
+    for samples, source_rate in chunks:
+        if source_rate == rate:
+            yield samples, rate
+            continue
+        frames = samples if previous is None else np.concatenate((previous, samples))
+        last = len(frames) - 1
+        step = source_rate / rate
+        count = int((last - position) // step) + 1 if last >= position else 0
+        if count:
+            times = position + step * np.arange(count)
+            index = times.astype(np.int64)
+            weight = (times - index).astype(np.float32)[:, None]
+            following = np.minimum(index + 1, last)
+            yield frames[index] * (1 - weight) + frames[following] * weight, rate
+            position = times[-1] + step
+        previous = frames[-1:]
+        position -= last
+
+
+def mix(samples, source_channels, channels):
+    frames = samples.reshape(-1, source_channels)
+    if channels is None or source_channels == channels:
+        return frames
+    if channels == 1:
+        return frames.mean(axis=1, keepdims=True)
+    return np.repeat(frames[:, :1], channels, axis=1) if source_channels == 1 else frames[:, :channels]
+
+
+def iter_wav(reader, cancelled, channels, chunk_frames=WAV_CHUNK_FRAMES):
+    # PCM WAV needs no codec, so it's read directly without bringing up QtMultimedia
+    width = reader.getsampwidth()
+    source_channels = reader.getnchannels()
+    rate = reader.getframerate()
+    while True:
+        if cancelled is not None and cancelled():
+            raise DecodeCancelled()
+        data = reader.readframes(chunk_frames)
+        if not data:
+            return
+        if width == 1:
+            samples = (np.frombuffer(data, np.uint8).astype(np.float32) - 128) / 128
+        elif width == 2:
+            samples = np.frombuffer(data, "<i2").astype(np.float32) / 32768
+        else:
+            samples = np.frombuffer(data, "<i4").astype(np.float32) / 2147483648
+        yield mix(samples, source_channels, channels), rate
+
+
+def iter_decoder(file_name, cancelled, channels, rate=None):
+    global decoder_app
+    from PyQt6.QtCore import QCoreApplication, QEventLoop, QUrl
+    from PyQt6.QtMultimedia import QAudioDecoder, QAudioFormat
+
+    if QCoreApplication.instance() is None:
+        decoder_app = QCoreApplication([])
+
+    # QAudioDecoder delivers buffers through signals, so a local event loop is pumped between chunks
+    decoder = QAudioDecoder()
+    audio_format = QAudioFormat()
+    audio_format.setSampleFormat(QAudioFormat.SampleFormat.Float)
+    if channels is not None:
+        audio_format.setChannelCount(channels)
+    if rate is not None:
+        audio_format.setSampleRate(rate)
+    decoder.setAudioFormat(audio_format)
+    decoder.setSource(QUrl.fromLocalFile(file_name))
+
+    loop = QEventLoop()
+    chunks = []
+    state = {"done": False, "error": None}
+
+    def on_buffer():
+        buffer = decoder.read()
+        if not buffer.isValid():
+            return
+        data = buffer.constData()
+        data.setsize(buffer.byteCount())
+        fmt = buffer.format()
+        samples = np.frombuffer(bytes(data), np.float32)
+        chunks.append((mix(samples, fmt.channelCount(), channels), fmt.sampleRate()))
+
+    def on_finished():
+        state["done"] = True
+
+    def on_error(error):
+        state["done"] = True
+        state["error"] = decoder.errorString()
+
+    decoder.bufferReady.connect(on_buffer)
+    decoder.finished.connect(on_finished)
+    decoder.error.connect(on_error)
+    decoder.start()
+    try:
+        while True:
+            while chunks:
+                yield chunks.pop(0)
+            if state["done"]:
+                break
+            if cancelled is not None and cancelled():
+                raise DecodeCancelled()
+            loop.processEvents(QEventLoop.ProcessEventsFlag.WaitForMoreEvents)
+        if state["error"]:
+            raise OSError(f"could not decode {file_name}: {state['error']}")
+    finally:
+        decoder.stop()
@@ -0,0 +1,69 @@
+import threading
+from collections import OrderedDict
+
+DEFAULT_CACHE_BYTES = 32 * 1024 * 1024
+
+
+def image_bytes(image):
+    return image.sizeInBytes()
+
+
+def pixmap_bytes(pixmap):
+    return pixmap.width() * pixmap.height() * pixmap.depth() // 8
+
+
+class CoverCache:
+    def __init__(self, max_bytes=DEFAULT_CACHE_BYTES, size_of=image_bytes):
+        self.max_bytes = max_bytes
+        # QImage and QPixmap report their memory differently
+        self.size_of = size_of
+        self.current_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.entries = OrderedDict()
+        # Shared between the GUI thread and the metadata workers
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            image = self.entries.get(key)
+            if image is None:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return image
+
+    def put(self, key, image):
+        size = self.size_of(image)
+        if size > self.max_bytes:
+            return
+        with self.lock:
+            old = self.entries.pop(key, None)
+            if old is not None:
+                self.current_bytes -= self.size_of(old)
+            self.entries[key] = image
+            self.current_bytes += size
+            while self.current_bytes > self.max_bytes:
+                _, evicted = self.entries.popitem(last=False)
+                self.current_bytes -= self.size_of(evicted)
+
+    def keys(self):
+        # Least recently used first
+        with self.lock:
+            return list(self.entries)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.current_bytes = 0
+
+    def stats(self):
+        with self.lock:
+            return {
+                "entries": len(self.entries),
+                "bytes": self.current_bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+            }
@@ -0,0 +1,132 @@
+import os
+import threading
+import tempfile
+
+from PyQt6.QtCore import Qt, QStandardPaths
+from PyQt6.QtGui import QImage, QImageReader
+
+COVER_SIZE = 250
+THUMBNAIL_SIZE = 64
+COVER_SIZES = (COVER_SIZE, THUMBNAIL_SIZE)
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+# Eviction trims below the cap so it doesn't run again on the very next write
+EVICT_TARGET = 0.9
+
+
+def default_cover_dir():
+    cache_dir = QStandardPaths.writableLocation(QStandardPaths.StandardLocation.CacheLocation)
+    return os.path.join(cache_dir, "covers")
+
+
+def scale_cover(image, size):
+    return image.scaled(size, size, Qt.AspectRatioMode.KeepAspectRatio, Qt.TransformationMode.SmoothTransformation)
+
+
+def read_scaled(reader, size=None):
+    # JPEG decodes straight at a fraction of its size, far cheaper than decoding it whole and scaling after
+    original = reader.size()
+    if size is not None and original.isValid() and (original.width() > size or original.height() > size):
+        reader.setScaledSize(original.scaled(size, size, Qt.AspectRatioMode.KeepAspectRatio))
+    image = reader.read()
+    return None if image.isNull() else image
+
+
+class CoverStore:
+    def __init__(self, directory=None, max_bytes=DEFAULT_MAX_BYTES):
+        self.directory = directory or default_cover_dir()
+        self.max_bytes = max_bytes
+        self.total_bytes = 0
+        self.lock = threading.Lock()
+        os.makedirs(self.directory, exist_ok=True)
+
+    def path(self, cover_hash, size):
+        return os.path.join(self.directory, cover_hash[:2], f"{cover_hash}-{size}.jpg")
+
+    def load(self, cover_hash, size=COVER_SIZE, scaled_to=None):
+        path = self.path(cover_hash, size)
+        image = read_scaled(QImageReader(path), scaled_to)
+        if image is None:
+            return None
+        # Stamp the access so eviction drops the least recently shown covers first
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        return image
+
+    def store(self, cover_hash, data):
+        # Decodes the embedded cover once and writes every thumbnail size
+        source = QImage.fromData(data)
+        if source.isNull():
+            return {}
+        images = {}
+        written = 0
+        for size in COVER_SIZES:
+            image = scale_cover(source, size)
+            written += self.write_atomic(self.path(cover_hash, size), image)
+            images[size] = image
+
+        with self.lock:
+            self.total_bytes += written
+            over_cap = self.total_bytes > self.max_bytes
+        if over_cap:
+            self.evict()
+        return images
+
+    def write_atomic(self, path, image):
+        directory = os.path.dirname(path)
+        os.makedirs(directory, exist_ok=True)
+        fd, temp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+        os.close(fd)
+        try:
+            if not image.save(temp_path, "JPG", 90):
+                raise OSError(f"could not encode {path}")
+            size = os.path.getsize(temp_path)
+            os.replace(temp_path, path)
+        except OSError:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            return 0
+        return size
+
+    def entries(self):
+        for directory, _, files in os.walk(self.directory):
+            for name in files:
+                path = os.path.join(directory, name)
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue
+                yield path, name, st
+
+    def sweep(self):
+        # Startup pass: drop half-written files from a crash, recount and enforce the cap
+        total = 0
+        for path, name, st in self.entries():
+            if name.endswith(".tmp"):
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+                continue
+            total += st.st_size
+        with self.lock:
+            self.total_bytes = total
+        if total > self.max_bytes:
+            self.evict()
+
+    def evict(self):
+        with self.lock:
+            files = sorted(
+                ((st.st_mtime, st.st_size, path) for path, name, st in self.entries() if not name.endswith(".tmp")))
+            total = sum(size for _, size, _ in files)
+            target = self.max_bytes * EVICT_TARGET
+            for _, size, path in files:
+                if total <= target:
+                    break
+                try:
+                    os.remove(path)
+                except OSError:
+                    continue
+                total -= size
+            self.total_bytes = total
@@ -0,0 +1,83 @@
+from PyQt6.QtCore import Qt, QTimer
+from PyQt6.QtGui import QGuiApplication
+from PyQt6.QtWidgets import (QDialog, QVBoxLayout, QHBoxLayout, QPushButton, QTableWidget, QTableWidgetItem,
+                             QHeaderView, QFileDialog)
+
+from components.instrumentation import metrics
+
+REFRESH_INTERVAL_MS = 1000
+COLUMNS = ("Metric", "Count", "Mean ms", "Min ms", "Max ms", "Last ms")
+
+
+def format_ms(value):
+    return "" if value is None else f"{value:.2f}"
+
+
+class DiagnosticsDialog(QDialog):
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.setWindowTitle("Diagnostics")
+        self.resize(620, 420)
+
+        layout = QVBoxLayout()
+        self.table = QTableWidget(0, len(COLUMNS))
+        self.table.setHorizontalHeaderLabels(COLUMNS)
+        self.table.verticalHeader().setVisible(False)
+        self.table.setEditTriggers(QTableWidget.EditTrigger.NoEditTriggers)
+        self.table.horizontalHeader().setSectionResizeMode(0, QHeaderView.ResizeMode.Stretch)
+        layout.addWidget(self.table)
+
+        buttons = QHBoxLayout()
+        button_reset = QPushButton("Reset")
+        button_reset.clicked.connect(self.reset)
+        button_copy = QPushButton("Copy JSON")
+        button_copy.clicked.connect(lambda: QGuiApplication.clipboard().setText(metrics.to_json()))
+        button_save = QPushButton("Save...")
+        button_save.clicked.connect(self.save)
+        buttons.addWidget(button_reset)
+        buttons.addStretch(1)
+        buttons.addWidget(button_copy)
+        buttons.addWidget(button_save)
+        layout.addLayout(buttons)
+        self.setLayout(layout)
+
+        # Only refreshes while the dialog is open
+        self.timer = QTimer(self)
+        self.timer.setInterval(REFRESH_INTERVAL_MS)
+        self.timer.timeout.connect(self.refresh)
+        self.refresh()
+
+    def showEvent(self, event):
+        self.refresh()
+        self.timer.start()
+        super().showEvent(event)
+
+    def hideEvent(self, event):
+        self.timer.stop()
+        super().hideEvent(event)
+
+    def refresh(self):
+        snapshot = metrics.snapshot()
+        rows = [(name, str(value), "", "", "", "") for name, value in sorted(snapshot["counters"].items())]
+        rows += [(name, f"{value:g}", "", "", "", "") for name, value in sorted(snapshot["gauges"].items())]
+        for name, timing in sorted(snapshot["timings"].items()):
+            rows.append((name, str(timing["count"]), format_ms(timing["mean_ms"]), format_ms(timing["min_ms"]),
+                         format_ms(timing["max_ms"]), format_ms(timing["last_ms"])))
+
+        self.table.setRowCount(len(rows))
+        for row, values in enumerate(rows):
+            for column, value in enumerate(values):
+                item = QTableWidgetItem(value)
+                if column:
+                    item.setTextAlignment(Qt.AlignmentFlag.AlignRight | Qt.AlignmentFlag.AlignVCenter)
+                self.table.setItem(row, column, item)
+
+    def reset(self):
+        metrics.reset()
+        self.refresh()
+
+    def save(self):
+        path, _ = QFileDialog.getSaveFileName(self, "Save Metrics", "metrics.json",
+                                              "JSON (*.json);;Prometheus text (*.prom)")
+        if path:
+            metrics.dump(path)
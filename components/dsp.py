@@ -0,0 +1,317 @@
+import math
+import logging
+
+import numpy as np
+
+from components.audio_decode import iter_pcm
+from components.metadata import read_tags
+from components.instrumentation import metrics
+
+logger = logging.getLogger(__name__)
+
+OUTPUT_CHANNELS = 2
+# Frames rendered at a time, about 21 ms at 48 kHz
+BLOCK_FRAMES = 1024
+# Biquads filter sub-blocks this long as one matrix product; only the filter state is carried from one to the next
+SUB_BLOCK = 128
+BAND_TYPES = ("peak", "lowshelf", "highshelf")
+# WAV files are read in pieces this small, so no single block pays for decoding a large chunk
+DECODE_CHUNK_FRAMES = 8192
+
+
+class RingBuffer:
+    # One producer and one consumer: only the render thread moves write_pos and discard_pos, only the
+    # output moves read_pos, so neither side ever takes a lock
+    def __init__(self, frames, channels=OUTPUT_CHANNELS):
+        self.size = frames
+        self.data = np.zeros((frames, channels), np.float32)
+        self.write_pos = 0
+        self.read_pos = 0
+        # Frames before this were rendered for a track that is no longer wanted, the reader skips them
+        self.discard_pos = 0
+        # The load the frames after discard_pos belong to; set by the render thread after discard_pos
+        self.generation = 0
+
+    def available(self):
+        return max(self.write_pos - max(self.read_pos, self.discard_pos), 0)
+
+    def free(self):
+        # Discarded frames are free as soon as discard_pos moves; the reader only reads once it has seen the
+        # generation published after it, and then starts past them
+        return self.size - (self.write_pos - max(self.read_pos, self.discard_pos))
+
+    def write(self, frames):
+        count = min(len(frames), self.free())
+        start = self.write_pos % self.size
+        first = min(count, self.size - start)
+        self.data[start:start + first] = frames[:first]
+        self.data[:count - first] = frames[first:count]
+        # Published only after the samples are in place
+        self.write_pos += count
+        return count
+
+    def read(self, frames):
+        if self.read_pos < self.discard_pos:
+            self.read_pos = min(self.discard_pos, self.write_pos)
+        count = min(frames, self.write_pos - self.read_pos)
+        start = self.read_pos % self.size
+        first = min(count, self.size - start)
+        out = np.concatenate((self.data[start:start + first], self.data[:count - first]))
+        self.read_pos += count
+        return out
+
+
+def parse_bands(text):
+    # "peak:1000:3:1.4, lowshelf:100:4:0.7" -> [("peak", 1000.0, 3.0, 1.4), ...], as type:Hz:dB:Q
+    bands = []
+    for spec in filter(None, (part.strip() for part in str(text or "").replace(";", ",").split(","))):
+        kind, *values = spec.split(":")
+        if kind not in BAND_TYPES or len(values) != 3:
+            raise ValueError(f"bad equalizer band: {spec}")
+        freq, gain, q = (float(value) for value in values)
+        if freq <= 0 or q <= 0:
+            raise ValueError(f"bad equalizer band: {spec}")
+        bands.append((kind, freq, gain, q))
+    return bands
+
+
+def band_coefficients(kind, freq, gain_db, q, rate):
+    # Audio EQ cookbook (R. Bristow-Johnson), normalized so a[0] == 1
+    a = 10 ** (gain_db / 40)
+    w0 = 2 * math.pi * min(freq, rate * 0.49) / rate
+    cos = math.cos(w0)
+    alpha = math.sin(w0) / (2 * q)
+    if kind == "peak":
+        b = (1 + alpha * a, -2 * cos, 1 - alpha * a)
+        den = (1 + alpha / a, -2 * cos, 1 - alpha / a)
+    else:
+        root = 2 * math.sqrt(a) * alpha
+        sign = 1 if kind == "lowshelf" else -1
+        b = (a * ((a + 1) - sign * (a - 1) * cos + root),
+             sign * 2 * a * ((a - 1) - sign * (a + 1) * cos),
+             a * ((a + 1) - sign * (a - 1) * cos - root))
+        den = ((a + 1) + sign * (a - 1) * cos + root,
+               -sign * 2 * ((a - 1) + sign * (a + 1) * cos),
+               (a + 1) + sign * (a - 1) * cos - root)
+    return tuple(value / den[0] for value in b), tuple(value / den[0] for value in den)
+
+
+class Biquad:
+    def __init__(self, b, a, channels=OUTPUT_CHANNELS, sub_block=SUB_BLOCK):
+        self.b = b
+        self.a = a
+        self.sub_block = sub_block
+        # Response of the recursive part to an impulse, and to each of the two previous outputs
+        response = np.zeros((sub_block + 2, 3))
+        response[1, 1] = response[0, 2] = 1.0
+        response[2, 0] = 1.0
+        for n in range(2, sub_block + 2):
+            response[n] -= a[1] * response[n - 1] + a[2] * response[n - 2]
+        impulse = response[2:, 0]
+        index = np.arange(sub_block)
+        lag = index[:, None] - index[None, :]
+        self.impulse = np.where(lag >= 0, impulse[np.maximum(lag, 0)], 0.0)
+        self.carry = response[2:, 1:]
+        # The carry's last two rows move the state over a whole sub-block, newest output first
+        self.step = self.carry[[-1, -2]]
+        self.inputs = np.zeros((2, channels))
+        self.outputs = np.zeros((2, channels))
+
+    def process(self, block):
+        frames, channels = block.shape
+        count = frames // self.sub_block
+        extended = np.concatenate((self.inputs, block))
+        self.inputs = extended[-2:]
+        feed = self.b[0] * extended[2:] + self.b[1] * extended[1:-1] + self.b[2] * extended[:-2]
+
+        # Zero-state response of every sub-block in one product, (sub_block, count * channels)
+        stacked = feed.reshape(count, self.sub_block, channels).transpose(1, 0, 2).reshape(self.sub_block, -1)
+        zero_state = (self.impulse @ stacked).reshape(self.sub_block, count, channels)
+        states = np.empty((count, 2, channels))
+        ends = zero_state[[-1, -2]].transpose(1, 0, 2)
+        state = self.outputs
+        for k in range(count):
+            states[k] = state
+            state = ends[k] + self.step @ state
+        self.outputs = state
+        zero_state += (self.carry @ states.transpose(1, 0, 2).reshape(2, -1)).reshape(self.sub_block, count, channels)
+        return zero_state.transpose(1, 0, 2).reshape(frames, channels)
+
+
+class Equalizer:
+    # Parametric bands as a cascade of biquads, run over whole blocks
+    def __init__(self, bands, rate, channels=OUTPUT_CHANNELS):
+        self.bands = list(bands)
+        self.filters = [Biquad(*band_coefficients(kind, freq, gain, q, rate), channels)
+                        for kind, freq, gain, q in self.bands if gain]
+
+    def process(self, block):
+        if not self.filters:
+            return block
+        out = block.astype(np.float64)
+        for band in self.filters:
+            out = band.process(out)
+        return out.astype(np.float32)
+
+
+def track_duration(path):
+    try:
+        duration = read_tags(path)["duration"]
+    except Exception as e:
+        logger.debug("No duration for %s: %s", path, e)
+        return None
+    return int(duration * 1000) if duration else None
+
+
+class TrackSource:
+    # One track decoded to the output format, handed out in blocks
+    def __init__(self, path, rate, channels=OUTPUT_CHANNELS, position=0, gain=1.0, cancelled=None):
+        self.path = path
+        self.rate = rate
+        self.channels = channels
+        self.gain = gain
+        self.duration = track_duration(path)
+        self.frames = int(position * rate / 1000)
+        self.chunks = iter_pcm(path, cancelled, channels, rate, position / 1000, DECODE_CHUNK_FRAMES)
+        self.chunk = None
+        self.offset = 0
+        self.finished = False
+
+    def remaining(self):
+        if self.duration is None:
+            return None
+        return max(self.duration * self.rate // 1000 - self.frames, 0)
+
+    def read(self, frames):
+        parts = []
+        wanted = frames
+        while wanted and not self.finished:
+            if self.chunk is None or self.offset >= len(self.chunk):
+                try:
+                    self.chunk, _ = next(self.chunks)
+                except StopIteration:
+                    self.finished = True
+                    break
+                except OSError as e:
+                    metrics.count("dsp.decode_errors")
+                    logger.warning("Could not decode %s: %s", self.path, e)
+                    self.finished = True
+                    break
+                self.offset = 0
+            part = self.chunk[self.offset:self.offset + wanted]
+            self.offset += len(part)
+            wanted -= len(part)
+            parts.append(part)
+        self.frames += frames - wanted
+        out = np.concatenate(parts) if parts else np.zeros((0, self.channels), np.float32)
+        return out * self.gain if self.gain != 1.0 else out
+
+    def close(self):
+        self.chunks.close()
+        self.finished = True
+
+
+def pad(block, frames):
+    if len(block) >= frames:
+        return block
+    return np.concatenate((block, np.zeros((frames - len(block), block.shape[1]), np.float32)))
+
+
+class Renderer:
+    # Turns the current track, the one fading out and the equalizer into fixed blocks; runs on the render thread
+    def __init__(self, rate, channels=OUTPUT_CHANNELS, block_frames=BLOCK_FRAMES, crossfade_ms=0, bands=(),
+                 cancelled=None):
+        self.rate = rate
+        self.channels = channels
+        self.block_frames = block_frames
+        self.crossfade_frames = int(crossfade_ms * rate / 1000)
+        self.equalizer = Equalizer(bands, rate, channels)
+        self.cancelled = cancelled
+        self.current = None
+        self.fading = None
+        self.fade_position = 0
+        self.fade_frames = 0
+        # What follows the current track, only taken while that track is still the one named in set_next
+        self.next_path = None
+        self.next_gain = 1.0
+
+    def open(self, path, position=0, gain=1.0):
+        return TrackSource(path, self.rate, self.channels, position, gain, self.cancelled)
+
+    def load(self, path, position=0, gain=1.0):
+        self.stop()
+        self.current = self.open(path, position, gain)
+        return ("load", path, position, self.current.duration)
+
+    def stop(self):
+        for source in (self.current, self.fading):
+            if source is not None:
+                source.close()
+        self.current = self.fading = None
+        self.next_path = None
+
+    def set_next(self, after, path, gain=1.0):
+        if self.current is not None and self.current.path == after:
+            self.next_path = path
+            self.next_gain = gain
+
+    def set_gain(self, path, gain):
+        for source in (self.current, self.fading):
+            if source is not None and source.path == path:
+                source.gain = gain
+        if self.next_path == path:
+            self.next_gain = gain
+
+    def set_crossfade(self, crossfade_ms):
+        self.crossfade_frames = int(crossfade_ms * self.rate / 1000)
+
+    def set_equalizer(self, bands):
+        self.equalizer = Equalizer(bands, self.rate, self.channels)
+
+    def start_next(self, events, offset, fade):
+        if self.fading is not None:
+            self.fading.close()
+        self.fading = self.current if fade else None
+        if not fade:
+            self.current.close()
+        self.current = self.open(self.next_path, 0, self.next_gain)
+        self.next_path = None
+        events.append((offset, "next", self.current.path, 0, self.current.duration))
+
+    def render(self):
+        # A block and what happened in it as (frame offset, kind, path, position ms, duration ms); None when idle
+        if self.current is None:
+            return None
+        frames = self.block_frames
+        events = []
+        if self.fading is None and self.crossfade_frames and self.next_path is not None:
+            remaining = self.current.remaining()
+            if remaining is not None and remaining <= self.crossfade_frames:
+                self.fade_position = 0
+                self.fade_frames = max(remaining, frames)
+                self.start_next(events, 0, True)
+                metrics.count("dsp.crossfades")
+
+        block = self.current.read(frames)
+        if len(block) < frames and self.current.finished:
+            # Gapless: the next track goes on in the same block
+            if self.next_path is not None:
+                offset = len(block)
+                self.start_next(events, offset, False)
+                block = np.concatenate((block, self.current.read(frames - offset)))
+            elif self.fading is None:
+                events.append((len(block), "end", self.current.path, 0, self.current.duration))
+                self.current.close()
+                self.current = None
+        block = pad(block, frames)
+
+        if self.fading is not None:
+            # Equal power, so the loudness holds through the middle of the fade
+            phase = np.minimum((self.fade_position + np.arange(frames)) / self.fade_frames, 1.0)[:, None] * (math.pi / 2)
+            block = block * np.sin(phase) + pad(self.fading.read(frames), frames) * np.cos(phase)
+            self.fade_position += frames
+            if self.fade_position >= self.fade_frames:
+                self.fading.close()
+                self.fading = None
+        block = self.equalizer.process(block)
+        return np.clip(block, -1.0, 1.0, out=block).astype(np.float32, copy=False), events
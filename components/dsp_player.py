@@ -0,0 +1,473 @@
+import enum
+import time
+import logging
+import threading
+from queue import SimpleQueue, Empty
+from collections import deque
+
+import numpy as np
+from PyQt6.QtCore import QObject, QThread, QTimer, QIODevice, pyqtSignal
+
+from components.audio_decode import DecodeCancelled
+from components.dsp import RingBuffer, Renderer, OUTPUT_CHANNELS, BLOCK_FRAMES
+from components.instrumentation import metrics
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_RATE = 48000
+# Rendered audio waiting for the output; rounded up to whole blocks
+DEFAULT_BUFFER_MS = 100
+# What the sink itself holds on top of that
+OUTPUT_BUFFER_MS = 40
+POLL_MS = 50
+# Blocks between updates of the render load gauge
+LOAD_WINDOW = 50
+
+
+class PlaybackState(enum.Enum):
+    # Named like QMediaPlayer's, see player_engine.state_name
+    StoppedState = 0
+    PlayingState = 1
+    PausedState = 2
+
+
+class RenderThread(QThread):
+    # Decodes, mixes and filters ahead of the output into the ring; the GUI thread talks to it through commands
+    def __init__(self, renderer, ring, parent=None):
+        super().__init__(parent)
+        self.renderer = renderer
+        self.ring = ring
+        self.renderer.cancelled = self.is_interrupted
+        self.commands = SimpleQueue()
+        # (ring position, generation, kind, path, position ms, duration ms), read by the output once played
+        self.markers = deque()
+        self.generation = 0
+        # (ring position, generation) where the last track ended, so the output can tell drained from starved
+        self.end = None
+        self.wake = threading.Event()
+        self.interrupt = False
+        self.closing = False
+
+    def send(self, *command):
+        # Loads and stops abandon a decode that is still skipping to a position
+        if command[0] in ("load", "stop"):
+            self.interrupt = True
+        self.commands.put(command)
+        self.wake.set()
+
+    def close(self):
+        self.closing = True
+        self.wake.set()
+        self.wait()
+
+    def is_interrupted(self):
+        return self.interrupt or self.closing
+
+    def run(self):
+        try:
+            self.render_loop()
+        finally:
+            # Decoders belong to this thread and are stopped on it
+            self.renderer.stop()
+
+    def render_loop(self):
+        block_seconds = self.renderer.block_frames / self.renderer.rate
+        rendered = busy = 0.0
+        while not self.closing:
+            self.wake.clear()
+            self.handle_commands()
+            if self.renderer.current is None or self.ring.free() < self.renderer.block_frames:
+                # Woken early by the output taking frames and by commands
+                self.wake.wait(block_seconds)
+                continue
+            started = time.perf_counter()
+            try:
+                result = self.renderer.render()
+            except DecodeCancelled:
+                continue
+            elapsed = time.perf_counter() - started
+            metrics.observe("dsp.render_block", elapsed * 1000)
+            if result is None:
+                continue
+            block, events = result
+            for offset, *event in events:
+                self.markers.append((self.ring.write_pos + offset, self.generation, *event))
+                if event[0] == "end":
+                    self.end = (self.ring.write_pos + offset, self.generation)
+            self.ring.write(block)
+            rendered += block_seconds
+            busy += elapsed
+            if rendered >= LOAD_WINDOW * block_seconds:
+                # Share of real time spent rendering; above 1 no buffer is large enough
+                metrics.gauge("dsp.render_load", busy / rendered)
+                rendered = busy = 0.0
+
+    def discard(self, generation):
+        # Everything rendered so far is stale; the output plays silence until it sees the new generation
+        self.ring.discard_pos = self.ring.write_pos
+        self.ring.generation = self.generation = generation
+        self.end = None
+
+    def handle_commands(self):
+        self.interrupt = False
+        while True:
+            try:
+                kind, *args = self.commands.get_nowait()
+            except Empty:
+                return
+            if kind == "load":
+                generation, path, position, gain = args
+                self.discard(generation)
+                try:
+                    event = self.renderer.load(path, position, gain)
+                except OSError as e:
+                    logger.warning("Could not open %s: %s", path, e)
+                    event = ("end", path, position, None)
+                self.markers.append((self.ring.write_pos, self.generation, *event))
+            elif kind == "stop":
+                self.renderer.stop()
+                self.discard(*args)
+            elif kind == "next":
+                self.renderer.set_next(*args)
+            elif kind == "gain":
+                self.renderer.set_gain(*args)
+            elif kind == "crossfade":
+                self.renderer.set_crossfade(*args)
+            elif kind == "equalizer":
+                self.renderer.set_equalizer(*args)
+
+
+class RingDevice(QIODevice):
+    # Pulled by QAudioSink; only copies out of the ring, the work happened on the render thread
+    def __init__(self, player):
+        super().__init__(player)
+        self.player = player
+
+    def isSequential(self):
+        return True
+
+    def bytesAvailable(self):
+        return self.player.ring.available() * self.player.frame_bytes + super().bytesAvailable()
+
+    def readData(self, maxlen):
+        return self.player.pull(maxlen)
+
+    def writeData(self, data):
+        return -1
+
+
+class DspPlayer(QObject):
+    # Same interface as GaplessPlayer, but decodes to PCM itself so it can crossfade and equalize
+    positionChanged = pyqtSignal(int)
+    durationChanged = pyqtSignal(int)
+    playbackStateChanged = pyqtSignal(object)
+    trackChanged = pyqtSignal(str)
+    # Never emitted: transitions are sample accurate, there is no gap to measure
+    transitionMeasured = pyqtSignal(float)
+
+    def __init__(self, queue, parent=None, buffer_ms=DEFAULT_BUFFER_MS, crossfade_ms=0, bands=()):
+        super().__init__(parent)
+        self.queue = queue
+        self.buffer_ms = buffer_ms
+        self.crossfade_ms = crossfade_ms
+        self.bands = list(bands)
+        self.volume = 1.0
+        self.muted = False
+        self.gain_provider = None
+        # Kept for the engine; the decoder always reads the file itself
+        self.read_ahead = "auto"
+        self.state = PlaybackState.StoppedState
+
+        # Created on first playback, see ensure_output
+        self.sink = None
+        self.device = None
+        self.ring = None
+        self.thread = None
+        self.rate = DEFAULT_RATE
+        self.float_output = True
+        self.frame_bytes = OUTPUT_CHANNELS * 4
+
+        self.path = None
+        self.generation = 0
+        # (ring position, path, position ms, duration ms) of the marker last played
+        self.audible = None
+        self.start_position = 0
+        self.current_duration = 0
+        # Underruns only count once the track has started and until it ended
+        self.expect_audio = False
+
+        self.timer = QTimer(self)
+        self.timer.setInterval(POLL_MS)
+        self.timer.timeout.connect(self.poll)
+        self.queue.changed.connect(self.send_next)
+
+    def ensure_output(self):
+        if self.sink is not None:
+            return
+        # QtMultimedia brings up its audio backend on import, so that waits until something is played
+        from PyQt6.QtMultimedia import QAudioFormat, QAudioSink, QMediaDevices
+
+        output = QMediaDevices.defaultAudioOutput()
+        audio_format = QAudioFormat()
+        audio_format.setChannelCount(OUTPUT_CHANNELS)
+        audio_format.setSampleRate(output.preferredFormat().sampleRate() or DEFAULT_RATE)
+        audio_format.setSampleFormat(QAudioFormat.SampleFormat.Float)
+        if not output.isFormatSupported(audio_format):
+            audio_format.setSampleFormat(QAudioFormat.SampleFormat.Int16)
+        self.rate = audio_format.sampleRate()
+        self.float_output = audio_format.sampleFormat() == QAudioFormat.SampleFormat.Float
+        self.frame_bytes = audio_format.bytesPerFrame()
+
+        blocks = max(-(-self.buffer_ms * self.rate // (1000 * BLOCK_FRAMES)), 2)
+        self.ring = RingBuffer(blocks * BLOCK_FRAMES)
+        renderer = Renderer(self.rate, crossfade_ms=self.crossfade_ms, bands=self.bands)
+        self.thread = RenderThread(renderer, self.ring, self)
+        self.thread.start(QThread.Priority.TimeCriticalPriority)
+
+        self.device = RingDevice(self)
+        self.device.open(QIODevice.OpenModeFlag.ReadOnly)
+        self.sink = QAudioSink(output, audio_format, self)
+        self.sink.setBufferSize(self.rate * OUTPUT_BUFFER_MS // 1000 * self.frame_bytes)
+        self.apply_volume()
+        logger.info("DSP output at %d Hz, %d frames of buffer", self.rate, self.ring.size)
+
+    def close(self):
+        if self.sink is not None:
+            self.sink.stop()
+        if self.thread is not None:
+            self.thread.close()
+
+    # The output side, on the GUI thread
+
+    def pull(self, size):
+        frames = size // self.frame_bytes
+        # Until the render thread took the last load or stop, the ring only holds what they replace
+        if self.ring.generation == self.generation:
+            samples = self.ring.read(frames)
+        else:
+            samples = np.zeros((0, OUTPUT_CHANNELS), np.float32)
+        self.thread.wake.set()
+        if len(samples):
+            self.expect_audio = True
+        if len(samples) < frames:
+            if self.expect_audio and self.state == PlaybackState.PlayingState and not self.drained():
+                metrics.count("dsp.underruns")
+                metrics.count("dsp.underrun_ms", (frames - len(samples)) * 1000 // self.rate)
+            samples = np.concatenate((samples, np.zeros((frames - len(samples), OUTPUT_CHANNELS), np.float32)))
+        if not self.float_output:
+            samples = (samples * 32767).astype("<i2")
+        return samples.tobytes()
+
+    def drained(self):
+        # The ring ran dry because the last track ended, not because rendering fell behind
+        end = self.thread.end
+        return end is not None and end[1] == self.generation and end[0] <= self.ring.read_pos
+
+    def buffered_frames(self):
+        # Taken from the ring but not played yet
+        from PyQt6.QtMultimedia import QAudio
+
+        if self.sink is None or self.sink.state() == QAudio.State.StoppedState:
+            return 0
+        return max(self.sink.bufferSize() - self.sink.bytesFree(), 0) // self.frame_bytes
+
+    def played_frames(self):
+        return max(self.ring.read_pos - self.buffered_frames(), 0)
+
+    def poll(self):
+        played = self.played_frames()
+        markers = self.thread.markers
+        # A load starts where the stale frames end, so it applies at once, even while paused
+        while markers and (markers[0][0] <= played or markers[0][1] != self.generation or markers[0][2] == "load"):
+            position, generation, kind, path, start, duration = markers.popleft()
+            if generation != self.generation:
+                continue
+            self.audible = (position, path, start, duration)
+            self.current_duration = duration or 0
+            self.durationChanged.emit(self.current_duration)
+            if kind == "next":
+                self.path = path
+                if self.queue.peek() == path:
+                    self.queue.advance()
+                    self.send_next()
+                    self.trackChanged.emit(path)
+                elif self.queue.advance():
+                    # The queue was edited while the track was already mixed in
+                    self.play_current()
+                    return
+            elif kind == "end":
+                self.expect_audio = False
+                self.finish()
+                return
+        if self.state != PlaybackState.PlayingState:
+            if self.audible is not None:
+                self.timer.stop()
+            return
+        self.positionChanged.emit(self.position())
+        buffered = self.ring.available() + self.buffered_frames()
+        metrics.gauge("dsp.buffer_ms", self.ring.available() * 1000 / self.rate)
+        metrics.gauge("dsp.latency_ms", buffered * 1000 / self.rate)
+
+    def finish(self):
+        self.timer.stop()
+        self.sink.stop()
+        self.set_state(PlaybackState.StoppedState)
+
+    def set_state(self, state):
+        if state != self.state:
+            self.state = state
+            self.playbackStateChanged.emit(state)
+
+    def start_output(self):
+        from PyQt6.QtMultimedia import QAudio
+
+        if self.sink.state() == QAudio.State.SuspendedState:
+            self.sink.resume()
+        elif self.sink.state() == QAudio.State.StoppedState:
+            self.sink.start(self.device)
+        self.timer.start()
+        self.set_state(PlaybackState.PlayingState)
+
+    def open_track(self, path, position=0):
+        self.generation += 1
+        self.path = path
+        self.audible = None
+        self.start_position = position
+        self.expect_audio = False
+        self.thread.send("load", self.generation, path, position, self.gain(path))
+        self.send_next()
+
+    # QMediaPlayer-like interface
+
+    def play(self):
+        if self.path is None:
+            self.play_current()
+            return
+        if self.state == PlaybackState.StoppedState:
+            self.open_track(self.path)
+        self.start_output()
+
+    def pause(self):
+        if self.sink is None or self.state != PlaybackState.PlayingState:
+            return
+        self.sink.suspend()
+        self.timer.stop()
+        self.set_state(PlaybackState.PausedState)
+
+    def stop(self):
+        if self.sink is None:
+            return
+        self.sink.stop()
+        self.timer.stop()
+        self.generation += 1
+        self.thread.send("stop", self.generation)
+        self.audible = None
+        self.start_position = 0
+        self.set_state(PlaybackState.StoppedState)
+        self.positionChanged.emit(0)
+
+    def setPosition(self, position):
+        if self.path is None or self.state == PlaybackState.StoppedState:
+            return
+        if self.state == PlaybackState.PausedState and self.sink is not None:
+            # What the suspended sink still holds belongs to the old position; play starts it again
+            self.sink.stop()
+        self.open_track(self.path, position)
+
+    def position(self):
+        if self.audible is None:
+            return self.start_position
+        ring_position, _, start, _ = self.audible
+        return start + max(self.played_frames() - ring_position, 0) * 1000 // self.rate
+
+    def duration(self):
+        return self.current_duration
+
+    def playbackState(self):
+        return self.state
+
+    def is_playing(self):
+        return self.state == PlaybackState.PlayingState
+
+    def setVolume(self, volume):
+        self.volume = volume
+        self.apply_volume()
+
+    def isMuted(self):
+        return self.muted
+
+    def setMuted(self, muted):
+        self.muted = muted
+        self.apply_volume()
+
+    def apply_volume(self):
+        if self.sink is not None:
+            self.sink.setVolume(0.0 if self.muted else self.volume)
+
+    # Processing
+
+    def set_crossfade(self, crossfade_ms):
+        self.crossfade_ms = crossfade_ms
+        if self.thread is not None:
+            self.thread.send("crossfade", crossfade_ms)
+
+    def set_equalizer(self, bands):
+        self.bands = list(bands)
+        if self.thread is not None:
+            self.thread.send("equalizer", self.bands)
+
+    # Volume normalization, applied to the samples
+
+    def set_gain_provider(self, provider):
+        self.gain_provider = provider
+        self.refresh_gains()
+
+    def gain(self, path):
+        return self.gain_provider(path) if self.gain_provider is not None and path else 1.0
+
+    def refresh_gains(self, paths=None):
+        if self.thread is None:
+            return
+        for path in (self.path, self.queue.peek()):
+            if path is not None and (paths is None or path in paths):
+                self.thread.send("gain", path, self.gain(path))
+
+    # Queue handling
+
+    def play_current(self):
+        path = self.queue.current()
+        if path is None:
+            return
+        self.ensure_output()
+        self.open_track(path)
+        self.start_output()
+        self.trackChanged.emit(path)
+
+    def load_current(self, position=0):
+        # Renders the start into the ring while paused, so play has samples right away
+        path = self.queue.current()
+        if path is None:
+            return
+        self.ensure_output()
+        self.open_track(path, position)
+        self.set_state(PlaybackState.PausedState)
+        # Only until the render thread has opened the track and knows its duration
+        self.timer.start()
+        self.trackChanged.emit(path)
+
+    def next(self):
+        if self.queue.advance():
+            self.play_current()
+
+    def previous(self):
+        if self.queue.back():
+            self.play_current()
+
+    def arm_next(self):
+        # The renderer opens the next track when it gets there, it only has to know which one
+        self.send_next()
+
+    def send_next(self):
+        if self.thread is not None and self.path is not None:
+            next_path = self.queue.peek()
+            self.thread.send("next", self.path, next_path, self.gain(next_path))
@@ -0,0 +1,66 @@
+import os
+
+from PyQt6.QtCore import Qt, pyqtSignal
+from PyQt6.QtWidgets import QDialog, QVBoxLayout, QHBoxLayout, QPushButton, QLabel, QTreeWidget, QTreeWidgetItem
+
+PATH_ROLE = Qt.ItemDataRole.UserRole
+
+
+def group_label(group):
+    if group["kind"] == "exact":
+        return f"Identical audio, {len(group['paths'])} files"
+    return f"Similar recordings, {group['similarity']:.0%} alike, {len(group['paths'])} files"
+
+
+class DuplicatesDialog(QDialog):
+    trackActivated = pyqtSignal(str)
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.setWindowTitle("Duplicates")
+        self.resize(680, 460)
+
+        layout = QVBoxLayout()
+        self.summary = QLabel()
+        layout.addWidget(self.summary)
+
+        self.tree = QTreeWidget()
+        self.tree.setHeaderLabels(("File", "Folder"))
+        self.tree.setColumnWidth(0, 300)
+        self.tree.itemActivated.connect(self.activate)
+        layout.addWidget(self.tree)
+
+        buttons = QHBoxLayout()
+        button_enqueue = QPushButton("Add to Playlist")
+        button_enqueue.clicked.connect(self.enqueue_selected)
+        button_close = QPushButton("Close")
+        button_close.clicked.connect(self.close)
+        buttons.addStretch(1)
+        buttons.addWidget(button_enqueue)
+        buttons.addWidget(button_close)
+        layout.addLayout(buttons)
+        self.setLayout(layout)
+
+    def set_groups(self, groups):
+        self.tree.clear()
+        # Exact copies first, then the closest matches
+        for group in sorted(groups, key=lambda g: (g["kind"] != "exact", -g["similarity"])):
+            parent = QTreeWidgetItem((group_label(group), ""))
+            for path in sorted(group["paths"]):
+                child = QTreeWidgetItem((os.path.basename(path), os.path.dirname(path)))
+                child.setData(0, PATH_ROLE, path)
+                child.setToolTip(0, path)
+                parent.addChild(child)
+            self.tree.addTopLevelItem(parent)
+            parent.setExpanded(True)
+        files = sum(len(group["paths"]) for group in groups)
+        self.summary.setText(f"{len(groups)} groups, {files} files" if groups else "No duplicates found")
+
+    def activate(self, item, column):
+        path = item.data(0, PATH_ROLE)
+        if path:
+            self.trackActivated.emit(path)
+
+    def enqueue_selected(self):
+        for item in self.tree.selectedItems():
+            self.activate(item, 0)
@@ -0,0 +1,162 @@
+import io
+import os
+import functools
+
+from components.instrumentation import metrics
+
+# Reads on a slow mount go out in blocks this large, each one round trip
+BLOCK_SIZE = 64 * 1024
+# ID3v1 (128 bytes) and an APEv2 footer (32 bytes) sit right before the end of the file
+TAIL_TAG_BYTES = 160
+REMOTE_FILESYSTEMS = frozenset((
+    "nfs", "nfs4", "cifs", "smb3", "smbfs", "9p", "afs", "ceph", "glusterfs", "davfs",
+    "fuse.sshfs", "fuse.rclone", "fuse.s3fs", "fuse.gvfsd-fuse",
+))
+# Extra roots to treat as slow storage, for mounts the table above does not recognize
+REMOTE_ROOTS = [root for root in os.environ.get("QMP_REMOTE_ROOTS", "").split(os.pathsep) if root]
+
+
+@functools.lru_cache(maxsize=1)
+def mount_table():
+    mounts = []
+    try:
+        with open("/proc/self/mounts") as f:
+            for line in f:
+                fields = line.split()
+                if len(fields) >= 3:
+                    # Spaces in mount points are escaped as \040
+                    mounts.append((fields[1].replace("\\040", " "), fields[2]))
+    except OSError:
+        pass
+    # Longest mount point first, so the innermost mount wins
+    return sorted(mounts, key=lambda mount: len(mount[0]), reverse=True)
+
+
+def mount_type(path):
+    path = os.path.realpath(path)
+    for mount_point, fs_type in mount_table():
+        if path == mount_point or path.startswith(mount_point.rstrip("/") + "/"):
+            return fs_type
+    return None
+
+
+def is_remote(path):
+    real = os.path.realpath(path)
+    if any(real == root or real.startswith(root.rstrip("/") + "/") for root in map(os.path.realpath, REMOTE_ROOTS)):
+        return True
+    return mount_type(path) in REMOTE_FILESYSTEMS
+
+
+class RangedReader(io.RawIOBase):
+    # Seekable, read-only file that fetches whole blocks with pread and keeps them,
+    # so the tag parser's many small reads and seeks cost a handful of round trips
+    def __init__(self, file_name, block_size=BLOCK_SIZE):
+        super().__init__()
+        self.name = file_name
+        self.block_size = block_size
+        self.fd = os.open(file_name, os.O_RDONLY)
+        self.size = os.fstat(self.fd).st_size
+        self.position = 0
+        self.blocks = {}
+        self.reads = 0
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self.position
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_CUR:
+            offset += self.position
+        elif whence == io.SEEK_END:
+            offset += self.size
+        if offset < 0:
+            raise ValueError("negative seek position")
+        self.position = offset
+        return offset
+
+    def fetch(self, start, end):
+        first = start // self.block_size
+        last = (min(end, self.size) - 1) // self.block_size
+        index = first
+        while index <= last:
+            if index in self.blocks:
+                index += 1
+                continue
+            # Consecutive missing blocks are read in one go
+            run = index
+            while run + 1 <= last and run + 1 not in self.blocks:
+                run += 1
+            data = os.pread(self.fd, (run - index + 1) * self.block_size, index * self.block_size)
+            self.reads += 1
+            metrics.count("io.ranged_reads")
+            metrics.count("io.ranged_bytes", len(data))
+            for block in range(index, run + 1):
+                offset = (block - index) * self.block_size
+                self.blocks[block] = data[offset:offset + self.block_size]
+            index = run + 1
+
+    def readinto(self, buffer):
+        end = min(self.position + len(buffer), self.size)
+        if end <= self.position:
+            return 0
+        self.fetch(self.position, end)
+        written = 0
+        while self.position < end:
+            block, offset = divmod(self.position, self.block_size)
+            chunk = self.blocks[block][offset:offset + end - self.position]
+            if not chunk:
+                break
+            buffer[written:written + len(chunk)] = chunk
+            written += len(chunk)
+            self.position += len(chunk)
+        return written
+
+    def close(self):
+        if self.fd is not None:
+            os.close(self.fd)
+            self.fd = None
+        super().close()
+
+
+def prefetch_tags(reader):
+    # The leading tag in one read, then the trailing tags in one more
+    head = reader.block_size
+    reader.fetch(0, head)
+    header = reader.blocks.get(0, b"")
+    if header[:3] == b"ID3" and len(header) >= 10:
+        from components.metadata import id3v2_size
+
+        reader.fetch(0, id3v2_size(header) + reader.block_size)
+    tail = max(reader.size - TAIL_TAG_BYTES, 0)
+    reader.fetch(tail, reader.size)
+    # The APEv2 footer ends the file, or comes right before an ID3v1 tag
+    for footer_start in (reader.size - 32, reader.size - 160):
+        if footer_start < 0:
+            continue
+        reader.seek(footer_start)
+        footer = reader.read(32)
+        if footer[:8] == b"APETAGEX":
+            # The size in the footer covers the items and the footer, the tag sits in front of it
+            ape_size = int.from_bytes(footer[12:16], "little")
+            reader.fetch(max(footer_start + 32 - ape_size, 0), footer_start)
+            break
+    reader.seek(0)
+
+
+def open_for_tags(file_name):
+    # Buffered reads where the file is local, never a mapping: a file truncated by another program while
+    # mapped kills the process with SIGBUS. On slow mounts only the tag regions are read, in a few ranges
+    if not is_remote(file_name):
+        return open(file_name, "rb", buffering=BLOCK_SIZE)
+    reader = RangedReader(file_name)
+    try:
+        prefetch_tags(reader)
+    except BaseException:
+        reader.close()
+        raise
+    return reader
@@ -0,0 +1,555 @@
+import os
+import time
+import struct
+import hashlib
+import logging
+import threading
+
+import numpy as np
+from PyQt6.QtCore import QThread, pyqtSignal
+
+from components.audio_decode import iter_pcm
+from components.library import Library
+from components.metadata import id3v2_size, sniff_header, detect_container
+from components.instrumentation import metrics
+
+logger = logging.getLogger(__name__)
+
+# Audio is averaged down to about this rate, the fingerprint only looks at 300-2000 Hz
+TARGET_RATE = 5512
+FRAME_SIZE = 2048
+HOP_SIZE = 1024
+# 33 bands give the 32 bits of a sub-fingerprint
+BAND_EDGES = np.geomspace(300.0, 2000.0, 34)
+# Only the start of a track is fingerprinted, about 480 sub-fingerprints or 2 KB
+FINGERPRINT_SECONDS = 90
+
+# LSH: every table keys sub-fingerprints on a fixed sample of their bits
+LSH_TABLES = 4
+LSH_BITS = 24
+# A sub-fingerprint is indexed when the hash of its key falls in 1 of this many slots,
+# which picks the same ones in every copy no matter where the track starts
+LSH_LANDMARK = 4
+# Keys shared by more tracks than this are silence or noise, not evidence
+LSH_MAX_BUCKET = 32
+# Matching sub-fingerprints at one offset needed before two tracks are compared
+MIN_VOTES = 2
+POSITION_BITS = 9
+# Bit error rate up to which two fingerprints count as the same recording
+MAX_BIT_ERROR = 0.3
+# Sub-fingerprints the alignment search may shift, encoders add different delays
+MAX_SHIFT = 8
+MIN_OVERLAP = 32
+
+READ_SIZE = 1 << 20
+PROGRESS_INTERVAL = 0.25
+WRITE_BATCH = 100
+HASH_BATCH = 16
+
+
+def lsh_masks():
+    rng = np.random.default_rng(0x514D50)
+    masks = []
+    for _ in range(LSH_TABLES):
+        bits = rng.choice(32, LSH_BITS, replace=False)
+        masks.append(int(sum(1 << int(bit) for bit in bits)))
+    return np.array(masks, dtype=np.uint32)
+
+
+LSH_MASKS = lsh_masks()
+
+
+# Exact duplicates: a hash over the coded audio only, so retagged copies still match
+
+def payload_ranges(f, size):
+    header = sniff_header(f)
+    container = detect_container(header)
+    if container == "mp3":
+        start = id3v2_size(header) if header[:3] == b"ID3" else 0
+        return [(start, trailing_tags_start(f, size))]
+    if container == "flac":
+        return [(flac_audio_start(f), trailing_tags_start(f, size))]
+    if container == "wav":
+        return riff_chunks(f, size, b"data")
+    if container == "mp4":
+        return mp4_atoms(f, size, b"mdat")
+    return None
+
+
+def trailing_tags_start(f, size):
+    # ID3v1 and APEv2 tags are found in either order at the end
+    end = size
+    while True:
+        if end >= 128:
+            f.seek(end - 128)
+            if f.read(3) == b"TAG":
+                end -= 128
+                continue
+        if end >= 32:
+            f.seek(end - 32)
+            footer = f.read(32)
+            if footer[:8] == b"APETAGEX":
+                tag_size, _, flags = struct.unpack("<III", footer[12:24])
+                # Bit 31 says a 32 byte header precedes the items; the size includes the footer
+                start = max(end - tag_size - (32 if flags & 0x80000000 else 0), 0)
+                # A corrupt size that does not move the end would loop forever
+                if tag_size >= 32 and start < end:
+                    end = start
+                    continue
+        return end
+
+
+def flac_audio_start(f):
+    f.seek(0)
+    header = f.read(10)
+    offset = id3v2_size(header) if header[:3] == b"ID3" else 0
+    # "fLaC", then metadata blocks until the one flagged as last
+    offset += 4
+    while True:
+        f.seek(offset)
+        block = f.read(4)
+        if len(block) < 4:
+            return offset
+        offset += 4 + int.from_bytes(block[1:4], "big")
+        if block[0] & 0x80:
+            return offset
+
+
+def riff_chunks(f, size, wanted):
+    ranges = []
+    offset = 12
+    while offset + 8 <= size:
+        f.seek(offset)
+        chunk_id, chunk_size = struct.unpack("<4sI", f.read(8))
+        if chunk_id == wanted:
+            ranges.append((offset + 8, min(offset + 8 + chunk_size, size)))
+        # Chunks are padded to an even size
+        offset += 8 + chunk_size + (chunk_size & 1)
+    return ranges
+
+
+def mp4_atoms(f, size, wanted):
+    ranges = []
+    offset = 0
+    while offset + 8 <= size:
+        f.seek(offset)
+        atom_size, atom_type = struct.unpack(">I4s", f.read(8))
+        header = 8
+        if atom_size == 1:
+            atom_size = struct.unpack(">Q", f.read(8))[0]
+            header = 16
+        elif atom_size == 0:
+            atom_size = size - offset
+        if atom_size < header:
+            break
+        if atom_type == wanted:
+            ranges.append((offset + header, min(offset + atom_size, size)))
+        offset += atom_size
+    return ranges
+
+
+def hash_ogg(f, digest, header_packets):
+    # Page headers carry serial numbers and checksums that change with the tags, only packet data is hashed
+    f.seek(0)
+    packet = 0
+    while True:
+        page = f.read(27)
+        if len(page) < 27 or page[:4] != b"OggS":
+            return
+        lacing = f.read(page[26])
+        body = f.read(sum(lacing))
+        position = 0
+        for value in lacing:
+            if packet >= header_packets:
+                digest.update(body[position:position + value])
+            position += value
+            # A lacing value below 255 ends a packet
+            if value < 255:
+                packet += 1
+
+
+def audio_hash(path):
+    digest = hashlib.blake2b(digest_size=16)
+    size = os.path.getsize(path)
+    with open(path, "rb") as f:
+        header = sniff_header(f)
+        container = detect_container(header)
+        if container in ("ogg-vorbis", "opus"):
+            # Vorbis has identification, comment and setup headers, Opus the first two
+            hash_ogg(f, digest, 3 if container == "ogg-vorbis" else 2)
+            return digest.hexdigest()
+        ranges = payload_ranges(f, size) or [(0, size)]
+        for start, end in ranges:
+            f.seek(start)
+            remaining = end - start
+            while remaining > 0:
+                data = f.read(min(READ_SIZE, remaining))
+                if not data:
+                    break
+                digest.update(data)
+                remaining -= len(data)
+    return digest.hexdigest()
+
+
+# Near duplicates: a spectral fingerprint after Haitsma and Kalker, one 32 bit word per hop
+
+class Fingerprinter:
+    def __init__(self, rate):
+        # Block averaging down to just above the target, then interpolation onto it exactly,
+        # so frames span the same time whatever the source rate
+        self.step = max(1, int(rate // TARGET_RATE))
+        self.ratio = rate / self.step / TARGET_RATE
+        self.pending = np.zeros(0, np.float32)
+        self.source = np.zeros(0, np.float32)
+        self.source_start = 0
+        self.produced = 0
+        self.buffer = np.zeros(0, np.float32)
+        self.window = np.hanning(FRAME_SIZE).astype(np.float32)
+        edges = np.searchsorted(np.fft.rfftfreq(FRAME_SIZE, 1 / TARGET_RATE), BAND_EDGES)
+        self.band_low = edges[:-1]
+        self.band_high = np.maximum(edges[1:], edges[:-1] + 1)
+        self.max_frames = (FINGERPRINT_SECONDS * TARGET_RATE - FRAME_SIZE) // HOP_SIZE + 1
+        self.energies = []
+        self.frames = 0
+
+    def done(self):
+        return self.frames >= self.max_frames
+
+    def feed(self, samples):
+        self.buffer = np.concatenate((self.buffer, self.resample(samples[:, 0])))
+        count = min((len(self.buffer) - FRAME_SIZE) // HOP_SIZE + 1, self.max_frames - self.frames)
+        if count <= 0:
+            return
+        frames = np.lib.stride_tricks.sliding_window_view(self.buffer, FRAME_SIZE)[::HOP_SIZE][:count]
+        power = np.abs(np.fft.rfft(frames * self.window, axis=1)) ** 2
+        cumulative = np.concatenate((np.zeros((count, 1)), np.cumsum(power, axis=1)), axis=1)
+        self.energies.append(cumulative[:, self.band_high] - cumulative[:, self.band_low])
+        self.frames += count
+        self.buffer = self.buffer[count * HOP_SIZE:]
+
+    def resample(self, samples):
+        # Averaging blocks of samples is a crude low-pass, good enough for coarse band energies
+        samples = np.concatenate((self.pending, samples))
+        usable = len(samples) // self.step * self.step
+        self.pending = samples[usable:]
+        self.source = np.concatenate((self.source, samples[:usable].reshape(-1, self.step).mean(axis=1)))
+        last = self.source_start + len(self.source) - 1
+        count = int(last / self.ratio) + 1 - self.produced
+        if count <= 0:
+            return np.zeros(0, np.float32)
+        positions = (self.produced + np.arange(count)) * self.ratio - self.source_start
+        output = np.interp(positions, np.arange(len(self.source)), self.source).astype(np.float32)
+        self.produced += count
+        consumed = int(self.produced * self.ratio) - self.source_start
+        self.source = self.source[consumed:]
+        self.source_start += consumed
+        return output
+
+    def finish(self):
+        if not self.energies:
+            return np.zeros(0, np.uint32)
+        energies = np.concatenate(self.energies)
+        # Sign of the band energy difference, differentiated over time
+        difference = energies[:, :-1] - energies[:, 1:]
+        bits = (difference[1:] - difference[:-1]) > 0
+        weights = np.left_shift(np.uint64(1), np.arange(32, dtype=np.uint64))
+        return (bits.astype(np.uint64) @ weights).astype(np.uint32)
+
+
+def fingerprint_file(path):
+    fingerprinter = None
+    for samples, rate in iter_pcm(path):
+        if fingerprinter is None:
+            fingerprinter = Fingerprinter(rate)
+        fingerprinter.feed(samples)
+        # Closing the generator stops the decoder, the rest of the track is never decoded
+        if fingerprinter.done():
+            break
+    return fingerprinter.finish() if fingerprinter is not None else np.zeros(0, np.uint32)
+
+
+def hash_batch(paths):
+    # Runs in the worker processes
+    results = []
+    failures = []
+    for path in paths:
+        try:
+            results.append({"path": path, "audio_hash": audio_hash(path)})
+        except Exception as e:
+            failures.append((path, str(e)))
+    return results, failures
+
+
+def fingerprint_batch(paths):
+    results = []
+    failures = []
+    for path in paths:
+        try:
+            results.append({"path": path, "fingerprint": fingerprint_file(path).tobytes()})
+        except Exception as e:
+            failures.append((path, str(e)))
+    return results, failures
+
+
+def bit_error_rate(a, b):
+    # Lowest rate over small shifts between the two
+    best = 1.0
+    for shift in range(-MAX_SHIFT, MAX_SHIFT + 1):
+        x = a[max(shift, 0):]
+        y = b[max(-shift, 0):]
+        overlap = min(len(x), len(y))
+        if overlap < MIN_OVERLAP:
+            continue
+        errors = np.unpackbits((x[:overlap] ^ y[:overlap]).view(np.uint8)).sum()
+        best = min(best, errors / (overlap * 32))
+    return best
+
+
+def candidate_pairs(fingerprints):
+    # LSH over sampled bits. Each table is an array of key << 32 | track << 9 | position,
+    # so an index over 100k tracks is sorted one table of about 100 MB at a time
+    count = len(fingerprints)
+    if count < 2:
+        return np.zeros((0, 2), np.int64)
+    width = 1 << POSITION_BITS
+    matrix = np.zeros((count, width), np.uint32)
+    valid = np.zeros((count, width), bool)
+    for track, fingerprint in enumerate(fingerprints):
+        fingerprint = fingerprint[:width]
+        matrix[track, :len(fingerprint)] = fingerprint
+        valid[track, :len(fingerprint)] = True
+
+    votes = []
+    for table, mask in enumerate(LSH_MASKS):
+        # Knuth's multiplicative hash, salted per table, spreads the selection over all key bits
+        hashed = matrix & mask
+        hashed ^= np.uint32(table * 0x9E3779B9 & 0xFFFFFFFF)
+        hashed *= np.uint32(2654435761)
+        selected = (hashed >> np.uint32(16)) % np.uint32(LSH_LANDMARK) == 0
+        selected &= valid
+        # With rows POSITION_BITS wide, the flat index already is track << 9 | position
+        flat = np.flatnonzero(selected).astype(np.uint64)
+        del selected
+        entries = hashed.ravel()[flat].astype(np.uint64)
+        del hashed
+        entries <<= np.uint64(32)
+        entries |= flat
+        del flat
+        entries.sort()
+        votes.extend(table_votes(entries, count))
+        del entries
+    if not votes:
+        return np.zeros((0, 2), np.int64)
+    # One vote per sub-fingerprint, even when several tables matched it, counted per offset
+    distinct = np.unique(np.concatenate(votes)) >> POSITION_BITS
+    alignments, counts = np.unique(distinct, return_counts=True)
+    pairs = np.unique(alignments[counts >= MIN_VOTES] >> (14 - POSITION_BITS))
+    return np.stack((pairs // count, pairs % count), axis=1)
+
+
+def table_votes(entries, count):
+    width = 1 << POSITION_BITS
+    keys = (entries >> np.uint64(32)).astype(np.uint32)
+    # Buckets are runs of equal keys; crowded ones are silence or noise and are left out
+    crowded = np.flatnonzero(keys[:-LSH_MAX_BUCKET] == keys[LSH_MAX_BUCKET:])
+    if len(crowded):
+        marks = np.zeros(len(keys) + 1, np.int32)
+        np.add.at(marks, crowded, 1)
+        np.add.at(marks, crowded + LSH_MAX_BUCKET + 1, -1)
+        keep = np.cumsum(marks[:-1]) == 0
+        entries = entries[keep]
+        keys = keys[keep]
+
+    votes = []
+    low = np.uint64(0xFFFFFFFF)
+    for distance in range(1, LSH_MAX_BUCKET):
+        same = np.flatnonzero(keys[:-distance] == keys[distance:])
+        if not len(same):
+            break
+        first = (entries[same] & low).astype(np.int64)
+        second = (entries[same + distance] & low).astype(np.int64)
+        # Order each pair by track so both directions vote together
+        first, second = np.minimum(first, second), np.maximum(first, second)
+        a, position_a = first >> POSITION_BITS, first & (width - 1)
+        b, position_b = second >> POSITION_BITS, second & (width - 1)
+        offset = position_b - position_a
+        # Copies line up within a few sub-fingerprints, chance collisions land anywhere
+        near = (a != b) & (np.abs(offset) <= MAX_SHIFT)
+        pair = a[near] * count + b[near]
+        votes.append((pair << 14) | ((offset[near] + MAX_SHIFT) << POSITION_BITS) | position_a[near])
+    return votes
+
+
+def find_duplicates(tracks):
+    # tracks: (path, duration, audio_hash, fingerprint bytes) rows from the library
+    groups = []
+    by_hash = {}
+    for path, _, digest, _ in tracks:
+        if digest is not None:
+            by_hash.setdefault(digest, []).append(path)
+    for paths in by_hash.values():
+        if len(paths) > 1:
+            groups.append({"kind": "exact", "similarity": 1.0, "paths": sorted(paths)})
+
+    # One fingerprint per exact group, its copies follow it into any similar group
+    representatives = {}
+    for path, duration, digest, fingerprint in tracks:
+        key = digest or path
+        if fingerprint and key not in representatives:
+            representatives[key] = (path, duration, np.frombuffer(fingerprint, np.uint32))
+    keys = list(representatives)
+    fingerprints = [representatives[key][2] for key in keys]
+
+    parent = list(range(len(keys)))
+
+    def root(i):
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    similarity = {}
+    for a, b in candidate_pairs(fingerprints):
+        duration_a, duration_b = representatives[keys[a]][1], representatives[keys[b]][1]
+        # Different lengths are different edits, not duplicates
+        if duration_a and duration_b and abs(duration_a - duration_b) > max(3.0, 0.05 * max(duration_a, duration_b)):
+            continue
+        error = bit_error_rate(fingerprints[a], fingerprints[b])
+        if error <= MAX_BIT_ERROR:
+            ra, rb = root(a), root(b)
+            parent[rb] = ra
+            similarity[(a, b)] = 1 - error
+
+    members = {}
+    for i in range(len(keys)):
+        members.setdefault(root(i), []).append(i)
+    scores = {}
+    for (a, b), score in similarity.items():
+        scores.setdefault(root(a), []).append(score)
+    for group_root, indexes in members.items():
+        if len(indexes) < 2:
+            continue
+        paths = []
+        for i in indexes:
+            paths.extend(by_hash.get(keys[i], [representatives[keys[i]][0]]))
+        groups.append({"kind": "similar", "similarity": float(min(scores[group_root])), "paths": sorted(paths)})
+    metrics.count("duplicates.groups", len(groups))
+    return groups
+
+
+class DuplicateScanner(QThread):
+    # phase ("hash" or "fingerprint"), done, total, files per second, eta in seconds
+    progress = pyqtSignal(str, int, int, float, float)
+    finished_search = pyqtSignal(object)
+    failed = pyqtSignal(str)
+
+    def __init__(self, db_path, workers=None, parent=None):
+        super().__init__(parent)
+        self.db_path = db_path
+        self.workers = workers or os.cpu_count() or 1
+        self.cancel_event = threading.Event()
+
+    def cancel(self):
+        self.cancel_event.set()
+
+    def is_cancelled(self):
+        return self.cancel_event.is_set()
+
+    def run(self):
+        library = Library(self.db_path)
+        try:
+            stats = self.search(library)
+        except Exception as e:
+            self.failed.emit(str(e))
+            return
+        finally:
+            library.close()
+        self.finished_search.emit(stats)
+
+    def search(self, library):
+        stats = {"hashed": 0, "fingerprinted": 0, "failed": 0, "cancelled": False, "groups": []}
+
+        import multiprocessing
+        from concurrent.futures import ProcessPoolExecutor
+
+        context = multiprocessing.get_context("spawn")
+        executor = ProcessPoolExecutor(max_workers=self.workers, mp_context=context)
+        try:
+            # Hashing only reads, so it comes first and spares decoding exact copies
+            paths = library.paths_without_audio_hash()
+            batches = [paths[i:i + HASH_BATCH] for i in range(0, len(paths), HASH_BATCH)]
+            stats["hashed"] = self.run_batches(executor, "hash", hash_batch, batches, len(paths),
+                                               library.store_audio_hashes, stats)
+
+            missing = library.paths_without_fingerprint()
+            known = library.fingerprints_by_hash({digest for _, digest in missing if digest})
+            copies = [{"path": path, "fingerprint": known[digest]} for path, digest in missing if digest in known]
+            library.store_fingerprints(copies)
+            # Copies without a fingerprint yet are decoded once for the whole group
+            groups = {}
+            for path, digest in missing:
+                if digest not in known:
+                    groups.setdefault(digest or path, []).append(path)
+            followers = {paths[0]: paths for paths in groups.values()}
+
+            def store(results):
+                library.store_fingerprints([{"path": path, "fingerprint": result["fingerprint"]}
+                                            for result in results for path in followers[result["path"]]])
+
+            leaders = [[leader] for leader in followers]
+            stats["fingerprinted"] = self.run_batches(executor, "fingerprint", fingerprint_batch, leaders,
+                                                      len(leaders), store, stats)
+        finally:
+            executor.shutdown(wait=True, cancel_futures=True)
+
+        if not stats["cancelled"]:
+            started = time.perf_counter()
+            stats["groups"] = find_duplicates(library.fingerprints())
+            metrics.observe("duplicates.search", (time.perf_counter() - started) * 1000)
+        return stats
+
+    def run_batches(self, executor, phase, function, batches, total, store, stats):
+        from concurrent.futures import FIRST_COMPLETED, wait
+
+        done = 0
+        stored = 0
+        pending = []
+        started = time.monotonic()
+        last_report = 0.0
+        in_flight = set()
+        next_batch = 0
+        try:
+            while next_batch < len(batches) or in_flight:
+                if self.is_cancelled():
+                    stats["cancelled"] = True
+                    break
+                while next_batch < len(batches) and len(in_flight) < self.workers * 2:
+                    in_flight.add(executor.submit(function, batches[next_batch]))
+                    next_batch += 1
+
+                completed, in_flight = wait(in_flight, timeout=PROGRESS_INTERVAL, return_when=FIRST_COMPLETED)
+                for future in completed:
+                    results, failures = future.result()
+                    for path, error in failures:
+                        logger.warning("Failed to %s %s: %s", phase, path, error)
+                    stats["failed"] += len(failures)
+                    metrics.count(f"duplicates.{phase}_failed", len(failures))
+                    pending.extend(results)
+                    done += len(results) + len(failures)
+
+                if len(pending) >= WRITE_BATCH:
+                    store(pending)
+                    stored += len(pending)
+                    pending = []
+
+                now = time.monotonic()
+                if now - last_report >= PROGRESS_INTERVAL:
+                    rate = done / max(now - started, 1e-6)
+                    eta = (total - done) / rate if rate > 0 else -1.0
+                    self.progress.emit(phase, done, total, rate, eta)
+                    last_report = now
+        finally:
+            if pending:
+                store(pending)
+                stored += len(pending)
+        return stored
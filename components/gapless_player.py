@@ -0,0 +1,280 @@
+import time
+
+from PyQt6.QtCore import QObject, QUrl, pyqtSignal
+
+from components.file_io import is_remote
+from components.read_ahead import ReadAheadDevice
+
+# How long before the end of the current track the next one gets opened
+PRELOAD_MS = 5000
+NORMALIZATION_MODES = ("off", "track", "album")
+# When playback reads through a ReadAheadDevice instead of handing the backend a path
+READ_AHEAD_MODES = ("auto", "always", "never")
+
+
+def gain_factor(gains, mode, preamp=0.0):
+    if mode == "off" or not gains:
+        return 1.0
+    gain, peak = gains.get("track_gain"), gains.get("track_peak")
+    if mode == "album" and gains.get("album_gain") is not None:
+        gain, peak = gains["album_gain"], gains.get("album_peak")
+    if gain is None:
+        return 1.0
+    factor = 10 ** ((gain + preamp) / 20)
+    if peak:
+        factor = min(factor, 1 / peak)
+    # QAudioOutput cannot amplify, so quiet tracks top out at full volume
+    return min(factor, 1.0)
+
+
+class GaplessPlayer(QObject):
+    positionChanged = pyqtSignal(int)
+    durationChanged = pyqtSignal(int)
+    playbackStateChanged = pyqtSignal(object)
+    trackChanged = pyqtSignal(str)
+    # Milliseconds between end of media and the first position tick of the next track
+    transitionMeasured = pyqtSignal(float)
+
+    def __init__(self, queue, parent=None, preload_ms=PRELOAD_MS):
+        super().__init__(parent)
+        self.queue = queue
+        self.preload_ms = preload_ms
+        self.volume = 1.0
+        self.muted = False
+        # Maps a path to a linear normalization factor, see set_gain_provider
+        self.gain_provider = None
+        self.gains = {}
+        self.sources = {}
+        # "auto" reads ahead for files on network mounts only, see components/file_io.py
+        self.read_ahead = "auto"
+        self.devices = {}
+
+        # Created on first playback, see ensure_players
+        self.players = []
+        self.active = None
+        self.standby = None
+        self.armed_path = None
+        self.transition_started = None
+        # Where a track opened by load_current starts once its media is loaded
+        self.resume_position = None
+
+        self.queue.changed.connect(self.check_armed)
+
+    def ensure_players(self):
+        if self.players:
+            return
+        # QtMultimedia brings up its audio backend on import, so that waits until something is played
+        from PyQt6.QtMultimedia import QMediaPlayer, QAudioOutput
+
+        # Two players: one audible, one standing by with the next track opened
+        for _ in range(2):
+            player = QMediaPlayer(self)
+            output = QAudioOutput(self)
+            output.setVolume(self.volume)
+            self.gains[player] = 1.0
+            output.setMuted(self.muted)
+            player.setAudioOutput(output)
+            player.positionChanged.connect(lambda position, p=player: self.on_position_changed(p, position))
+            player.durationChanged.connect(lambda duration, p=player: self.on_duration_changed(p, duration))
+            player.mediaStatusChanged.connect(lambda status, p=player: self.on_media_status_changed(p, status))
+            player.playbackStateChanged.connect(lambda state, p=player: self.on_playback_state_changed(p, state))
+            self.players.append(player)
+        self.active = self.players[0]
+        self.standby = self.players[1]
+
+    def close(self):
+        for player in self.players:
+            player.stop()
+
+    # QMediaPlayer-like interface
+
+    def play(self):
+        if self.active is None or self.active.source().isEmpty():
+            self.play_current()
+        else:
+            self.active.play()
+
+    def pause(self):
+        if self.active is not None:
+            self.active.pause()
+
+    def stop(self):
+        if self.active is not None:
+            self.active.stop()
+
+    def setPosition(self, position):
+        if self.active is not None:
+            self.active.setPosition(position)
+
+    def position(self):
+        return self.active.position() if self.active is not None else 0
+
+    def duration(self):
+        return self.active.duration() if self.active is not None else 0
+
+    def playbackState(self):
+        return self.active.playbackState() if self.active is not None else None
+
+    def is_playing(self):
+        if self.active is None:
+            return False
+        return self.active.playbackState() == self.active.PlaybackState.PlayingState
+
+    def setVolume(self, volume):
+        self.volume = volume
+        for player in self.players:
+            player.audioOutput().setVolume(volume * self.gains[player])
+
+    # Volume normalization
+
+    def set_gain_provider(self, provider):
+        self.gain_provider = provider
+        self.refresh_gains()
+
+    def apply_gain(self, player, path):
+        gain = self.gain_provider(path) if self.gain_provider is not None and path else 1.0
+        self.gains[player] = gain
+        player.audioOutput().setVolume(self.volume * gain)
+
+    def refresh_gains(self, paths=None):
+        # Called when gains for these paths (or all, for None) changed, e.g. after an analysis
+        for player in self.players:
+            path = self.sources.get(player)
+            if paths is None or path in paths:
+                self.apply_gain(player, path)
+
+    def set_source(self, player, path):
+        self.sources[player] = path
+        # Set before the source so the first samples already play at the normalized level
+        self.apply_gain(player, path)
+        previous = self.devices.pop(player, None)
+        device = self.open_device(path) if path else None
+        if device is not None:
+            self.devices[player] = device
+            player.setSourceDevice(device, QUrl.fromLocalFile(path))
+        else:
+            player.setSource(QUrl.fromLocalFile(path) if path else QUrl())
+        # Only once the player let go of it
+        if previous is not None:
+            previous.close()
+            previous.deleteLater()
+
+    def open_device(self, path):
+        if self.read_ahead == "never" or (self.read_ahead == "auto" and not is_remote(path)):
+            return None
+        device = ReadAheadDevice(path, self)
+        # Fall back to the path, the backend reports the error for missing files itself
+        if not device.open():
+            device.deleteLater()
+            return None
+        return device
+
+    def isMuted(self):
+        return self.muted
+
+    def setMuted(self, muted):
+        self.muted = muted
+        for player in self.players:
+            player.audioOutput().setMuted(muted)
+
+    # Queue handling
+
+    def play_current(self):
+        path = self.queue.current()
+        if path is None:
+            return
+        self.ensure_players()
+        if path == self.armed_path:
+            self.swap()
+        else:
+            self.set_source(self.active, path)
+            self.active.play()
+            self.disarm()
+        self.resume_position = None
+        self.trackChanged.emit(path)
+
+    def load_current(self, position=0):
+        # Opens the current track paused, so play resumes without waiting for the decoder
+        path = self.queue.current()
+        if path is None:
+            return
+        self.ensure_players()
+        self.set_source(self.active, path)
+        self.disarm()
+        self.resume_position = position or None
+        self.active.pause()
+        self.trackChanged.emit(path)
+
+    def next(self):
+        if self.queue.advance():
+            self.play_current()
+
+    def previous(self):
+        if self.queue.back():
+            self.play_current()
+
+    def swap(self):
+        previous = self.active
+        self.active, self.standby = self.standby, previous
+        self.armed_path = None
+        self.active.play()
+        previous.stop()
+        self.set_source(previous, None)
+        self.durationChanged.emit(self.active.duration())
+
+    def arm(self, path):
+        self.armed_path = path
+        self.set_source(self.standby, path)
+
+    def arm_next(self):
+        # Opens the next track's decoder now instead of preload_ms before the end
+        next_path = self.queue.peek()
+        if self.players and self.armed_path is None and next_path is not None:
+            self.arm(next_path)
+
+    def disarm(self):
+        if self.armed_path is not None:
+            self.armed_path = None
+            self.set_source(self.standby, None)
+
+    def check_armed(self):
+        # Queue edits can leave the standby player holding the wrong track
+        if self.armed_path is not None and self.armed_path != self.queue.peek():
+            self.disarm()
+
+    # Player signals, only the active player is forwarded
+
+    def on_position_changed(self, player, position):
+        if player is not self.active:
+            return
+        if self.transition_started is not None and position > 0:
+            self.transitionMeasured.emit((time.perf_counter() - self.transition_started) * 1000)
+            self.transition_started = None
+        self.positionChanged.emit(position)
+
+        duration = player.duration()
+        if self.armed_path is None and duration > 0 and duration - position <= self.preload_ms:
+            next_path = self.queue.peek()
+            if next_path is not None:
+                self.arm(next_path)
+
+    def on_duration_changed(self, player, duration):
+        if player is self.active:
+            self.durationChanged.emit(duration)
+
+    def on_media_status_changed(self, player, status):
+        if player is self.active and status == player.MediaStatus.LoadedMedia and self.resume_position is not None:
+            player.setPosition(self.resume_position)
+            self.resume_position = None
+        if player is not self.active or status != player.MediaStatus.EndOfMedia:
+            return
+        if self.queue.peek() is None:
+            return
+        # Start the pre-opened player straight from the end-of-media notification
+        self.transition_started = time.perf_counter()
+        self.queue.advance()
+        self.play_current()
+
+    def on_playback_state_changed(self, player, state):
+        if player is self.active:
+            self.playbackStateChanged.emit(state)
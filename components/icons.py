@@ -0,0 +1,14 @@
+from PyQt6.QtCore import QSize
+from PyQt6.QtGui import QIcon
+
+ICON_RENDER_SIZE = 48
+ICON_CACHE = {}
+
+
+def icon(path):
+    # Each SVG is rasterized once and the resulting QIcon is shared by every button showing it
+    cached = ICON_CACHE.get(path)
+    if cached is None:
+        cached = QIcon(QIcon(path).pixmap(QSize(ICON_RENDER_SIZE, ICON_RENDER_SIZE)))
+        ICON_CACHE[path] = cached
+    return cached
@@ -1,20 +1,20 @@
 from PyQt6.QtWidgets import QWidget, QVBoxLayout, QLabel
-from PyQt6.QtGui import QPixmap
 from PyQt6.QtCore import Qt
 
+from components.cover_store import COVER_SIZE
+from components.thumbnails import CoverLabel
+
 class InfoWidget(QWidget):
-    def __init__(self, title, artist, album):
+    def __init__(self, title, artist, album, thumbnails):
         super().__init__()
         layout = QVBoxLayout()
         layout.setSpacing(7)
         layout.setContentsMargins(0, 0, 0, 0)
         layout.setAlignment(Qt.AlignmentFlag.AlignCenter)
 
-        self.imageLabel = QLabel()
-        pixmap = QPixmap("placeholder.jpg")
-        pixmap = pixmap.scaled(250, 250, Qt.AspectRatioMode.KeepAspectRatio, Qt.TransformationMode.SmoothTransformation)  # Set the size of the image
-        self.imageLabel.setPixmap(pixmap)
-        self.imageLabel.setAlignment(Qt.AlignmentFlag.AlignCenter)
+        # Decoded at its shown size off the GUI thread, the placeholder stands in until then
+        self.imageLabel = CoverLabel(thumbnails, COVER_SIZE)
+        self.imageLabel.show_picture("placeholder.png")
 
         self.titleLabel = QLabel(f"Title: {title}")
         self.artistLabel = QLabel(f"Artist: {artist}")
@@ -36,7 +36,5 @@ class InfoWidget(QWidget):
         self.titleLabel.setText(title)
         self.artistLabel.setText(artist)
         self.albumLabel.setText(album)
-    
-        pixmap = QPixmap(image_path)
-        pixmap = pixmap.scaled(250, 250, Qt.AspectRatioMode.KeepAspectRatio, Qt.TransformationMode.SmoothTransformation)  # Set the size of the image
-        self.imageLabel.setPixmap(pixmap)
\ No newline at end of file
+
+        self.imageLabel.show_picture(image_path)
\ No newline at end of file
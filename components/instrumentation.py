@@ -0,0 +1,144 @@
+import os
+import json
+import time
+import logging
+import tempfile
+import threading
+from contextlib import contextmanager
+
+LOG_FORMAT = "%(asctime)s %(levelname)-7s %(name)s: %(message)s"
+METRIC_PREFIX = "qmp"
+# Upper bounds in ms for the Prometheus histogram buckets
+BUCKETS_MS = (1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000)
+
+logger = logging.getLogger(__name__)
+
+
+def configure_logging(level="WARNING"):
+    logging.basicConfig(level=getattr(logging, str(level).upper(), logging.WARNING), format=LOG_FORMAT)
+
+
+class Timing:
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.min = None
+        self.max = None
+        self.last = None
+        self.buckets = [0] * len(BUCKETS_MS)
+
+    def observe(self, ms):
+        self.count += 1
+        self.total += ms
+        self.last = ms
+        self.min = ms if self.min is None else min(self.min, ms)
+        self.max = ms if self.max is None else max(self.max, ms)
+        for i, bound in enumerate(BUCKETS_MS):
+            if ms <= bound:
+                self.buckets[i] += 1
+                break
+
+    def snapshot(self):
+        return {
+            "count": self.count,
+            "sum_ms": self.total,
+            "mean_ms": self.total / self.count if self.count else None,
+            "min_ms": self.min,
+            "max_ms": self.max,
+            "last_ms": self.last,
+        }
+
+
+class Metrics:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counters = {}
+        self.gauges = {}
+        self.timings = {}
+        self.started = time.time()
+
+    def count(self, name, amount=1):
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + amount
+
+    def gauge(self, name, value):
+        with self.lock:
+            self.gauges[name] = value
+
+    def observe(self, name, ms):
+        with self.lock:
+            timing = self.timings.get(name)
+            if timing is None:
+                timing = self.timings[name] = Timing()
+            timing.observe(ms)
+
+    def reset(self):
+        with self.lock:
+            self.counters.clear()
+            self.gauges.clear()
+            self.timings.clear()
+
+    def snapshot(self):
+        with self.lock:
+            return {
+                "uptime_s": time.time() - self.started,
+                "counters": dict(self.counters),
+                "gauges": dict(self.gauges),
+                "timings": {name: timing.snapshot() for name, timing in self.timings.items()},
+            }
+
+    def to_json(self):
+        return json.dumps(self.snapshot(), indent=2, sort_keys=True)
+
+    def to_prometheus(self):
+        lines = []
+        with self.lock:
+            for name, value in sorted(self.counters.items()):
+                metric = metric_name(name) + "_total"
+                lines += [f"# TYPE {metric} counter", f"{metric} {value}"]
+            for name, value in sorted(self.gauges.items()):
+                metric = metric_name(name)
+                lines += [f"# TYPE {metric} gauge", f"{metric} {value}"]
+            for name, timing in sorted(self.timings.items()):
+                metric = metric_name(name) + "_ms"
+                lines.append(f"# TYPE {metric} histogram")
+                cumulative = 0
+                for bound, hits in zip(BUCKETS_MS, timing.buckets):
+                    cumulative += hits
+                    lines.append(f'{metric}_bucket{{le="{bound}"}} {cumulative}')
+                lines.append(f'{metric}_bucket{{le="+Inf"}} {timing.count}')
+                lines.append(f"{metric}_sum {timing.total}")
+                lines.append(f"{metric}_count {timing.count}")
+        return "\n".join(lines) + "\n"
+
+    def dump(self, path):
+        # Atomic, so a scraper never reads half a file; the format follows the extension
+        text = self.to_prometheus() if path.endswith((".prom", ".txt")) else self.to_json()
+        directory = os.path.dirname(os.path.abspath(path))
+        fd, temp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w") as f:
+                f.write(text)
+            os.replace(temp_path, path)
+        except OSError:
+            logger.exception("Could not write metrics to %s", path)
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+
+
+def metric_name(name):
+    return METRIC_PREFIX + "_" + "".join(c if c.isalnum() else "_" for c in name)
+
+
+metrics = Metrics()
+
+
+@contextmanager
+def span(name, log=None):
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = (time.perf_counter() - started) * 1000
+        metrics.observe(name, elapsed)
+        (log or logger).debug("%s took %.2f ms", name, elapsed)
@@ -0,0 +1,84 @@
+import os
+import sys
+import json
+import socket
+import argparse
+import tempfile
+
+DEFAULT_SOCKET_NAME = "qt-music-player"
+
+
+def socket_path(name):
+    # QLocalServer puts relative names in the temp directory
+    return name if os.path.isabs(name) else os.path.join(tempfile.gettempdir(), name)
+
+
+class IpcClient:
+    def __init__(self, name=DEFAULT_SOCKET_NAME, timeout=5.0):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.settimeout(timeout)
+        self.sock.connect(socket_path(name))
+        self.reader = self.sock.makefile("rb")
+        self.next_id = 1
+        # Events that arrived while waiting for a reply
+        self.events = []
+
+    def close(self):
+        self.reader.close()
+        self.sock.close()
+
+    def request(self, method, params=None):
+        request_id = self.next_id
+        self.next_id += 1
+        message = {"jsonrpc": "2.0", "id": request_id, "method": method}
+        if params is not None:
+            message["params"] = params
+        self.sock.sendall(json.dumps(message).encode() + b"\n")
+        while True:
+            reply = self.receive()
+            if reply.get("id") == request_id:
+                return reply
+            self.events.append(reply)
+
+    def call(self, method, **params):
+        reply = self.request(method, params or None)
+        if "error" in reply:
+            raise RuntimeError(reply["error"]["message"])
+        return reply["result"]
+
+    def receive(self):
+        line = self.reader.readline()
+        if not line:
+            raise ConnectionError("player closed the connection")
+        return json.loads(line)
+
+    def next_event(self):
+        if self.events:
+            return self.events.pop(0)
+        return self.receive()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Send a command to a running player")
+    parser.add_argument("--socket", default=DEFAULT_SOCKET_NAME)
+    parser.add_argument("--follow", action="store_true", help="keep printing pushed events after the reply")
+    parser.add_argument("method")
+    parser.add_argument("params", nargs="?", help="JSON object or array of parameters")
+    args = parser.parse_args()
+
+    client = IpcClient(args.socket, timeout=None if args.follow else 5.0)
+    reply = {}
+    try:
+        reply = client.request(args.method, json.loads(args.params) if args.params else None)
+        print(json.dumps(reply))
+        while args.follow:
+            print(json.dumps(client.next_event()), flush=True)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        client.close()
+    return 1 if "error" in reply else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
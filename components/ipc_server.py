@@ -0,0 +1,212 @@
+import json
+import time
+
+from PyQt6.QtCore import QObject, QCoreApplication
+from PyQt6.QtNetwork import QLocalServer, QLocalSocket
+
+from components.instrumentation import metrics
+
+DEFAULT_SOCKET_NAME = "qt-music-player"
+EVENT_TYPES = ("state", "track", "position", "duration", "volume", "muted", "queue")
+# Position ticks are frequent, clients ask for them explicitly
+DEFAULT_EVENTS = frozenset(EVENT_TYPES) - {"position"}
+# The event that shows a command took effect; its latency is reported with that event
+SETTLED_BY = {
+    "play": "state",
+    "pause": "state",
+    "toggle": "state",
+    "stop": "state",
+    "seek": "position",
+    "set_volume": "volume",
+    "set_muted": "muted",
+    "next": "track",
+    "previous": "track",
+    "play_index": "track",
+    "play_files": "track",
+    "enqueue": "queue",
+    "clear": "queue",
+}
+# Commands that changed nothing (play while playing) stop waiting for their event after this long
+SETTLE_TIMEOUT_NS = 2_000_000_000
+# How long listen waits for an instance already on the socket to answer
+PROBE_TIMEOUT_MS = 1000
+
+# JSON-RPC 2.0 error codes
+PARSE_ERROR = -32700
+INVALID_REQUEST = -32600
+METHOD_NOT_FOUND = -32601
+INVALID_PARAMS = -32602
+INTERNAL_ERROR = -32603
+
+
+class InstanceRunning(OSError):
+    pass
+
+
+class IpcServer(QObject):
+    def __init__(self, engine, name=DEFAULT_SOCKET_NAME, parent=None):
+        super().__init__(parent)
+        self.engine = engine
+        self.name = name
+        self.server = QLocalServer(self)
+        self.server.setSocketOptions(QLocalServer.SocketOption.UserAccessOption)
+        self.server.newConnection.connect(self.accept)
+        # socket -> subscribed event types
+        self.clients = {}
+        # (socket, request id, settling event, received ns)
+        self.pending = []
+
+        self.methods = {
+            "play": engine.play,
+            "pause": engine.pause,
+            "toggle": engine.toggle,
+            "stop": engine.stop,
+            "seek": engine.seek,
+            "set_volume": engine.set_volume,
+            "set_muted": engine.set_muted,
+            "next": engine.next,
+            "previous": engine.previous,
+            "play_index": engine.play_index,
+            "play_files": engine.play_files,
+            "enqueue": engine.enqueue,
+            "clear": engine.clear,
+            "set_normalization": engine.set_normalization,
+            "status": engine.status,
+            "queue": engine.queue_paths,
+            "ping": lambda: {"ns": time.monotonic_ns()},
+            "metrics": self.metrics,
+            "quit": QCoreApplication.quit,
+        }
+
+        engine.stateChanged.connect(lambda state: self.push("state", state))
+        engine.trackChanged.connect(lambda path: self.push("track", path))
+        engine.positionChanged.connect(lambda position: self.push("position", position))
+        engine.durationChanged.connect(lambda duration: self.push("duration", duration))
+        engine.volumeChanged.connect(lambda volume: self.push("volume", volume))
+        engine.mutedChanged.connect(lambda muted: self.push("muted", muted))
+        engine.queueChanged.connect(lambda: self.push("queue", len(engine.queue)))
+
+    def listen(self):
+        probe = QLocalSocket()
+        probe.connectToServer(self.name)
+        if probe.waitForConnected(PROBE_TIMEOUT_MS):
+            probe.abort()
+            raise InstanceRunning(f"another player is listening on {self.name}")
+        error = probe.error()
+        if error == QLocalSocket.LocalSocketError.ConnectionRefusedError:
+            # Nobody answers on it, a crashed instance left its socket file behind
+            QLocalServer.removeServer(self.name)
+        elif error != QLocalSocket.LocalSocketError.ServerNotFoundError:
+            raise OSError(f"could not check {self.name}: {probe.errorString()}")
+        if not self.server.listen(self.name):
+            raise OSError(f"could not listen on {self.name}: {self.server.errorString()}")
+        return self.server.fullServerName()
+
+    def close(self):
+        for socket in list(self.clients):
+            socket.disconnectFromServer()
+        self.server.close()
+
+    def accept(self):
+        while self.server.hasPendingConnections():
+            socket = self.server.nextPendingConnection()
+            self.clients[socket] = set(DEFAULT_EVENTS)
+            socket.readyRead.connect(lambda s=socket: self.read(s))
+            socket.disconnected.connect(lambda s=socket: self.drop(s))
+
+    def drop(self, socket):
+        self.clients.pop(socket, None)
+        self.pending = [entry for entry in self.pending if entry[0] is not socket]
+        socket.deleteLater()
+
+    def read(self, socket):
+        # One JSON-RPC message per line
+        while socket.canReadLine():
+            line = bytes(socket.readLine()).strip()
+            if line:
+                self.handle(socket, line)
+
+    def handle(self, socket, line):
+        received = time.monotonic_ns()
+        try:
+            request = json.loads(line)
+        except ValueError:
+            self.send(socket, self.error(None, PARSE_ERROR, "parse error"))
+            return
+        if not isinstance(request, dict) or not isinstance(request.get("method"), str):
+            self.send(socket, self.error(None, INVALID_REQUEST, "invalid request"))
+            return
+
+        request_id = request.get("id")
+        method = request["method"]
+        params = request.get("params") or {}
+        if method == "subscribe":
+            handler = lambda events: self.subscribe(socket, events)
+        else:
+            handler = self.methods.get(method)
+        if handler is None:
+            self.send(socket, self.error(request_id, METHOD_NOT_FOUND, f"unknown method: {method}"))
+            return
+
+        # Registered before the call, the engine may change state synchronously
+        settled_by = SETTLED_BY.get(method)
+        if settled_by is not None and request_id is not None:
+            self.pending.append((socket, request_id, settled_by, received))
+        try:
+            result = handler(**params) if isinstance(params, dict) else handler(*params)
+        except Exception as e:
+            metrics.count("ipc.errors")
+            self.pending = [entry for entry in self.pending if entry[:2] != (socket, request_id)]
+            code = INVALID_PARAMS if isinstance(e, (TypeError, ValueError)) else INTERNAL_ERROR
+            self.send(socket, self.error(request_id, code, str(e)))
+            return
+        metrics.observe(f"ipc.{method}", (time.monotonic_ns() - received) / 1e6)
+        if request_id is not None:
+            self.send(socket, {
+                "jsonrpc": "2.0",
+                "id": request_id,
+                "result": result,
+                "received_ns": received,
+                "handled_ms": (time.monotonic_ns() - received) / 1e6,
+            })
+
+    def metrics(self, format="json"):
+        if format == "prometheus":
+            return metrics.to_prometheus()
+        if format != "json":
+            raise ValueError(f"unknown metrics format: {format}")
+        return metrics.snapshot()
+
+    def subscribe(self, socket, events):
+        unknown = set(events) - set(EVENT_TYPES)
+        if unknown:
+            raise ValueError(f"unknown events: {', '.join(sorted(unknown))}")
+        self.clients[socket] = set(events)
+        return sorted(events)
+
+    def push(self, kind, value):
+        now = time.monotonic_ns()
+        settled = {}
+        waiting = []
+        for socket, request_id, settled_by, received in self.pending:
+            if settled_by == kind:
+                settled.setdefault(socket, []).append({"id": request_id, "latency_ms": (now - received) / 1e6})
+            elif now - received < SETTLE_TIMEOUT_NS:
+                waiting.append((socket, request_id, settled_by, received))
+        self.pending = waiting
+
+        for socket, events in self.clients.items():
+            # A client always hears the event that settles its own command
+            if kind not in events and socket not in settled:
+                continue
+            params = {"type": kind, "value": value, "ts_ns": now}
+            if socket in settled:
+                params["settles"] = settled[socket]
+            self.send(socket, {"jsonrpc": "2.0", "method": "event", "params": params})
+
+    def error(self, request_id, code, message):
+        return {"jsonrpc": "2.0", "id": request_id, "error": {"code": code, "message": message}}
+
+    def send(self, socket, message):
+        socket.write(json.dumps(message).encode() + b"\n")
+        socket.flush()
@@ -0,0 +1,262 @@
+import os
+import math
+import sqlite3
+
+from PyQt6.QtCore import QStandardPaths
+
+from components.metadata import GAIN_FIELDS
+
+# Only used to pick candidates while walking folders, the container itself is sniffed on read
+AUDIO_EXTENSIONS = (".mp3", ".flac", ".ogg", ".oga", ".opus", ".m4a", ".mp4", ".wav")
+TAG_FIELDS = ("title", "artist", "album", "genre")
+TRACK_FIELDS = ("path", "duration") + TAG_FIELDS + ("cover_hash",) + GAIN_FIELDS + ("gain_source",)
+# Columns added after the first release, created on open for older databases
+ADDED_COLUMNS = {
+    "cover_hash": "TEXT",
+    "track_gain": "REAL",
+    "track_peak": "REAL",
+    "album_gain": "REAL",
+    "album_peak": "REAL",
+    # "tag" when the gains came from ReplayGain tags, "analysis" when measured here
+    "gain_source": "TEXT",
+    # Hash of the coded audio without tags, and the spectral fingerprint, see components/fingerprint.py
+    "audio_hash": "TEXT",
+    "fingerprint": "BLOB",
+}
+# ReplayGain 2.0 reference loudness in LUFS
+GAIN_REFERENCE = -18.0
+LOOKUP_BATCH = 500
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS tracks (
+    id INTEGER PRIMARY KEY,
+    path TEXT NOT NULL UNIQUE,
+    mtime INTEGER NOT NULL,
+    size INTEGER NOT NULL,
+    duration REAL,
+    title TEXT,
+    artist TEXT,
+    album TEXT,
+    genre TEXT,
+    cover_hash TEXT
+);
+-- Files that failed to parse, so a rescan skips them until they change
+CREATE TABLE IF NOT EXISTS failures (
+    path TEXT PRIMARY KEY,
+    mtime INTEGER NOT NULL,
+    size INTEGER NOT NULL,
+    error TEXT
+);
+CREATE TABLE IF NOT EXISTS roots (
+    path TEXT PRIMARY KEY
+);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+
+
+def default_library_path():
+    data_dir = QStandardPaths.writableLocation(QStandardPaths.StandardLocation.AppDataLocation)
+    os.makedirs(data_dir, exist_ok=True)
+    return os.path.join(data_dir, "library.sqlite3")
+
+
+def path_range(root):
+    # Every path below root sorts between "root/" and "root0" ("0" follows "/")
+    prefix = os.path.join(root, "")
+    return prefix, prefix[:-1] + chr(ord(prefix[-1]) + 1)
+
+
+class Library:
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self.connection = sqlite3.connect(db_path)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.connection.executescript(SCHEMA)
+        self.add_missing_columns()
+        self.connection.execute("CREATE INDEX IF NOT EXISTS tracks_audio_hash ON tracks (audio_hash)")
+
+    def add_missing_columns(self):
+        existing = {row[1] for row in self.connection.execute("PRAGMA table_info(tracks)")}
+        with self.connection:
+            for name, kind in ADDED_COLUMNS.items():
+                if name not in existing:
+                    self.connection.execute(f"ALTER TABLE tracks ADD COLUMN {name} {kind}")
+
+    def close(self):
+        self.connection.close()
+
+    def roots(self):
+        return [row[0] for row in self.connection.execute("SELECT path FROM roots ORDER BY path")]
+
+    def add_root(self, root):
+        with self.connection:
+            self.connection.execute("INSERT OR IGNORE INTO roots (path) VALUES (?)", (root,))
+
+    def get_meta(self, key, default=None):
+        row = self.connection.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return default if row is None else row[0]
+
+    def set_meta(self, key, value):
+        with self.connection:
+            if value is None:
+                self.connection.execute("DELETE FROM meta WHERE key = ?", (key,))
+            else:
+                self.connection.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, value))
+
+    def count(self):
+        return self.connection.execute("SELECT COUNT(*) FROM tracks").fetchone()[0]
+
+    def file_states(self, root):
+        low, high = path_range(root)
+        rows = self.connection.execute(
+            """SELECT path, mtime, size FROM tracks WHERE path >= ? AND path < ?
+               UNION ALL SELECT path, mtime, size FROM failures WHERE path >= ? AND path < ?""",
+            (low, high, low, high))
+        return {path: (mtime, size) for path, mtime, size in rows}
+
+    def track(self, path):
+        row = self.connection.execute(
+            f"SELECT {', '.join(TRACK_FIELDS)} FROM tracks WHERE path = ?", (path,)).fetchone()
+        if row is None:
+            return None
+        return dict(zip(TRACK_FIELDS, row))
+
+    def tracks(self, paths):
+        found = {}
+        for i in range(0, len(paths), LOOKUP_BATCH):
+            batch = paths[i:i + LOOKUP_BATCH]
+            rows = self.connection.execute(
+                f"SELECT {', '.join(TRACK_FIELDS)} FROM tracks WHERE path IN ({', '.join('?' * len(batch))})", batch)
+            for row in rows:
+                found[row[0]] = dict(zip(TRACK_FIELDS, row))
+        return found
+
+    def store(self, records):
+        with self.connection:
+            self.connection.executemany(
+                """INSERT INTO tracks (path, mtime, size, duration, title, artist, album, genre, cover_hash,
+                                      track_gain, track_peak, album_gain, album_peak, gain_source)
+                   VALUES (:path, :mtime, :size, :duration, :title, :artist, :album, :genre, :cover_hash,
+                           :track_gain, :track_peak, :album_gain, :album_peak, :gain_source)
+                   ON CONFLICT(path) DO UPDATE SET
+                       mtime = excluded.mtime, size = excluded.size, duration = excluded.duration,
+                       title = excluded.title, artist = excluded.artist,
+                       album = excluded.album, genre = excluded.genre,
+                       cover_hash = excluded.cover_hash,
+                       track_gain = excluded.track_gain, track_peak = excluded.track_peak,
+                       album_gain = excluded.album_gain, album_peak = excluded.album_peak,
+                       gain_source = excluded.gain_source,
+                       audio_hash = NULL, fingerprint = NULL""",
+                records)
+            self.connection.executemany("DELETE FROM failures WHERE path = :path", records)
+
+    def store_failures(self, failures):
+        # (path, mtime, size, error); a file that no longer parses also loses the tags read from it before
+        with self.connection:
+            self.connection.executemany("DELETE FROM tracks WHERE path = ?", ((path,) for path, *_ in failures))
+            self.connection.executemany(
+                "INSERT OR REPLACE INTO failures (path, mtime, size, error) VALUES (?, ?, ?, ?)", failures)
+
+    def remove(self, paths):
+        paths = list(paths)
+        with self.connection:
+            self.connection.executemany("DELETE FROM tracks WHERE path = ?", ((path,) for path in paths))
+            self.connection.executemany("DELETE FROM failures WHERE path = ?", ((path,) for path in paths))
+
+    def paths_without_gain(self):
+        return [row[0] for row in self.connection.execute("SELECT path FROM tracks WHERE track_gain IS NULL")]
+
+    def store_gains(self, results):
+        with self.connection:
+            self.connection.executemany(
+                """UPDATE tracks SET track_gain = :track_gain, track_peak = :track_peak, gain_source = 'analysis'
+                   WHERE path = :path""",
+                results)
+
+    def paths_without_audio_hash(self):
+        return [row[0] for row in self.connection.execute("SELECT path FROM tracks WHERE audio_hash IS NULL")]
+
+    def store_audio_hashes(self, results):
+        with self.connection:
+            self.connection.executemany("UPDATE tracks SET audio_hash = :audio_hash WHERE path = :path", results)
+
+    def paths_without_fingerprint(self):
+        return self.connection.execute("SELECT path, audio_hash FROM tracks WHERE fingerprint IS NULL").fetchall()
+
+    def fingerprints_by_hash(self, hashes):
+        found = {}
+        hashes = list(hashes)
+        for i in range(0, len(hashes), LOOKUP_BATCH):
+            batch = hashes[i:i + LOOKUP_BATCH]
+            rows = self.connection.execute(
+                f"""SELECT audio_hash, fingerprint FROM tracks
+                    WHERE fingerprint IS NOT NULL AND audio_hash IN ({', '.join('?' * len(batch))})""", batch)
+            found.update(rows)
+        return found
+
+    def store_fingerprints(self, results):
+        with self.connection:
+            self.connection.executemany("UPDATE tracks SET fingerprint = :fingerprint WHERE path = :path", results)
+
+    def fingerprints(self):
+        return self.connection.execute("SELECT path, duration, audio_hash, fingerprint FROM tracks").fetchall()
+
+    def update_album_gains(self, paths):
+        # Albums are told apart by name and folder, so same-named albums of different artists stay separate
+        groups = set()
+        for path, track in self.tracks(paths).items():
+            if track["album"] and track["album"] != "Unknown":
+                groups.add((track["album"], os.path.dirname(path)))
+        updated = []
+        for album, directory in groups:
+            low, high = path_range(directory)
+            rows = self.connection.execute(
+                """SELECT path, duration, track_gain, track_peak, gain_source FROM tracks
+                   WHERE album = ? AND path >= ? AND path < ? AND track_gain IS NOT NULL""",
+                (album, low, high)).fetchall()
+            # Only direct children of the folder belong to the album
+            rows = [row for row in rows if os.path.dirname(row[0]) == directory]
+            if not rows:
+                continue
+            weight = sum(max(duration or 0, 1e-3) for _, duration, _, _, _ in rows)
+            # Duration-weighted mean of the track loudness in the energy domain
+            energy = sum(max(duration or 0, 1e-3) * 10 ** ((GAIN_REFERENCE - gain) / 10)
+                         for _, duration, gain, _, _ in rows) / weight
+            album_gain = GAIN_REFERENCE - 10 * math.log10(energy)
+            album_peak = max((peak for _, _, _, peak, _ in rows if peak is not None), default=None)
+            # Album gains read from tags are left as the tagger wrote them
+            updated.extend((album_gain, album_peak, path) for path, _, _, _, source in rows if source == "analysis")
+        with self.connection:
+            self.connection.executemany("UPDATE tracks SET album_gain = ?, album_peak = ? WHERE path = ?", updated)
+        return [path for _, _, path in updated]
+
+    def albums(self):
+        # Grouped by name and folder like the album gains; untagged tracks are grouped by folder
+        albums = {}
+        rows = self.connection.execute("SELECT path, album, artist, cover_hash FROM tracks ORDER BY path")
+        for path, album, artist, cover_hash in rows:
+            directory = os.path.dirname(path)
+            album = album or "Unknown"
+            entry = albums.get((album, directory))
+            if entry is None:
+                entry = albums[(album, directory)] = {
+                    "album": album, "directory": directory, "artist": artist or "Unknown",
+                    "path": path, "cover_hash": cover_hash, "tracks": 0}
+            elif entry["artist"] != (artist or "Unknown"):
+                entry["artist"] = "Various Artists"
+            if entry["cover_hash"] is None and cover_hash:
+                entry["path"] = path
+                entry["cover_hash"] = cover_hash
+            entry["tracks"] += 1
+        return sorted(albums.values(), key=lambda entry: (entry["artist"].casefold(), entry["album"].casefold()))
+
+    def album_paths(self, album, directory):
+        low, high = path_range(directory)
+        rows = self.connection.execute(
+            """SELECT path FROM tracks WHERE COALESCE(album, 'Unknown') = ? AND path >= ? AND path < ?
+               ORDER BY path""", (album, low, high))
+        return [path for path, in rows if os.path.dirname(path) == directory]
@@ -0,0 +1,79 @@
+import os
+
+from PyQt6.QtCore import Qt, QObject, QRunnable, pyqtSignal
+from PyQt6.QtWidgets import QWidget, QVBoxLayout, QLineEdit, QListWidget, QListWidgetItem
+
+from components.library import Library
+from components.search_index import build_search_index
+
+
+class SearchIndexSignals(QObject):
+    ready = pyqtSignal(object)
+
+
+class SearchIndexTask(QRunnable):
+    def __init__(self, db_path):
+        super().__init__()
+        self.db_path = db_path
+        self.signals = SearchIndexSignals()
+
+    def run(self):
+        library = Library(self.db_path)
+        try:
+            index = build_search_index(library)
+        finally:
+            library.close()
+        self.signals.ready.emit(index)
+
+
+class LibrarySearch(QWidget):
+    trackActivated = pyqtSignal(str)
+
+    def __init__(self, library):
+        super().__init__()
+        self.library = library
+        self.index = None
+
+        layout = QVBoxLayout()
+        layout.setSpacing(5)
+        layout.setContentsMargins(10, 0, 10, 10)
+
+        self.searchEdit = QLineEdit()
+        self.searchEdit.setPlaceholderText("Loading library...")
+        self.searchEdit.setClearButtonEnabled(True)
+        self.searchEdit.setDisabled(True)
+        self.searchEdit.textChanged.connect(self.search)
+
+        self.resultList = QListWidget()
+        self.resultList.setUniformItemSizes(True)
+        self.resultList.itemActivated.connect(self.activate)
+
+        layout.addWidget(self.searchEdit)
+        layout.addWidget(self.resultList)
+        self.setLayout(layout)
+
+    def set_index(self, index):
+        self.index = index
+        self.searchEdit.setPlaceholderText(f"Search {len(index)} tracks")
+        self.searchEdit.setDisabled(False)
+        self.search(self.searchEdit.text())
+
+    def search(self, text):
+        self.resultList.clear()
+        if self.index is None or not text.strip():
+            return
+        paths = self.index.search(text)
+        tracks = self.library.tracks(paths)
+        for path in paths:
+            track = tracks.get(path)
+            if track is None:
+                label = os.path.basename(path)
+            else:
+                label = f"{track['title']} - {track['artist']} ({track['album']})"
+            item = QListWidgetItem(label)
+            item.setData(Qt.ItemDataRole.UserRole, path)
+            item.setToolTip(path)
+            self.resultList.addItem(item)
+
+    def activate(self, item):
+        self.trackActivated.emit(item.data(Qt.ItemDataRole.UserRole))
@@ -0,0 +1,271 @@
+import os
+import math
+import time
+import logging
+import threading
+
+import numpy as np
+from PyQt6.QtCore import QThread, pyqtSignal
+
+from components.audio_decode import iter_pcm
+from components.library import Library, GAIN_REFERENCE
+from components.instrumentation import metrics
+
+logger = logging.getLogger(__name__)
+
+# BS.1770 gating: 400 ms blocks with 75% overlap, so energies are collected per 100 ms step
+STEPS_PER_SECOND = 10
+STEPS_PER_BLOCK = 4
+ABSOLUTE_GATE = -70.0
+RELATIVE_GATE = -10.0
+# Transform size for filtering and oversampling; chunks are sized so no transform pads past it
+FFT_SIZE = 1 << 17
+# Seconds of K-weighting impulse response kept for the FIR approximation
+KERNEL_SECONDS = 0.1
+OVERSAMPLE = 4
+# Samples of context on each side of a chunk when oversampling for the true peak
+PEAK_CONTEXT = 32
+PROGRESS_INTERVAL = 0.25
+WRITE_BATCH = 100
+
+KERNELS = {}
+
+
+def biquad_impulse(b, a, x):
+    y = np.zeros_like(x)
+    x1 = x2 = y1 = y2 = 0.0
+    for i, sample in enumerate(x.tolist()):
+        value = b[0] * sample + b[1] * x1 + b[2] * x2 - a[1] * y1 - a[2] * y2
+        x2, x1 = x1, sample
+        y2, y1 = y1, value
+        y[i] = value
+    return y
+
+
+def k_weighting_kernel(rate):
+    # Impulse response of the BS.1770 pre-filter (high shelf) and RLB high-pass, coefficients for any rate
+    kernel = KERNELS.get(rate)
+    if kernel is not None:
+        return kernel
+    k = math.tan(math.pi * 1681.974450955533 / rate)
+    q = 0.7071752369554196
+    vh = 10 ** (3.999843853973347 / 20)
+    vb = vh ** 0.4996667741545416
+    a0 = 1 + k / q + k * k
+    shelf_b = ((vh + vb * k / q + k * k) / a0, 2 * (k * k - vh) / a0, (vh - vb * k / q + k * k) / a0)
+    shelf_a = (1.0, 2 * (k * k - 1) / a0, (1 - k / q + k * k) / a0)
+
+    k = math.tan(math.pi * 38.13547087602444 / rate)
+    q = 0.5003270373238773
+    a0 = 1 + k / q + k * k
+    highpass_b = (1.0, -2.0, 1.0)
+    highpass_a = (1.0, 2 * (k * k - 1) / a0, (1 - k / q + k * k) / a0)
+
+    impulse = np.zeros(int(rate * KERNEL_SECONDS))
+    impulse[0] = 1.0
+    kernel = biquad_impulse(highpass_b, highpass_a, biquad_impulse(shelf_b, shelf_a, impulse))
+    KERNELS[rate] = kernel
+    return kernel
+
+
+def block_loudness(mean_square):
+    with np.errstate(divide="ignore"):
+        return -0.691 + 10 * np.log10(mean_square)
+
+
+class LoudnessMeter:
+    def __init__(self, rate, channels):
+        self.rate = rate
+        self.channels = channels
+        self.step = rate // STEPS_PER_SECOND
+        self.kernel = k_weighting_kernel(rate)
+        self.chunk_frames = FFT_SIZE - len(self.kernel) + 1
+        self.spectrum = np.fft.rfft(self.kernel, FFT_SIZE)[:, None].astype(np.complex64)
+        self.tail = np.zeros((len(self.kernel) - 1, channels), np.float32)
+        self.pending = []
+        self.pending_frames = 0
+        self.carry = np.empty((0, channels), np.float32)
+        self.steps = []
+        self.history = np.empty((0, channels), np.float32)
+        self.peak = 0.0
+
+    def feed(self, samples):
+        self.pending.append(samples)
+        self.pending_frames += len(samples)
+        if self.pending_frames >= self.chunk_frames:
+            data = np.concatenate(self.pending)
+            whole = len(data) - len(data) % self.chunk_frames
+            for start in range(0, whole, self.chunk_frames):
+                self.process(data[start:start + self.chunk_frames])
+            self.pending = [data[whole:]]
+            self.pending_frames = len(data) - whole
+
+    def process(self, x):
+        self.measure_energy(self.k_weight(x))
+        self.measure_peak(x)
+
+    def k_weight(self, x):
+        # FFT overlap-add against the truncated impulse response of the two biquads
+        size = len(x) + len(self.kernel) - 1
+        y = np.fft.irfft(np.fft.rfft(x, FFT_SIZE, axis=0) * self.spectrum, FFT_SIZE, axis=0)[:size]
+        y[:len(self.tail)] += self.tail
+        self.tail = y[len(x):]
+        return y[:len(x)]
+
+    def measure_energy(self, y):
+        y = np.concatenate((self.carry, y))
+        whole = len(y) - len(y) % self.step
+        self.carry = y[whole:]
+        if whole:
+            self.steps.append(np.square(y[:whole]).reshape(-1, self.step * self.channels).sum(axis=1))
+
+    def measure_peak(self, x):
+        self.peak = max(self.peak, float(np.abs(x).max()))
+        # Band-limited 4x interpolation; the ends ring against the zero padding, so the outer context is dropped
+        padded = np.concatenate((self.history, x))
+        skip = PEAK_CONTEXT if len(self.history) else 0
+        upsampled = np.fft.irfft(np.fft.rfft(padded, FFT_SIZE, axis=0), FFT_SIZE * OVERSAMPLE, axis=0) * OVERSAMPLE
+        inner = upsampled[skip * OVERSAMPLE:(len(padded) - PEAK_CONTEXT) * OVERSAMPLE]
+        if len(inner):
+            self.peak = max(self.peak, float(np.abs(inner).max()))
+        self.history = padded[-2 * PEAK_CONTEXT:]
+
+    def finish(self):
+        if self.pending_frames:
+            self.process(np.concatenate(self.pending))
+            self.pending = []
+            self.pending_frames = 0
+        if not self.steps:
+            return None
+        steps = np.concatenate(self.steps)
+        if len(steps) < STEPS_PER_BLOCK:
+            blocks = np.array([steps.sum() / (len(steps) * self.step)])
+        else:
+            blocks = np.convolve(steps, np.ones(STEPS_PER_BLOCK), "valid") / (STEPS_PER_BLOCK * self.step)
+        loudness = block_loudness(blocks)
+        gated = blocks[loudness > ABSOLUTE_GATE]
+        if not len(gated):
+            return None
+        threshold = block_loudness(gated.mean()) + RELATIVE_GATE
+        gated = blocks[(loudness > ABSOLUTE_GATE) & (loudness > threshold)]
+        return float(block_loudness(gated.mean()))
+
+
+def analyze_file(path):
+    # Runs in the worker processes
+    meter = None
+    for samples, rate in iter_pcm(path, channels=None):
+        if meter is None:
+            meter = LoudnessMeter(rate, samples.shape[1])
+        meter.feed(samples)
+    loudness = meter.finish() if meter is not None else None
+    if loudness is None:
+        # Silence or nothing decoded: no gain rather than an absurd one
+        return {"path": path, "track_gain": 0.0, "track_peak": meter.peak if meter is not None else 0.0}
+    return {"path": path, "track_gain": GAIN_REFERENCE - loudness, "track_peak": meter.peak}
+
+
+def analyze_batch(paths):
+    results = []
+    failures = []
+    for path in paths:
+        try:
+            results.append(analyze_file(path))
+        except Exception as e:
+            failures.append((path, str(e)))
+    return results, failures
+
+
+class LoudnessScanner(QThread):
+    # done, total, files per second, eta in seconds
+    progress = pyqtSignal(int, int, float, float)
+    finished_analysis = pyqtSignal(object)
+    failed = pyqtSignal(str)
+    # Paths whose track or album gain changed
+    gainsChanged = pyqtSignal(object)
+
+    def __init__(self, db_path, workers=None, parent=None):
+        super().__init__(parent)
+        self.db_path = db_path
+        self.workers = workers or os.cpu_count() or 1
+        self.cancel_event = threading.Event()
+
+    def cancel(self):
+        self.cancel_event.set()
+
+    def is_cancelled(self):
+        return self.cancel_event.is_set()
+
+    def run(self):
+        library = Library(self.db_path)
+        try:
+            stats = self.analyze(library)
+        except Exception as e:
+            self.failed.emit(str(e))
+            return
+        finally:
+            library.close()
+        self.finished_analysis.emit(stats)
+
+    def analyze(self, library):
+        # Tracks with ReplayGain tags already have a gain and are not decoded
+        paths = library.paths_without_gain()
+        stats = {"analyzed": 0, "failed": 0, "cancelled": False}
+        if not paths:
+            return stats
+        total = len(paths)
+        done = 0
+        pending = []
+        started = time.monotonic()
+        last_report = 0.0
+
+        import multiprocessing
+        from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+
+        context = multiprocessing.get_context("spawn")
+        executor = ProcessPoolExecutor(max_workers=self.workers, mp_context=context)
+        try:
+            in_flight = set()
+            next_path = 0
+            while next_path < total or in_flight:
+                if self.is_cancelled():
+                    stats["cancelled"] = True
+                    break
+                # One file per task, decoding dominates and files vary a lot in length
+                while next_path < total and len(in_flight) < self.workers * 2:
+                    in_flight.add(executor.submit(analyze_batch, [paths[next_path]]))
+                    next_path += 1
+
+                completed, in_flight = wait(in_flight, timeout=PROGRESS_INTERVAL, return_when=FIRST_COMPLETED)
+                for future in completed:
+                    results, failures = future.result()
+                    for path, error in failures:
+                        logger.warning("Failed to analyze %s: %s", path, error)
+                    stats["analyzed"] += len(results)
+                    stats["failed"] += len(failures)
+                    metrics.count("loudness.analyzed", len(results))
+                    metrics.count("loudness.failed", len(failures))
+                    pending.extend(results)
+                    done += len(results) + len(failures)
+
+                if len(pending) >= WRITE_BATCH:
+                    self.store(library, pending)
+                    pending = []
+
+                now = time.monotonic()
+                if now - last_report >= PROGRESS_INTERVAL:
+                    rate = done / max(now - started, 1e-6)
+                    eta = (total - done) / rate if rate > 0 else -1.0
+                    self.progress.emit(done, total, rate, eta)
+                    last_report = now
+        finally:
+            executor.shutdown(wait=True, cancel_futures=True)
+            if pending:
+                self.store(library, pending)
+        return stats
+
+    def store(self, library, results):
+        library.store_gains(results)
+        paths = [result["path"] for result in results]
+        album_paths = library.update_album_gains(paths)
+        self.gainsChanged.emit(list(dict.fromkeys(paths + album_paths)))
@@ -0,0 +1,300 @@
+import base64
+import hashlib
+
+from components.instrumentation import metrics, span
+from components.file_io import open_for_tags
+
+# Enough for every container signature below, including the codec id in the first Ogg page
+HEADER_BYTES = 64
+FRONT_COVER = 3
+GAIN_FIELDS = ("track_gain", "track_peak", "album_gain", "album_peak")
+# Opus R128 gains are relative to -23 LUFS, ReplayGain to -18 LUFS
+R128_OFFSET = 5.0
+
+BACKENDS = []
+
+
+class UnsupportedFormat(ValueError):
+    pass
+
+
+def register_backend(name, sniff, reader):
+    BACKENDS.append((name, sniff, reader))
+
+
+def id3v2_size(header):
+    # Syncsafe size from the ID3v2 header, plus the header itself
+    size = 0
+    for byte in header[6:10]:
+        size = (size << 7) | (byte & 0x7F)
+    footer = 10 if header[5] & 0x10 else 0
+    return 10 + size + footer
+
+
+def read_header(file_name):
+    with open(file_name, "rb") as f:
+        return sniff_header(f)
+
+
+def sniff_header(f):
+    header = f.read(HEADER_BYTES)
+    # Some FLAC files carry a stray ID3v2 block in front of the stream marker
+    if header[:3] == b"ID3" and len(header) >= 10:
+        f.seek(id3v2_size(header))
+        inner = f.read(4)
+        if inner == b"fLaC":
+            header = inner + f.read(HEADER_BYTES - 4)
+    f.seek(0)
+    return header
+
+
+def detect_container(header):
+    for name, sniff, _ in BACKENDS:
+        if sniff(header):
+            return name
+    return None
+
+
+def is_audio_file(file_name):
+    try:
+        return detect_container(read_header(file_name)) is not None
+    except OSError:
+        return False
+
+
+def read_tags(file_name):
+    # The container is taken from the first bytes of the file, not from its extension
+    with span("tags.parse"), open_for_tags(file_name) as f:
+        header = sniff_header(f)
+        for name, sniff, reader in BACKENDS:
+            if sniff(header):
+                # Readers parse from the open file, mapped or fetched in ranges, never by path
+                info = reader(file_name, f)
+                info["container"] = name
+                metrics.count(f"tags.container.{name}")
+                return info
+    raise UnsupportedFormat(f"unrecognized audio container: {file_name}")
+
+
+def new_info(file_name, duration):
+    return {
+        "file_name": file_name,
+        "title": "Unknown",
+        "artist": "Unknown",
+        "album": "Unknown",
+        "genre": "Unknown",
+        "duration": duration,
+        "cover_hash": None,
+        "cover_data": None,
+        "track_gain": None,
+        "track_peak": None,
+        "album_gain": None,
+        "album_peak": None,
+    }
+
+
+def set_cover(info, data):
+    if data:
+        info["cover_hash"] = hashlib.md5(data).hexdigest()
+        info["cover_data"] = bytes(data)
+
+
+def parse_gain(value):
+    # "-6.52 dB" for gains, a plain float for peaks
+    try:
+        return float(str(value).strip().split()[0])
+    except (ValueError, IndexError):
+        return None
+
+
+def apply_replaygain(info, lookup):
+    for field in GAIN_FIELDS:
+        value = lookup(f"replaygain_{field}")
+        if value is not None:
+            info[field] = parse_gain(value)
+
+
+def first_value(tags, key):
+    values = tags.get(key) if tags is not None else None
+    if not values:
+        return "Unknown"
+    return str(values[0])
+
+
+# MP3 / ID3
+
+def sniff_mp3(header):
+    if header[:3] == b"ID3":
+        return True
+    # MPEG audio frame sync with a valid layer; ADTS AAC shares the sync but has layer 0
+    return len(header) >= 2 and header[0] == 0xFF and header[1] & 0xE0 == 0xE0 and header[1] & 0x06 != 0
+
+
+def text_frame(tags, frame_id):
+    frame = tags.get(frame_id)
+    if frame is None or not frame.text:
+        return "Unknown"
+    # Same value EasyID3 would hand back for "genre"
+    if frame_id == "TCON":
+        return frame.genres[0] if frame.genres else "Unknown"
+    return str(frame.text[0])
+
+
+def apply_id3(info, tags):
+    from mutagen.id3 import APIC
+
+    if not tags:
+        return
+    info["title"] = text_frame(tags, "TIT2")
+    info["artist"] = text_frame(tags, "TPE1")
+    info["album"] = text_frame(tags, "TALB")
+    info["genre"] = text_frame(tags, "TCON")
+    for tag in tags.values():
+        if isinstance(tag, APIC):
+            set_cover(info, tag.data)
+            break
+    replaygain = {frame.desc.lower(): frame.text[0] for frame in tags.getall("TXXX") if frame.text}
+    apply_replaygain(info, replaygain.get)
+
+
+def read_mp3(file_name, f):
+    # mutagen is imported on first use so it stays off the startup path
+    from mutagen.mp3 import MP3
+    from mutagen.id3 import ID3
+
+    # A single parse with the raw ID3 frames gives both the text fields and APIC
+    audio = MP3(f, ID3=ID3)
+    info = new_info(file_name, audio.info.length)
+    apply_id3(info, audio.tags)
+    return info
+
+
+# FLAC, Ogg Vorbis and Opus share Vorbis comments
+
+def apply_vorbis_comments(info, tags):
+    info["title"] = first_value(tags, "title")
+    info["artist"] = first_value(tags, "artist")
+    info["album"] = first_value(tags, "album")
+    info["genre"] = first_value(tags, "genre")
+    if tags is not None:
+        apply_replaygain(info, lambda key: (tags.get(key) or [None])[0])
+
+
+def pick_picture(pictures):
+    for picture in pictures:
+        if picture.type == FRONT_COVER:
+            return picture
+    return pictures[0] if pictures else None
+
+
+def sniff_flac(header):
+    return header[:4] == b"fLaC"
+
+
+def read_flac(file_name, f):
+    from mutagen.flac import FLAC
+
+    audio = FLAC(f)
+    info = new_info(file_name, audio.info.length)
+    apply_vorbis_comments(info, audio.tags)
+    picture = pick_picture(audio.pictures)
+    if picture is not None:
+        set_cover(info, picture.data)
+    return info
+
+
+def apply_ogg_picture(info, tags):
+    from mutagen.flac import Picture, error as FLACError
+
+    pictures = []
+    for value in (tags.get("metadata_block_picture") or []) if tags is not None else []:
+        try:
+            pictures.append(Picture(base64.b64decode(value)))
+        except (ValueError, FLACError):
+            continue
+    picture = pick_picture(pictures)
+    if picture is not None:
+        set_cover(info, picture.data)
+
+
+def sniff_ogg_vorbis(header):
+    return header[:4] == b"OggS" and header[28:35] == b"\x01vorbis"
+
+
+def read_ogg_vorbis(file_name, f):
+    from mutagen.oggvorbis import OggVorbis
+
+    audio = OggVorbis(f)
+    info = new_info(file_name, audio.info.length)
+    apply_vorbis_comments(info, audio.tags)
+    apply_ogg_picture(info, audio.tags)
+    return info
+
+
+def sniff_opus(header):
+    return header[:4] == b"OggS" and header[28:36] == b"OpusHead"
+
+
+def read_opus(file_name, f):
+    from mutagen.oggopus import OggOpus
+
+    audio = OggOpus(f)
+    info = new_info(file_name, audio.info.length)
+    apply_vorbis_comments(info, audio.tags)
+    apply_ogg_picture(info, audio.tags)
+    if audio.tags is not None:
+        for field, key in (("track_gain", "r128_track_gain"), ("album_gain", "r128_album_gain")):
+            values = audio.tags.get(key)
+            if info[field] is None and values:
+                # Q7.8 fixed point
+                gain = parse_gain(values[0])
+                info[field] = None if gain is None else gain / 256 + R128_OFFSET
+    return info
+
+
+# MP4 / M4A
+
+def sniff_mp4(header):
+    return header[4:8] == b"ftyp"
+
+
+def read_mp4(file_name, f):
+    from mutagen.mp4 import MP4
+
+    audio = MP4(f)
+    info = new_info(file_name, audio.info.length)
+    tags = audio.tags
+    if tags is not None:
+        info["title"] = first_value(tags, "\xa9nam")
+        info["artist"] = first_value(tags, "\xa9ART")
+        info["album"] = first_value(tags, "\xa9alb")
+        info["genre"] = first_value(tags, "\xa9gen")
+        covers = tags.get("covr")
+        if covers:
+            set_cover(info, covers[0])
+        freeform = {key.rsplit(":", 1)[-1].lower(): values for key, values in tags.items() if key.startswith("----:")}
+        apply_replaygain(info, lambda key: bytes(freeform[key][0]).decode("utf-8", "replace") if freeform.get(key) else None)
+    return info
+
+
+# WAV, tagged with an ID3 chunk when tagged at all
+
+def sniff_wav(header):
+    return header[:4] == b"RIFF" and header[8:12] == b"WAVE"
+
+
+def read_wav(file_name, f):
+    from mutagen.wave import WAVE
+
+    audio = WAVE(f)
+    info = new_info(file_name, audio.info.length)
+    apply_id3(info, audio.tags)
+    return info
+
+
+register_backend("mp3", sniff_mp3, read_mp3)
+register_backend("flac", sniff_flac, read_flac)
+register_backend("ogg-vorbis", sniff_ogg_vorbis, read_ogg_vorbis)
+register_backend("opus", sniff_opus, read_opus)
+register_backend("mp4", sniff_mp4, read_mp4)
+register_backend("wav", sniff_wav, read_wav)
@@ -0,0 +1,229 @@
+import time
+import logging
+import threading
+from collections import OrderedDict
+
+from PyQt6.QtCore import QObject, QRunnable, QThread, QThreadPool, QTimer, pyqtSignal
+
+from components.cover_cache import CoverCache
+from components.cover_store import CoverStore, COVER_SIZE
+from components.metadata import read_tags
+from components.instrumentation import metrics, span
+
+logger = logging.getLogger(__name__)
+
+# Upcoming tracks whose tags and cover are read while the current one plays
+PREFETCH_TRACKS = 3
+# Prefetching waits this long after a track change, so playback start has the disk to itself
+PREFETCH_DELAY_MS = 1500
+# Share of wall time prefetching may spend reading; it idles for the rest
+PREFETCH_DUTY = 0.25
+PREFETCH_CACHE_SIZE = 16
+
+
+def load_cover(data, cover_hash, cover_cache, cover_store, wanted=lambda: True):
+    if not data:
+        return None
+    with span("cover.extract", logger):
+        image = cover_cache.get(cover_hash)
+        if image is not None or not wanted():
+            metrics.count("cover.memory_hit" if image is not None else "cover.skipped")
+            return image
+        # Thumbnails on disk survive restarts, so decoding only happens once per unique cover
+        image = cover_store.load(cover_hash, COVER_SIZE)
+        if image is None:
+            metrics.count("cover.decoded")
+            image = cover_store.store(cover_hash, data).get(COVER_SIZE)
+        else:
+            metrics.count("cover.disk_hit")
+        if image is not None:
+            cover_cache.put(cover_hash, image)
+        return image
+
+
+def warm_covers(cover_hashes, cover_cache, cover_store):
+    for cover_hash in cover_hashes:
+        if cover_cache.get(cover_hash) is None:
+            image = cover_store.load(cover_hash, COVER_SIZE)
+            if image is not None:
+                cover_cache.put(cover_hash, image)
+
+
+class MetadataSignals(QObject):
+    finished = pyqtSignal(int, object)
+    failed = pyqtSignal(int, str, str)
+
+
+class MetadataTask(QRunnable):
+    def __init__(self, request_id, file_name, is_current, cover_cache, cover_store):
+        super().__init__()
+        self.request_id = request_id
+        self.file_name = file_name
+        self.is_current = is_current
+        self.cover_cache = cover_cache
+        self.cover_store = cover_store
+        self.signals = MetadataSignals()
+
+    def run(self):
+        # The user may have moved on while this task was queued
+        if not self.is_current(self.request_id):
+            return
+        try:
+            info = read_tags(self.file_name)
+            info["cover"] = load_cover(info.pop("cover_data"), info["cover_hash"], self.cover_cache,
+                                       self.cover_store, lambda: self.is_current(self.request_id))
+        except Exception as e:
+            self.signals.failed.emit(self.request_id, self.file_name, str(e))
+            return
+        self.signals.finished.emit(self.request_id, info)
+
+
+class PrefetchSignals(QObject):
+    # None when the track could not be read or the task was cancelled
+    finished = pyqtSignal(str, object)
+
+
+class PrefetchTask(QRunnable):
+    def __init__(self, file_name, cover_cache, cover_store):
+        super().__init__()
+        self.file_name = file_name
+        self.cover_cache = cover_cache
+        self.cover_store = cover_store
+        self.cancelled = threading.Event()
+        self.signals = PrefetchSignals()
+
+    def run(self):
+        info = None
+        if not self.cancelled.is_set():
+            try:
+                info = read_tags(self.file_name)
+                info["cover"] = load_cover(info.pop("cover_data"), info["cover_hash"], self.cover_cache,
+                                           self.cover_store, lambda: not self.cancelled.is_set())
+            except Exception as e:
+                # Failures surface when the track is actually played
+                logger.debug("Prefetch of %s failed: %s", self.file_name, e)
+                info = None
+        self.signals.finished.emit(self.file_name, None if self.cancelled.is_set() else info)
+
+
+class MetadataLoader(QObject):
+    loaded = pyqtSignal(object)
+    failed = pyqtSignal(str, str)
+
+    def __init__(self, parent=None, cover_cache=None, cover_store=None):
+        super().__init__(parent)
+        self.pool = QThreadPool(self)
+        self.pool.setMaxThreadCount(2)
+        self.request_id = 0
+        self.request_started = 0.0
+        self.loading = False
+        self.cover_cache = cover_cache if cover_cache is not None else CoverCache()
+        self.cover_store = cover_store if cover_store is not None else CoverStore()
+
+        # Upcoming tracks are read one at a time on a low priority thread, see prefetch
+        self.prefetch_pool = QThreadPool(self)
+        self.prefetch_pool.setMaxThreadCount(1)
+        self.prefetch_pool.setThreadPriority(QThread.Priority.LowPriority)
+        self.prefetch_timer = QTimer(self)
+        self.prefetch_timer.setSingleShot(True)
+        self.prefetch_timer.timeout.connect(self.start_prefetch)
+        self.prefetch_wanted = []
+        self.prefetch_task = None
+        self.prefetch_started = 0.0
+        self.prefetched = OrderedDict()
+        # Details known from elsewhere, such as a restored session; unlike prefetches they stay until used
+        self.seeded = {}
+
+    def load(self, file_name):
+        self.request_id += 1
+        self.request_started = time.perf_counter()
+        info = self.seeded.pop(file_name, None) or self.prefetched.pop(file_name, None)
+        if info is not None:
+            # Read ahead of time, shown before the next frame
+            metrics.count("metadata.prefetch_hit")
+            metrics.observe("metadata.load", (time.perf_counter() - self.request_started) * 1000)
+            self.loading = False
+            self.loaded.emit(info)
+            return
+        self.loading = True
+        task = MetadataTask(self.request_id, file_name, self.is_current, self.cover_cache, self.cover_store)
+        task.signals.finished.connect(self.on_finished)
+        task.signals.failed.connect(self.on_failed)
+        self.pool.start(task)
+
+    def is_current(self, request_id):
+        return request_id == self.request_id
+
+    def on_finished(self, request_id, info):
+        # Results for a track that has since been replaced are dropped
+        if self.is_current(request_id):
+            metrics.observe("metadata.load", (time.perf_counter() - self.request_started) * 1000)
+            self.loading_done()
+            self.loaded.emit(info)
+        else:
+            metrics.count("metadata.stale")
+
+    def on_failed(self, request_id, file_name, error):
+        metrics.count("metadata.failed")
+        if self.is_current(request_id):
+            self.loading_done()
+            self.failed.emit(file_name, error)
+
+    def loading_done(self):
+        self.loading = False
+        if self.prefetch_wanted and not self.prefetch_timer.isActive():
+            self.prefetch_timer.start(PREFETCH_DELAY_MS)
+
+    # Prefetching
+
+    def prefetch(self, paths):
+        # paths in the order they will play; anything else is dropped or cancelled
+        paths = list(dict.fromkeys(path for path in paths if path))
+        for path in list(self.prefetched):
+            if path not in paths:
+                del self.prefetched[path]
+        if self.prefetch_task is not None and self.prefetch_task.file_name not in paths:
+            self.prefetch_task.cancelled.set()
+            metrics.count("metadata.prefetch_cancelled")
+        running = self.prefetch_task.file_name if self.prefetch_task is not None else None
+        self.prefetch_wanted = [path for path in paths if path not in self.prefetched and path != running]
+        if self.prefetch_wanted:
+            self.prefetch_timer.start(PREFETCH_DELAY_MS)
+
+    def seed(self, file_name, info):
+        self.seeded[file_name] = info
+
+    def unseed(self, file_name):
+        self.seeded.pop(file_name, None)
+
+    def warm(self, cover_hashes):
+        # Loads covers shown recently from the disk store into memory, at prefetch priority
+        self.prefetch_pool.start(lambda: warm_covers(cover_hashes, self.cover_cache, self.cover_store))
+
+    def start_prefetch(self):
+        # The track being shown comes first; on_finished picks prefetching back up
+        if self.loading or self.prefetch_task is not None or not self.prefetch_wanted:
+            return
+        task = PrefetchTask(self.prefetch_wanted.pop(0), self.cover_cache, self.cover_store)
+        task.signals.finished.connect(self.on_prefetched)
+        self.prefetch_task = task
+        self.prefetch_started = time.perf_counter()
+        self.prefetch_pool.start(task)
+
+    def on_prefetched(self, file_name, info):
+        elapsed = time.perf_counter() - self.prefetch_started
+        self.prefetch_task = None
+        metrics.observe("metadata.prefetch", elapsed * 1000)
+        if info is not None:
+            self.prefetched[file_name] = info
+            while len(self.prefetched) > PREFETCH_CACHE_SIZE:
+                self.prefetched.popitem(last=False)
+        if self.prefetch_wanted:
+            # Keeps prefetch reads to PREFETCH_DUTY of the time, playback gets the rest
+            self.prefetch_timer.start(int(elapsed * 1000 * (1 / PREFETCH_DUTY - 1)))
+
+    def cancel_prefetch(self):
+        self.prefetch_wanted = []
+        self.prefetch_timer.stop()
+        if self.prefetch_task is not None:
+            self.prefetch_task.cancelled.set()
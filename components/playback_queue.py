@@ -0,0 +1,60 @@
+from PyQt6.QtCore import QObject, pyqtSignal
+
+
+class PlaybackQueue(QObject):
+    changed = pyqtSignal()
+    currentChanged = pyqtSignal(int)
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.paths = []
+        self.index = -1
+
+    def __len__(self):
+        return len(self.paths)
+
+    def replace(self, paths, index=0):
+        self.paths = list(paths)
+        self.index = index if self.paths else -1
+        self.changed.emit()
+        self.currentChanged.emit(self.index)
+
+    def extend(self, paths):
+        self.paths.extend(paths)
+        if self.index < 0 and self.paths:
+            self.index = 0
+            self.currentChanged.emit(self.index)
+        self.changed.emit()
+
+    def reorder(self, paths, index):
+        # Same tracks in a new order, the current track stays current
+        self.paths = paths
+        self.index = index
+        self.changed.emit()
+
+    def clear(self):
+        self.replace([])
+
+    def current(self):
+        if 0 <= self.index < len(self.paths):
+            return self.paths[self.index]
+        return None
+
+    def peek(self, offset=1):
+        index = self.index + offset
+        if 0 <= index < len(self.paths):
+            return self.paths[index]
+        return None
+
+    def set_index(self, index):
+        if not 0 <= index < len(self.paths):
+            return False
+        self.index = index
+        self.currentChanged.emit(self.index)
+        return True
+
+    def advance(self):
+        return self.set_index(self.index + 1)
+
+    def back(self):
+        return self.set_index(self.index - 1)
@@ -0,0 +1,260 @@
+import time
+import logging
+
+from PyQt6.QtCore import QObject, QSettings, pyqtSignal
+
+from components.playback_queue import PlaybackQueue
+from components.gapless_player import GaplessPlayer, NORMALIZATION_MODES, gain_factor
+from components.metadata import GAIN_FIELDS
+from components.instrumentation import metrics
+
+logger = logging.getLogger(__name__)
+# A seek has landed once the reported position is this close to the target
+SEEK_TOLERANCE_MS = 1000
+# "media" hands files to QMediaPlayer, "dsp" decodes them itself for crossfades and the equalizer
+ENGINES = ("media", "dsp")
+
+
+def state_name(state):
+    # QMediaPlayer.PlaybackState.PlayingState -> "playing"
+    if state is None:
+        return "stopped"
+    return state.name.removesuffix("State").lower()
+
+
+class PlayerEngine(QObject):
+    stateChanged = pyqtSignal(str)
+    trackChanged = pyqtSignal(str)
+    positionChanged = pyqtSignal(int)
+    durationChanged = pyqtSignal(int)
+    volumeChanged = pyqtSignal(float)
+    mutedChanged = pyqtSignal(bool)
+    queueChanged = pyqtSignal()
+
+    def __init__(self, library=None, parent=None):
+        super().__init__(parent)
+        self.library = library
+        # Queue edits go through the playlist when a GUI has one, see set_playlist
+        self.playlist = None
+
+        settings = QSettings()
+        # The next track is opened ahead of time for gapless transitions
+        self.queue = PlaybackQueue(self)
+        self.engine = settings.value("playback/engine", "media")
+        self.player = self.create_player(settings)
+        self.state = "stopped"
+        self.track = None
+        # Latency spans that end on a later position update
+        self.track_started = None
+        self.seek_started = None
+        self.seek_target = None
+
+        # ReplayGain from the library or the file's tags scales each player's output volume
+        self.normalization = settings.value("playback/normalization", "track")
+        self.preamp = settings.value("playback/preamp_db", 0.0, type=float)
+        self.gain_cache = {}
+        self.player.set_gain_provider(self.track_gain)
+        self.player.read_ahead = settings.value("playback/read_ahead", "auto")
+        # Off by default, it keeps a second decoder open for the whole track
+        self.prefetch_decoder = settings.value("playback/prefetch_decoder", False, type=bool)
+
+        self.queue.changed.connect(self.queueChanged)
+        self.queue.changed.connect(self.prefetch_next_decoder)
+        self.player.trackChanged.connect(self.on_track_changed)
+        self.player.playbackStateChanged.connect(self.on_state_changed)
+        self.player.positionChanged.connect(self.on_position_changed)
+        self.player.durationChanged.connect(self.durationChanged)
+        self.player.transitionMeasured.connect(lambda gap: metrics.observe("playback.transition_gap", gap))
+
+    def create_player(self, settings):
+        if self.engine == "dsp":
+            from components.dsp import parse_bands
+            from components.dsp_player import DspPlayer, DEFAULT_BUFFER_MS
+
+            try:
+                bands = parse_bands(settings.value("playback/equalizer", ""))
+            except ValueError as e:
+                logger.warning("Ignoring the equalizer setting: %s", e)
+                bands = []
+            return DspPlayer(self.queue, self, settings.value("playback/buffer_ms", DEFAULT_BUFFER_MS, type=int),
+                             settings.value("playback/crossfade_ms", 0, type=int), bands)
+        if self.engine not in ENGINES:
+            logger.warning("Unknown playback engine %s, using media", self.engine)
+            self.engine = "media"
+        return GaplessPlayer(self.queue, self)
+
+    def close(self):
+        self.player.close()
+
+    def set_playlist(self, playlist):
+        self.playlist = playlist
+
+    # Commands
+
+    def play(self):
+        if self.track is not None or self.queue.current() is not None:
+            self.player.play()
+
+    def pause(self):
+        self.player.pause()
+
+    def toggle(self):
+        if self.player.is_playing():
+            self.pause()
+        else:
+            self.play()
+
+    def stop(self):
+        self.player.stop()
+
+    def seek(self, position):
+        self.seek_started = time.perf_counter()
+        self.seek_target = int(position)
+        metrics.count("playback.seeks")
+        self.player.setPosition(int(position))
+
+    def set_volume(self, volume):
+        volume = min(max(float(volume), 0.0), 1.0)
+        if volume != self.player.volume:
+            self.player.setVolume(volume)
+            self.volumeChanged.emit(volume)
+
+    def set_muted(self, muted):
+        muted = bool(muted)
+        if muted != self.player.isMuted():
+            self.player.setMuted(muted)
+            self.mutedChanged.emit(muted)
+
+    def next(self):
+        self.player.next()
+
+    def previous(self):
+        self.player.previous()
+
+    def play_index(self, index):
+        if self.queue.set_index(int(index)):
+            self.player.play_current()
+            return True
+        return False
+
+    def play_files(self, paths):
+        if self.playlist is not None:
+            # The playlist resolves folders off the GUI thread and asks for playback once rows are in
+            self.playlist.clear()
+            self.playlist.enqueue(paths, play=True)
+            return
+        from components.playlist import expand_paths
+
+        self.queue.replace(list(expand_paths(paths)))
+        self.player.play_current()
+
+    def enqueue(self, paths):
+        # Start playing the first new row only if nothing is loaded; a paused track keeps its place
+        idle = self.queue.current() is None or self.state == "stopped"
+        if self.playlist is not None:
+            self.playlist.enqueue(paths, play=idle)
+            return
+        from components.playlist import expand_paths
+
+        start = len(self.queue)
+        self.queue.extend(list(expand_paths(paths)))
+        if idle and start < len(self.queue):
+            self.play_index(start)
+
+    def restore_session(self, paths, index, position=0, volume=None, muted=None):
+        if volume is not None:
+            self.set_volume(volume)
+        if muted is not None:
+            self.set_muted(muted)
+        if self.playlist is not None:
+            self.playlist.restore(paths, index)
+        else:
+            self.queue.replace(paths, index)
+        if self.queue.current() is not None:
+            self.player.load_current(position)
+            # Nothing is audible until the user resumes, that is not a start-up latency
+            self.track_started = None
+
+    def clear(self):
+        self.stop()
+        if self.playlist is not None:
+            self.playlist.clear()
+        else:
+            self.queue.clear()
+
+    def status(self):
+        return {
+            "state": self.state,
+            "track": self.track,
+            "position": self.player.position(),
+            "duration": self.player.duration(),
+            "volume": self.player.volume,
+            "muted": self.player.isMuted(),
+            "queue_index": self.queue.index,
+            "queue_length": len(self.queue),
+            "normalization": self.normalization,
+            "engine": self.engine,
+        }
+
+    def queue_paths(self):
+        return list(self.queue.paths)
+
+    def prefetch_next_decoder(self):
+        # Only once the current track is audible, so opening the next one never delays it
+        if self.prefetch_decoder and self.track_started is None and self.player.is_playing():
+            self.player.arm_next()
+
+    # Volume normalization
+
+    def track_gain(self, path):
+        gains = self.gain_cache.get(path)
+        if gains is None:
+            track = self.library.track(path) if self.library is not None else None
+            gains = {field: track[field] for field in GAIN_FIELDS} if track is not None else {}
+            self.gain_cache[path] = gains
+        return gain_factor(gains, self.normalization, self.preamp)
+
+    def gains_changed(self, paths):
+        for path in paths:
+            self.gain_cache.pop(path, None)
+        self.player.refresh_gains(set(paths))
+
+    def remember_gains(self, path, gains):
+        # Gains read from the file's own tags, used when the library knows none
+        known = self.gain_cache.get(path) or {}
+        if gains.get("track_gain") is not None and known.get("track_gain") is None:
+            self.gain_cache[path] = {field: gains.get(field) for field in GAIN_FIELDS}
+            self.player.refresh_gains({path})
+
+    def set_normalization(self, mode):
+        if mode not in NORMALIZATION_MODES:
+            raise ValueError(f"unknown normalization mode: {mode}")
+        self.normalization = mode
+        QSettings().setValue("playback/normalization", mode)
+        self.player.refresh_gains()
+
+    # Player signals
+
+    def on_track_changed(self, path):
+        self.track = path
+        self.track_started = time.perf_counter()
+        metrics.count("playback.tracks")
+        logger.info("Playing %s", path)
+        self.trackChanged.emit(path)
+
+    def on_position_changed(self, position):
+        now = time.perf_counter()
+        if self.track_started is not None and position > 0:
+            metrics.observe("playback.first_frame", (now - self.track_started) * 1000)
+            self.track_started = None
+            self.prefetch_next_decoder()
+        if self.seek_started is not None and abs(position - self.seek_target) <= SEEK_TOLERANCE_MS:
+            metrics.observe("playback.seek", (now - self.seek_started) * 1000)
+            self.seek_started = None
+        self.positionChanged.emit(position)
+
+    def on_state_changed(self, state):
+        name = state_name(state)
+        if name != self.state:
+            self.state = name
+            self.stateChanged.emit(name)
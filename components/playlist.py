@@ -0,0 +1,491 @@
+import os
+import bisect
+from array import array
+
+from PyQt6.QtCore import Qt, QAbstractTableModel, QModelIndex, QObject, QRunnable, QThreadPool, QTimer, QSize, pyqtSignal
+from PyQt6.QtGui import QFont
+from PyQt6.QtWidgets import QWidget, QVBoxLayout, QLineEdit, QTableView, QHeaderView, QAbstractItemView
+
+from components.library import Library, AUDIO_EXTENSIONS
+from components.metadata import read_tags, is_audio_file
+from components.scanner import iter_audio_files
+
+COLUMNS = ("Title", "Artist", "Album", "Duration")
+# Rows handed to the view per insert while a large drop is being resolved
+ENQUEUE_CHUNK = 1000
+ROW_HEIGHT = 22
+ICON_SIZE = 18
+FILTER_DELAY_MS = 200
+THUMBNAIL_FLUSH_MS = 50
+
+
+def expand_paths(paths):
+    for path in paths:
+        if os.path.isdir(path):
+            yield from sorted(file_path for file_path, _, _ in iter_audio_files(path))
+        elif path.lower().endswith(AUDIO_EXTENSIONS) or is_audio_file(path):
+            yield path
+
+
+def format_duration(seconds):
+    seconds = int(seconds)
+    return f"{seconds // 60}:{seconds % 60:02}"
+
+
+def resolve_rows(library, paths):
+    known = library.tracks(paths)
+    titles, artists, albums, durations, cover_hashes = [], [], [], array("d"), []
+    for path in paths:
+        track = known.get(path)
+        if track is None:
+            # Not indexed yet, read the tags here rather than on the GUI thread
+            try:
+                track = read_tags(path)
+            except Exception:
+                track = {"title": os.path.basename(path), "artist": "", "album": "", "duration": 0, "cover_hash": None}
+        titles.append(track["title"])
+        artists.append(track["artist"])
+        albums.append(track["album"])
+        durations.append(track["duration"] or 0)
+        cover_hashes.append(track["cover_hash"])
+    return titles, artists, albums, durations, cover_hashes
+
+
+class PlaylistSignals(QObject):
+    rowsReady = pyqtSignal(int, object, bool)
+    # generation, first row, columns, whether these are the last rows
+    rowsResolved = pyqtSignal(int, int, object, bool)
+    orderReady = pyqtSignal(int, object)
+    filterReady = pyqtSignal(int, str, object)
+
+
+class EnqueueTask(QRunnable):
+    def __init__(self, db_path, paths, generation, is_current, play):
+        super().__init__()
+        self.db_path = db_path
+        self.paths = paths
+        self.generation = generation
+        self.is_current = is_current
+        self.play = play
+        self.signals = PlaylistSignals()
+
+    def run(self):
+        library = Library(self.db_path)
+        try:
+            chunk = []
+            for path in expand_paths(self.paths):
+                chunk.append(path)
+                if len(chunk) >= ENQUEUE_CHUNK:
+                    if not self.emit_chunk(library, chunk):
+                        return
+                    chunk = []
+            if chunk:
+                self.emit_chunk(library, chunk)
+        finally:
+            library.close()
+
+    def emit_chunk(self, library, paths):
+        # A cleared playlist abandons whatever is still being resolved
+        if not self.is_current(self.generation):
+            return False
+        self.signals.rowsReady.emit(self.generation, (paths,) + resolve_rows(library, paths), self.play)
+        self.play = False
+        return True
+
+
+class ResolveTask(QRunnable):
+    # Fills in rows that are already in the playlist, e.g. a restored queue
+    def __init__(self, db_path, paths, generation, is_current):
+        super().__init__()
+        self.db_path = db_path
+        self.paths = paths
+        self.generation = generation
+        self.is_current = is_current
+        self.signals = PlaylistSignals()
+
+    def run(self):
+        library = Library(self.db_path)
+        try:
+            for start in range(0, len(self.paths), ENQUEUE_CHUNK):
+                if not self.is_current(self.generation):
+                    return
+                columns = resolve_rows(library, self.paths[start:start + ENQUEUE_CHUNK])
+                last = start + ENQUEUE_CHUNK >= len(self.paths)
+                self.signals.rowsResolved.emit(self.generation, start, columns, last)
+        finally:
+            library.close()
+
+
+class SortTask(QRunnable):
+    def __init__(self, revision, columns, current, column, order):
+        super().__init__()
+        self.revision = revision
+        self.columns = columns
+        self.current = current
+        self.column = column
+        self.order = order
+        self.signals = PlaylistSignals()
+
+    def run(self):
+        paths, titles, artists, albums, durations, cover_hashes = self.columns
+        if self.column == 3:
+            keys = durations
+        else:
+            keys = [value.casefold() for value in (titles, artists, albums)[self.column]]
+        permutation = sorted(range(len(paths)), key=keys.__getitem__,
+                             reverse=self.order == Qt.SortOrder.DescendingOrder)
+        columns = (
+            [paths[i] for i in permutation],
+            [titles[i] for i in permutation],
+            [artists[i] for i in permutation],
+            [albums[i] for i in permutation],
+            array("d", (durations[i] for i in permutation)),
+            [cover_hashes[i] for i in permutation],
+        )
+        # Where each old row ended up, used to keep the playing track current
+        moved = array("l", [0]) * len(permutation)
+        for new_row, old_row in enumerate(permutation):
+            moved[old_row] = new_row
+        self.signals.orderReady.emit(self.revision, (columns, moved))
+
+
+class FilterTask(QRunnable):
+    def __init__(self, revision, text, columns):
+        super().__init__()
+        self.revision = revision
+        self.text = text
+        self.columns = columns
+        self.signals = PlaylistSignals()
+
+    def run(self):
+        words = self.text.casefold().split()
+        titles, artists, albums = self.columns
+        rows = array("l")
+        for row, fields in enumerate(zip(titles, artists, albums)):
+            haystack = "\0".join(fields).casefold()
+            if all(word in haystack for word in words):
+                rows.append(row)
+        self.signals.filterReady.emit(self.revision, self.text, rows)
+
+
+class PlaylistModel(QAbstractTableModel):
+    playRequested = pyqtSignal(int)
+
+    def __init__(self, queue, db_path, thumbnails, parent=None):
+        super().__init__(parent)
+        self.queue = queue
+        self.db_path = db_path
+        self.thumbnails = thumbnails
+
+        # Column store, row i of every list belongs to queue.paths[i]
+        self.titles = []
+        self.artists = []
+        self.albums = []
+        self.durations = array("d")
+        self.cover_hashes = []
+        # Source rows shown while a filter is active, ascending
+        self.visible = None
+        self.filter_text = ""
+        self.sort_column = -1
+        self.sort_order = Qt.SortOrder.AscendingOrder
+        # Rows of a restored queue are still being filled in, sorting waits for them
+        self.resolving = False
+        self.sort_pending = False
+
+        # generation drops enqueue chunks after a clear, revision drops stale sort/filter results
+        self.generation = 0
+        self.revision = 0
+        self.current_row = -1
+
+        # Enqueues run one at a time so drops keep their order
+        self.enqueue_pool = QThreadPool(self)
+        self.enqueue_pool.setMaxThreadCount(1)
+        self.order_pool = QThreadPool(self)
+        self.order_pool.setMaxThreadCount(1)
+
+        self.thumbnails.thumbnailReady.connect(self.thumbnail_ready)
+        self.thumbnail_timer = QTimer(self)
+        self.thumbnail_timer.setSingleShot(True)
+        self.thumbnail_timer.setInterval(THUMBNAIL_FLUSH_MS)
+        self.thumbnail_timer.timeout.connect(self.refresh_thumbnails)
+
+        self.filter_timer = QTimer(self)
+        self.filter_timer.setSingleShot(True)
+        self.filter_timer.setInterval(FILTER_DELAY_MS)
+        self.filter_timer.timeout.connect(self.start_filter)
+
+        self.queue.currentChanged.connect(self.current_changed)
+
+    # Qt model interface
+
+    def rowCount(self, parent=QModelIndex()):
+        if parent.isValid():
+            return 0
+        return len(self.visible) if self.visible is not None else len(self.titles)
+
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(COLUMNS)
+
+    def headerData(self, section, orientation, role=Qt.ItemDataRole.DisplayRole):
+        if orientation == Qt.Orientation.Horizontal and role == Qt.ItemDataRole.DisplayRole:
+            return COLUMNS[section]
+        return None
+
+    def data(self, index, role=Qt.ItemDataRole.DisplayRole):
+        if not index.isValid():
+            return None
+        row = self.source_row(index.row())
+        column = index.column()
+        if role == Qt.ItemDataRole.DisplayRole:
+            if column == 0:
+                return self.titles[row]
+            if column == 1:
+                return self.artists[row]
+            if column == 2:
+                return self.albums[row]
+            return format_duration(self.durations[row])
+        if role == Qt.ItemDataRole.DecorationRole and column == 0:
+            return self.thumbnail(row)
+        if role == Qt.ItemDataRole.FontRole and row == self.queue.index:
+            font = QFont()
+            font.setBold(True)
+            return font
+        if role == Qt.ItemDataRole.TextAlignmentRole and column == 3:
+            return Qt.AlignmentFlag.AlignRight | Qt.AlignmentFlag.AlignVCenter
+        return None
+
+    def sort(self, column, order=Qt.SortOrder.AscendingOrder):
+        if column < 0 or not self.titles:
+            return
+        self.sort_column = column
+        self.sort_order = order
+        if self.resolving:
+            self.sort_pending = True
+            return
+        columns = (list(self.queue.paths), list(self.titles), list(self.artists), list(self.albums),
+                   array("d", self.durations), list(self.cover_hashes))
+        task = SortTask(self.revision, columns, self.queue.index, column, order)
+        task.signals.orderReady.connect(self.apply_order)
+        self.order_pool.start(task)
+
+    # Row mapping
+
+    def source_row(self, row):
+        return self.visible[row] if self.visible is not None else row
+
+    def view_row(self, source_row):
+        if self.visible is None:
+            return source_row if 0 <= source_row < len(self.titles) else -1
+        position = bisect.bisect_left(self.visible, source_row)
+        if position < len(self.visible) and self.visible[position] == source_row:
+            return position
+        return -1
+
+    # Editing
+
+    def is_current(self, generation):
+        return generation == self.generation
+
+    def enqueue(self, paths, play=False):
+        task = EnqueueTask(self.db_path, list(paths), self.generation, self.is_current, play)
+        task.signals.rowsReady.connect(self.append_rows)
+        self.enqueue_pool.start(task)
+
+    def append_rows(self, generation, columns, play):
+        if not self.is_current(generation):
+            return
+        paths, titles, artists, albums, durations, cover_hashes = columns
+        first = len(self.titles)
+        if self.visible is None:
+            self.beginInsertRows(QModelIndex(), first, first + len(paths) - 1)
+        self.titles.extend(titles)
+        self.artists.extend(artists)
+        self.albums.extend(albums)
+        self.durations.extend(durations)
+        self.cover_hashes.extend(cover_hashes)
+        self.revision += 1
+        self.queue.extend(paths)
+        if self.visible is None:
+            self.endInsertRows()
+        else:
+            self.filter_timer.start()
+        if play:
+            self.playRequested.emit(first)
+
+    def clear(self):
+        self.generation += 1
+        self.revision += 1
+        self.resolving = False
+        self.sort_pending = False
+        self.beginResetModel()
+        self.titles = []
+        self.artists = []
+        self.albums = []
+        self.durations = array("d")
+        self.cover_hashes = []
+        if self.visible is not None:
+            self.visible = array("l")
+        self.queue.clear()
+        self.endResetModel()
+
+    def restore(self, paths, index):
+        # File names show at once, the tags are filled in from the library in the background
+        self.generation += 1
+        self.revision += 1
+        self.beginResetModel()
+        self.titles = [os.path.basename(path) for path in paths]
+        self.artists = [""] * len(paths)
+        self.albums = [""] * len(paths)
+        self.durations = array("d", bytes(8 * len(paths)))
+        self.cover_hashes = [None] * len(paths)
+        if self.visible is not None:
+            self.visible = array("l")
+            self.filter_timer.start()
+        self.queue.replace(paths, index)
+        self.current_row = self.queue.index
+        self.endResetModel()
+        if not paths:
+            return
+        self.resolving = True
+        task = ResolveTask(self.db_path, list(paths), self.generation, self.is_current)
+        task.signals.rowsResolved.connect(self.fill_rows)
+        self.enqueue_pool.start(task)
+
+    def fill_rows(self, generation, start, columns, last):
+        if not self.is_current(generation):
+            return
+        titles, artists, albums, durations, cover_hashes = columns
+        end = start + len(titles)
+        self.titles[start:end] = titles
+        self.artists[start:end] = artists
+        self.albums[start:end] = albums
+        self.durations[start:end] = durations
+        self.cover_hashes[start:end] = cover_hashes
+        self.revision += 1
+        if self.visible is None:
+            self.dataChanged.emit(self.index(start, 0), self.index(end - 1, len(COLUMNS) - 1))
+        else:
+            self.filter_timer.start()
+        if last:
+            self.resolving = False
+            if self.sort_pending:
+                self.sort_pending = False
+                self.sort(self.sort_column, self.sort_order)
+
+    def cancel(self):
+        # Stops enqueues and fills still running, for shutdown
+        self.generation += 1
+        self.enqueue_pool.clear()
+        self.enqueue_pool.waitForDone()
+
+    def apply_order(self, revision, result):
+        if revision != self.revision:
+            # Rows changed while sorting, sort the current rows instead
+            self.sort(self.sort_column, self.sort_order)
+            return
+        columns, moved = result
+        paths, titles, artists, albums, durations, cover_hashes = columns
+        index = self.queue.index
+        self.beginResetModel()
+        self.titles = titles
+        self.artists = artists
+        self.albums = albums
+        self.durations = durations
+        self.cover_hashes = cover_hashes
+        self.revision += 1
+        self.queue.reorder(paths, moved[index] if 0 <= index < len(moved) else -1)
+        self.current_row = self.queue.index
+        self.endResetModel()
+        if self.filter_text:
+            self.start_filter()
+
+    def set_filter(self, text):
+        self.filter_text = text.strip()
+        if not self.filter_text:
+            self.filter_timer.stop()
+            self.beginResetModel()
+            self.visible = None
+            self.endResetModel()
+            return
+        self.filter_timer.start()
+
+    def start_filter(self):
+        if not self.filter_text:
+            return
+        task = FilterTask(self.revision, self.filter_text, (list(self.titles), list(self.artists), list(self.albums)))
+        task.signals.filterReady.connect(self.apply_filter)
+        self.order_pool.start(task)
+
+    def apply_filter(self, revision, text, rows):
+        if text != self.filter_text:
+            return
+        if revision != self.revision:
+            self.start_filter()
+            return
+        self.beginResetModel()
+        self.visible = rows
+        self.endResetModel()
+
+    def current_changed(self, index):
+        for source_row in (self.current_row, index):
+            row = self.view_row(source_row)
+            if row >= 0:
+                self.dataChanged.emit(self.index(row, 0), self.index(row, len(COLUMNS) - 1), [Qt.ItemDataRole.FontRole])
+        self.current_row = index
+
+    # Thumbnails, only requested for rows the view actually paints
+
+    def thumbnail(self, row):
+        return self.thumbnails.cover(self.cover_hashes[row], self.queue.paths[row], ICON_SIZE)
+
+    def thumbnail_ready(self, key, size):
+        # Covers arrive in bursts while scrolling, repaint once per burst
+        if size == ICON_SIZE and not self.thumbnail_timer.isActive():
+            self.thumbnail_timer.start()
+
+    def refresh_thumbnails(self):
+        rows = self.rowCount()
+        if rows:
+            self.dataChanged.emit(self.index(0, 0), self.index(rows - 1, 0), [Qt.ItemDataRole.DecorationRole])
+
+
+class PlaylistPanel(QWidget):
+    rowActivated = pyqtSignal(int)
+
+    def __init__(self, model):
+        super().__init__()
+        self.model = model
+        layout = QVBoxLayout()
+        layout.setSpacing(5)
+        layout.setContentsMargins(10, 0, 10, 10)
+
+        self.filterEdit = QLineEdit()
+        self.filterEdit.setPlaceholderText("Filter playlist")
+        self.filterEdit.setClearButtonEnabled(True)
+        self.filterEdit.textChanged.connect(model.set_filter)
+
+        self.tableView = QTableView()
+        self.tableView.setModel(model)
+        self.tableView.setSelectionBehavior(QAbstractItemView.SelectionBehavior.SelectRows)
+        self.tableView.setEditTriggers(QAbstractItemView.EditTrigger.NoEditTriggers)
+        self.tableView.setWordWrap(False)
+        self.tableView.setIconSize(QSize(ICON_SIZE, ICON_SIZE))
+        # Fixed row heights keep scrolling O(1) no matter how many rows there are
+        vertical_header = self.tableView.verticalHeader()
+        vertical_header.setSectionResizeMode(QHeaderView.ResizeMode.Fixed)
+        vertical_header.setDefaultSectionSize(ROW_HEIGHT)
+        vertical_header.hide()
+        horizontal_header = self.tableView.horizontalHeader()
+        horizontal_header.setSectionResizeMode(0, QHeaderView.ResizeMode.Stretch)
+        horizontal_header.setSectionResizeMode(3, QHeaderView.ResizeMode.Fixed)
+        horizontal_header.resizeSection(3, 60)
+        horizontal_header.setSortIndicator(-1, Qt.SortOrder.AscendingOrder)
+        self.tableView.setSortingEnabled(True)
+        self.tableView.doubleClicked.connect(self.activate)
+
+        layout.addWidget(self.filterEdit)
+        layout.addWidget(self.tableView)
+        self.setLayout(layout)
+
+    def activate(self, index):
+        self.rowActivated.emit(self.model.source_row(index.row()))
@@ -0,0 +1,132 @@
+import os
+import time
+import threading
+
+from PyQt6.QtCore import QIODevice
+
+from components.instrumentation import metrics
+
+# One read per chunk; the first one is all playback has to wait for
+CHUNK_SIZE = 256 * 1024
+# How far ahead of the decoder the reader thread stays
+READ_AHEAD_BYTES = 4 * 1024 * 1024
+# A read that waits longer than this gives up, the decoder treats it as an I/O error
+READ_TIMEOUT = 30.0
+
+
+class ReadAheadDevice(QIODevice):
+    # Serves the media player from chunks a background thread reads ahead of it,
+    # so a slow mount costs one round trip to start and none while playing
+    def __init__(self, file_name, parent=None, chunk_size=CHUNK_SIZE, read_ahead=READ_AHEAD_BYTES):
+        super().__init__(parent)
+        self.file_name = file_name
+        self.chunk_size = chunk_size
+        self.window = max(read_ahead // chunk_size, 1)
+        self.fd = None
+        self.file_size = 0
+        self.chunk_count = 0
+        self.chunks = {}
+        self.wanted = 0
+        self.error = None
+        self.closing = False
+        self.condition = threading.Condition()
+        self.thread = None
+
+    def open(self, mode=QIODevice.OpenModeFlag.ReadOnly):
+        if mode & QIODevice.OpenModeFlag.WriteOnly:
+            return False
+        try:
+            self.fd = os.open(self.file_name, os.O_RDONLY)
+        except OSError as e:
+            self.setErrorString(str(e))
+            return False
+        self.file_size = os.fstat(self.fd).st_size
+        self.chunk_count = -(-self.file_size // self.chunk_size)
+        self.closing = False
+        self.thread = threading.Thread(target=self.fill, name="read-ahead", daemon=True)
+        self.thread.start()
+        # Qt's own buffer would only copy what is already buffered here
+        return super().open(mode | QIODevice.OpenModeFlag.Unbuffered)
+
+    def close(self):
+        if self.thread is not None:
+            with self.condition:
+                self.closing = True
+                self.condition.notify_all()
+            self.thread.join()
+            self.thread = None
+        if self.fd is not None:
+            os.close(self.fd)
+            self.fd = None
+        self.chunks.clear()
+        super().close()
+
+    def isSequential(self):
+        return False
+
+    def size(self):
+        return self.file_size
+
+    def bytesAvailable(self):
+        return max(self.file_size - self.pos(), 0) + super().bytesAvailable()
+
+    def seek(self, position):
+        if not super().seek(position):
+            return False
+        with self.condition:
+            self.wanted = position // self.chunk_size
+            self.condition.notify_all()
+        return True
+
+    def readData(self, max_size):
+        position = self.pos()
+        if position >= self.file_size:
+            return b""
+        index, offset = divmod(position, self.chunk_size)
+        with self.condition:
+            if self.wanted != index:
+                self.wanted = index
+                self.condition.notify_all()
+            chunk = self.chunks.get(index)
+            if chunk is None:
+                metrics.count("io.read_ahead_stalls")
+                started = time.perf_counter()
+                self.condition.wait_for(
+                    lambda: index in self.chunks or self.error is not None or self.closing, READ_TIMEOUT)
+                metrics.observe("io.read_ahead_wait", (time.perf_counter() - started) * 1000)
+                chunk = self.chunks.get(index)
+        if chunk is None:
+            self.setErrorString(str(self.error) if self.error is not None else "read timed out")
+            return None
+        return chunk[offset:offset + max_size]
+
+    def writeData(self, data):
+        return -1
+
+    def next_missing(self):
+        for index in range(self.wanted, min(self.wanted + self.window, self.chunk_count)):
+            if index not in self.chunks:
+                return index
+        return None
+
+    def fill(self):
+        while True:
+            with self.condition:
+                self.condition.wait_for(lambda: self.closing or self.next_missing() is not None)
+                if self.closing:
+                    return
+                index = self.next_missing()
+            try:
+                data = os.pread(self.fd, self.chunk_size, index * self.chunk_size)
+            except OSError as e:
+                with self.condition:
+                    self.error = e
+                    self.condition.notify_all()
+                return
+            metrics.count("io.read_ahead_bytes", len(data))
+            with self.condition:
+                self.chunks[index] = data
+                # Keep one chunk behind the reader for short backward seeks
+                for stale in [i for i in self.chunks if i < self.wanted - 1 or i >= self.wanted + self.window]:
+                    del self.chunks[stale]
+                self.condition.notify_all()
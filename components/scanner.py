@@ -0,0 +1,226 @@
+import os
+import time
+import logging
+import threading
+
+from PyQt6.QtCore import QThread, pyqtSignal
+
+from components.library import Library, AUDIO_EXTENSIONS, TAG_FIELDS
+from components.metadata import read_tags, GAIN_FIELDS
+from components.instrumentation import metrics
+
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE = 64
+WRITE_BATCH = 500
+PROGRESS_INTERVAL = 0.25
+
+
+def iter_audio_files(root, unreadable=None):
+    # Iterative scandir walk; DirEntry.stat() reuses what the directory read returned where it can.
+    # Paths that could not be read are added to unreadable, their files are unknown rather than gone
+    stack = [root]
+    while stack:
+        directory = stack.pop()
+        try:
+            with os.scandir(directory) as entries:
+                for entry in entries:
+                    try:
+                        if entry.is_dir(follow_symlinks=False):
+                            stack.append(entry.path)
+                        elif entry.name.lower().endswith(AUDIO_EXTENSIONS):
+                            st = entry.stat()
+                            yield entry.path, st.st_mtime_ns, st.st_size
+                    except OSError:
+                        if unreadable is not None:
+                            unreadable.append(entry.path)
+        except OSError as e:
+            logger.warning("Could not read %s: %s", directory, e)
+            if unreadable is not None:
+                unreadable.append(directory)
+
+
+def under(path, directory):
+    return path == directory or path.startswith(directory.rstrip(os.sep) + os.sep)
+
+
+def read_record(path, mtime, size):
+    info = read_tags(path)
+    record = {field: info[field] for field in TAG_FIELDS}
+    record.update(path=path, mtime=mtime, size=size, duration=info["duration"], cover_hash=info["cover_hash"])
+    # ReplayGain tags spare the file a loudness analysis
+    record.update({field: info[field] for field in GAIN_FIELDS})
+    record["gain_source"] = "tag" if info["track_gain"] is not None else None
+    return record
+
+
+def parse_batch(batch):
+    # Runs in the worker processes
+    records = []
+    failures = []
+    for path, mtime, size in batch:
+        try:
+            records.append(read_record(path, mtime, size))
+        except Exception as e:
+            failures.append((path, mtime, size, str(e)))
+    return records, failures
+
+
+class LibraryScanner(QThread):
+    # phase, done, total, files per second, eta in seconds
+    progress = pyqtSignal(str, int, int, float, float)
+    finished_scan = pyqtSignal(object)
+    failed = pyqtSignal(str)
+    # Stored records and removed paths, for listeners that keep their own view of the library
+    tracksChanged = pyqtSignal(object, object)
+
+    def __init__(self, db_path, roots, workers=None, parent=None):
+        super().__init__(parent)
+        self.db_path = db_path
+        self.roots = [os.path.abspath(root) for root in roots]
+        self.workers = workers or os.cpu_count() or 1
+        self.cancel_event = threading.Event()
+
+    def cancel(self):
+        self.cancel_event.set()
+
+    def is_cancelled(self):
+        return self.cancel_event.is_set()
+
+    def run(self):
+        # sqlite connections stay on the thread that opened them
+        library = Library(self.db_path)
+        try:
+            stats = self.scan(library)
+        except Exception as e:
+            self.failed.emit(str(e))
+            return
+        finally:
+            library.close()
+        self.finished_scan.emit(stats)
+
+    def scan(self, library):
+        stats = {"seen": 0, "added": 0, "updated": 0, "unchanged": 0, "removed": 0, "failed": 0, "unreadable": 0,
+                 "cancelled": False}
+        # Left set until the scan completes so an interrupted scan is resumed on next start
+        library.set_meta("scan_pending", "1")
+
+        changed, removed = self.collect_changes(library, stats)
+        if self.is_cancelled():
+            stats["cancelled"] = True
+            return stats
+
+        if removed:
+            library.remove(removed)
+            stats["removed"] = len(removed)
+            self.tracksChanged.emit([], removed)
+
+        self.parse_changed(library, changed, stats)
+        if stats["cancelled"]:
+            return stats
+
+        library.set_meta("scan_pending", None)
+        return stats
+
+    def collect_changes(self, library, stats):
+        changed = []
+        removed = []
+        last_report = time.monotonic()
+        for root in self.roots:
+            # An unmounted or unreachable root would look empty and lose all of its tracks
+            try:
+                os.scandir(root).close()
+            except OSError as e:
+                logger.warning("Skipping library folder %s: %s", root, e)
+                stats["unreadable"] += 1
+                continue
+            known = library.file_states(root)
+            unreadable = []
+            for path, mtime, size in iter_audio_files(root, unreadable):
+                if self.is_cancelled():
+                    return changed, removed
+                stats["seen"] += 1
+                previous = known.pop(path, None)
+                # Unchanged files are settled by the stat alone, no tag parsing
+                if previous == (mtime, size):
+                    stats["unchanged"] += 1
+                else:
+                    changed.append((path, mtime, size, previous is None))
+                now = time.monotonic()
+                if now - last_report >= PROGRESS_INTERVAL:
+                    self.progress.emit("walk", stats["seen"], 0, 0.0, -1.0)
+                    last_report = now
+            # Whatever is left in known no longer exists on disk, unless it is below a folder that failed to read
+            stats["unreadable"] += len(unreadable)
+            removed.extend(path for path in known if not any(under(path, directory) for directory in unreadable))
+        return changed, removed
+
+    def parse_changed(self, library, changed, stats):
+        if not changed:
+            return
+        new_paths = {path for path, _, _, is_new in changed if is_new}
+        batches = [
+            [(path, mtime, size) for path, mtime, size, _ in changed[i:i + BATCH_SIZE]]
+            for i in range(0, len(changed), BATCH_SIZE)
+        ]
+        total = len(changed)
+        done = 0
+        pending_records = []
+        pending_failures = []
+        started = time.monotonic()
+        last_report = 0.0
+
+        import multiprocessing
+        from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+
+        # spawn keeps the workers clear of the Qt state in this process
+        context = multiprocessing.get_context("spawn")
+        executor = ProcessPoolExecutor(max_workers=self.workers, mp_context=context)
+        try:
+            in_flight = set()
+            next_batch = 0
+            while next_batch < len(batches) or in_flight:
+                if self.is_cancelled():
+                    stats["cancelled"] = True
+                    break
+                # Keep a bounded window of batches queued so cancellation stays quick
+                while next_batch < len(batches) and len(in_flight) < self.workers * 2:
+                    in_flight.add(executor.submit(parse_batch, batches[next_batch]))
+                    next_batch += 1
+
+                completed, in_flight = wait(in_flight, timeout=PROGRESS_INTERVAL, return_when=FIRST_COMPLETED)
+                for future in completed:
+                    records, failures = future.result()
+                    for path, _, _, error in failures:
+                        logger.warning("Failed to index %s: %s", path, error)
+                    for record in records:
+                        stats["added" if record["path"] in new_paths else "updated"] += 1
+                    stats["failed"] += len(failures)
+                    metrics.count("scan.parsed", len(records))
+                    metrics.count("scan.failed", len(failures))
+                    pending_records.extend(records)
+                    pending_failures.extend(failures)
+                    done += len(records) + len(failures)
+
+                # Stored in chunks so a cancelled scan keeps everything parsed so far
+                if len(pending_records) + len(pending_failures) >= WRITE_BATCH:
+                    self.store(library, pending_records, pending_failures, new_paths)
+                    pending_records = []
+                    pending_failures = []
+
+                now = time.monotonic()
+                if now - last_report >= PROGRESS_INTERVAL:
+                    rate = done / max(now - started, 1e-6)
+                    eta = (total - done) / rate if rate > 0 else -1.0
+                    self.progress.emit("parse", done, total, rate, eta)
+                    last_report = now
+        finally:
+            executor.shutdown(wait=True, cancel_futures=True)
+            if pending_records or pending_failures:
+                self.store(library, pending_records, pending_failures, new_paths)
+
+    def store(self, library, records, failures, new_paths):
+        library.store(records)
+        # Recorded with their stat, so they are only parsed again once they change
+        library.store_failures(failures)
+        self.tracksChanged.emit(records, [path for path, *_ in failures if path not in new_paths])
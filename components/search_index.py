@@ -0,0 +1,187 @@
+import heapq
+from array import array
+from collections import defaultdict
+from itertools import compress, repeat
+from operator import add
+
+SEARCH_FIELDS = ("title", "artist", "album", "genre")
+DEFAULT_LIMIT = 50
+# Postings are append-only; rebuild once this share of them points at removed or changed tracks
+COMPACT_RATIO = 0.5
+
+
+def normalize(text):
+    return " ".join((text or "").casefold().split())
+
+
+def index_keys(fields):
+    keys = set()
+    for field in fields:
+        for word in field.split():
+            # Word prefixes serve one and two character queries
+            keys.add("^" + word[:1])
+            keys.add("^" + word[:2])
+        padded = f" {field} "
+        for i in range(len(padded) - 2):
+            keys.add(padded[i:i + 3])
+    return keys
+
+
+def search_text(fields):
+    # Every word is preceded by a space, so " word" tests for a word start and "\0" keeps fields apart
+    return " " + " \0 ".join(fields)
+
+
+def needle(word):
+    return " " + word if len(word) < 3 else word
+
+
+def word_keys(word):
+    if len(word) < 3:
+        return ["^" + word]
+    return [word[i:i + 3] for i in range(len(word) - 2)]
+
+
+class SearchIndex:
+    def __init__(self):
+        self.ids = {}
+        self.keys = []
+        self.fields = []
+        self.texts = []
+        self.postings = defaultdict(lambda: array("l"))
+        self.posting_count = 0
+        self.stale = 0
+        # Bumped on every change so cached results are never reused across edits
+        self.version = 0
+        self.last_words = None
+        self.last_matches = None
+        self.last_version = -1
+
+    def __len__(self):
+        return len(self.ids)
+
+    def add(self, key, title, artist, album, genre):
+        fields = tuple(normalize(value) for value in (title, artist, album, genre))
+        doc = self.ids.get(key)
+        if doc is None:
+            doc = len(self.keys)
+            self.ids[key] = doc
+            self.keys.append(key)
+            self.fields.append(fields)
+            self.texts.append(search_text(fields))
+        else:
+            if self.fields[doc] == fields:
+                return
+            self.stale += len(index_keys(self.fields[doc]))
+            self.fields[doc] = fields
+            self.texts[doc] = search_text(fields)
+        for index_key in index_keys(fields):
+            self.postings[index_key].append(doc)
+            self.posting_count += 1
+        self.version += 1
+        self.maybe_compact()
+
+    def remove(self, key):
+        doc = self.ids.pop(key, None)
+        if doc is None:
+            return
+        self.stale += len(index_keys(self.fields[doc]))
+        self.fields[doc] = None
+        self.texts[doc] = ""
+        self.version += 1
+        self.maybe_compact()
+
+    def apply_changes(self, records, removed):
+        for key in removed:
+            self.remove(key)
+        for record in records:
+            self.add(record["path"], record["title"], record["artist"], record["album"], record["genre"])
+
+    def maybe_compact(self):
+        if self.posting_count and self.stale > self.posting_count * COMPACT_RATIO:
+            self.compact()
+
+    def compact(self):
+        entries = [(key, self.fields[doc]) for key, doc in self.ids.items()]
+        self.ids = {}
+        self.keys = []
+        self.fields = []
+        self.texts = []
+        self.postings = defaultdict(lambda: array("l"))
+        self.posting_count = 0
+        self.stale = 0
+        for key, fields in entries:
+            doc = len(self.keys)
+            self.ids[key] = doc
+            self.keys.append(key)
+            self.fields.append(fields)
+            self.texts.append(search_text(fields))
+            for index_key in index_keys(fields):
+                self.postings[index_key].append(doc)
+                self.posting_count += 1
+        self.version += 1
+
+    def search(self, query, limit=DEFAULT_LIMIT):
+        query = normalize(query)
+        words = query.split()
+        if not words:
+            return []
+
+        if self.last_matches is not None and self.last_version == self.version and self.extends_last(words):
+            # Typing one more character can only narrow the previous matches
+            candidates = self.last_matches
+        else:
+            candidates = self.candidates(words)
+
+        # Filtering and ranking stay inside map/compress so the per-document work runs in C
+        needles = [needle(word) for word in words]
+        matches = list(candidates)
+        for n in needles:
+            matches = list(compress(matches, map(str.__contains__, map(self.texts.__getitem__, matches), repeat(n))))
+        self.last_words = words
+        self.last_matches = matches
+        self.last_version = self.version
+
+        # Fields are laid out title, artist, album, genre, so an earlier hit is a better one
+        texts = list(map(self.texts.__getitem__, matches))
+        positions = repeat(0)
+        for n in needles:
+            positions = map(add, positions, map(str.find, texts, repeat(n)))
+        positions = list(positions)
+        if len(positions) > limit:
+            # Only documents at or below the limit-th best position need to be ordered
+            cutoff = heapq.nsmallest(limit, positions)[-1]
+            keep = list(map(cutoff.__ge__, positions))
+            positions = list(compress(positions, keep))
+            matches = list(compress(matches, keep))
+        ranked = sorted(zip(positions, matches))[:limit]
+        return [self.keys[doc] for _, doc in ranked]
+
+    def extends_last(self, words):
+        # Each previous word must still be a prefix of the word in the same position. Short words
+        # match word starts only, so growing one past two characters widens the match instead
+        if len(words) < len(self.last_words):
+            return False
+        return all(new.startswith(old) and (len(old) >= 3 or new == old)
+                   for old, new in zip(self.last_words, words))
+
+    def candidates(self, words):
+        # The rarest key across all query words bounds the work, the rest is checked per document
+        best = None
+        for word in words:
+            for index_key in word_keys(word):
+                posting = self.postings.get(index_key)
+                if posting is None:
+                    return []
+                if best is None or len(posting) < len(best):
+                    best = posting
+        # Postings only repeat a document after it was re-added with new tags
+        return best if self.stale == 0 else dict.fromkeys(best)
+
+
+def build_search_index(library):
+    index = SearchIndex()
+    rows = library.connection.execute(f"SELECT path, {', '.join(SEARCH_FIELDS)} FROM tracks")
+    for path, title, artist, album, genre in rows:
+        index.add(path, title, artist, album, genre)
+    return index
@@ -0,0 +1,179 @@
+import os
+import json
+import time
+import logging
+import tempfile
+
+from PyQt6.QtCore import QObject, QRunnable, QThreadPool, QTimer, QStandardPaths, pyqtSignal
+
+from components.instrumentation import metrics, span
+
+logger = logging.getLogger(__name__)
+
+SESSION_VERSION = 1
+# Written while the app runs too, so a crash loses at most this much
+SAVE_INTERVAL_MS = 30 * 1000
+# Small state and the queue live in separate files, the queue is only rewritten when it changed
+STATE_FILE = "session.json"
+QUEUE_FILE = "queue.json"
+
+
+def default_session_dir():
+    return QStandardPaths.writableLocation(QStandardPaths.StandardLocation.AppDataLocation)
+
+
+def write_atomic(path, data):
+    directory = os.path.dirname(path)
+    os.makedirs(directory, exist_ok=True)
+    fd, temp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+            f.flush()
+            # The rename only replaces the old session once the new one is on disk
+            os.fsync(f.fileno())
+        os.replace(temp_path, path)
+    except OSError:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+
+def read_json(path):
+    try:
+        with open(path, "rb") as f:
+            data = json.loads(f.read())
+    except FileNotFoundError:
+        return None
+    except (OSError, ValueError) as e:
+        logger.warning("Ignoring unreadable session file %s: %s", path, e)
+        return None
+    if not isinstance(data, dict) or data.get("version") != SESSION_VERSION:
+        return None
+    return data
+
+
+class SessionSignals(QObject):
+    loaded = pyqtSignal(object)
+
+
+class SessionLoadTask(QRunnable):
+    def __init__(self, directory):
+        super().__init__()
+        self.directory = directory
+        self.signals = SessionSignals()
+
+    def run(self):
+        with span("session.load"):
+            state = read_json(os.path.join(self.directory, STATE_FILE))
+            queue = read_json(os.path.join(self.directory, QUEUE_FILE)) if state is not None else None
+        if state is not None:
+            state["queue"] = queue["paths"] if queue is not None else []
+        self.signals.loaded.emit(state)
+
+
+class SessionWriteTask(QRunnable):
+    def __init__(self, directory, files):
+        super().__init__()
+        self.directory = directory
+        self.files = files
+
+    def run(self):
+        try:
+            with span("session.save"):
+                # The queue goes first: a state file never points into a queue that was not written
+                for name, content in self.files:
+                    write_atomic(os.path.join(self.directory, name), json.dumps(content).encode())
+        except (OSError, TypeError, ValueError) as e:
+            metrics.count("session.save_failed")
+            logger.warning("Could not save the session: %s", e)
+
+
+class SessionStore(QObject):
+    # The saved state with its "queue", or None when there is nothing to resume
+    loaded = pyqtSignal(object)
+
+    def __init__(self, engine, directory=None, parent=None):
+        super().__init__(parent)
+        self.engine = engine
+        self.directory = directory or default_session_dir()
+        # Extra JSON values saved with the state, e.g. what the window shows for the current track
+        self.extras = {}
+        self.last_state = None
+        self.queue_dirty = True
+        # False while the saved session is being read, so an early save cannot overwrite it
+        self.ready = True
+
+        # Writes happen one at a time and in order, off the GUI thread
+        self.pool = QThreadPool(self)
+        self.pool.setMaxThreadCount(1)
+        self.timer = QTimer(self)
+        self.timer.setInterval(SAVE_INTERVAL_MS)
+        self.timer.timeout.connect(self.save)
+        self.engine.queue.changed.connect(self.mark_queue_dirty)
+
+    def add_extra(self, name, getter):
+        self.extras[name] = getter
+
+    def mark_queue_dirty(self):
+        self.queue_dirty = True
+
+    def start(self):
+        self.timer.start()
+
+    def load(self):
+        self.ready = False
+        task = SessionLoadTask(self.directory)
+        task.signals.loaded.connect(self.on_loaded)
+        self.pool.start(task)
+
+    def on_loaded(self, state):
+        self.ready = True
+        self.loaded.emit(state)
+
+    def snapshot(self):
+        return {
+            "version": SESSION_VERSION,
+            "track": self.engine.queue.current(),
+            "index": self.engine.queue.index,
+            "position": self.engine.player.position(),
+            "volume": self.engine.player.volume,
+            "muted": self.engine.player.isMuted(),
+            "extras": {name: getter() for name, getter in self.extras.items()},
+        }
+
+    def save(self, wait=False):
+        if not self.ready:
+            return
+        # Only what changed since the last write is written; the snapshot itself is a couple of copies
+        state = self.snapshot()
+        files = []
+        if self.queue_dirty:
+            files.append((QUEUE_FILE, {"version": SESSION_VERSION, "paths": list(self.engine.queue.paths)}))
+            self.queue_dirty = False
+        if files or state != self.last_state:
+            self.last_state = state
+            files.append((STATE_FILE, dict(state, saved=time.time())))
+        if files:
+            metrics.count("session.saves")
+            self.pool.start(SessionWriteTask(self.directory, files))
+        if wait:
+            self.pool.waitForDone()
+
+    def restore(self, state):
+        # Anything played before the session came back wins over it
+        if state is None or len(self.engine.queue) or self.engine.track is not None:
+            return False
+        paths = state["queue"]
+        index = state.get("index", -1)
+        position = state.get("position", 0)
+        track = state.get("track")
+        if track is not None and not (0 <= index < len(paths) and paths[index] == track):
+            # Saved between a queue and a state write, find the track again
+            index = paths.index(track) if track in paths else -1
+            position = 0
+        self.engine.restore_session(paths, index, position, state.get("volume"), state.get("muted"))
+        # The restored queue is what is on disk already
+        self.queue_dirty = False
+        metrics.count("session.restored")
+        return True
@@ -1,5 +1,6 @@
 from PyQt6.QtWidgets import QSlider
-from PyQt6.QtCore import Qt
+from PyQt6.QtCore import Qt, QLineF
+from PyQt6.QtGui import QPainter, QPalette, QPen, QPixmap
 
 class CustomSlider(QSlider):
     def __init__(self, orientation, parent=None):
@@ -21,4 +22,61 @@ class CustomSlider(QSlider):
             event.ignore()
 
     def setScrollEnabled(self, enabled):
-        self.scroll_enabled = enabled
\ No newline at end of file
+        self.scroll_enabled = enabled
+
+class WaveformSlider(CustomSlider):
+    def __init__(self, orientation, parent=None):
+        super().__init__(orientation, parent)
+        self.peaks = None
+        # Both colourings are rendered once per size, a repaint only blits them
+        self.played_pixmap = None
+        self.unplayed_pixmap = None
+
+    def setPeaks(self, peaks):
+        self.peaks = peaks
+        self.played_pixmap = None
+        self.unplayed_pixmap = None
+        self.update()
+
+    def resizeEvent(self, event):
+        self.played_pixmap = None
+        self.unplayed_pixmap = None
+        super().resizeEvent(event)
+
+    def render_waveform(self, color):
+        import numpy as np
+
+        width, height = self.width(), self.height()
+        pixmap = QPixmap(width, height)
+        pixmap.fill(Qt.GlobalColor.transparent)
+        # One column per pixel, each folding the buckets it covers
+        starts = (np.arange(width) * len(self.peaks)) // width
+        mins = np.minimum.reduceat(self.peaks[:, 0], starts).astype(np.int32)
+        maxs = np.maximum.reduceat(self.peaks[:, 1], starts).astype(np.int32)
+        middle = height / 2
+        scale = (height / 2 - 1) / 127
+        lines = [QLineF(x + 0.5, middle - top * scale, x + 0.5, middle - bottom * scale - 1)
+                 for x, (bottom, top) in enumerate(zip(mins.tolist(), maxs.tolist()))]
+        painter = QPainter(pixmap)
+        painter.setPen(QPen(color, 1))
+        painter.drawLines(lines)
+        painter.end()
+        return pixmap
+
+    def paintEvent(self, event):
+        if self.peaks is None or self.width() <= 0:
+            super().paintEvent(event)
+            return
+        if self.played_pixmap is None:
+            palette = self.palette()
+            self.played_pixmap = self.render_waveform(palette.color(QPalette.ColorRole.Highlight))
+            self.unplayed_pixmap = self.render_waveform(palette.color(QPalette.ColorRole.Mid))
+
+        span = self.maximum() - self.minimum()
+        x = int(self.width() * (self.value() - self.minimum()) / span) if span > 0 else 0
+        painter = QPainter(self)
+        painter.drawPixmap(0, 0, self.unplayed_pixmap)
+        painter.drawPixmap(0, 0, self.played_pixmap, 0, 0, x, self.height())
+        painter.setPen(QPen(self.palette().color(QPalette.ColorRole.Text), 1))
+        painter.drawLine(x, 0, x, self.height())
+        painter.end()
@@ -0,0 +1,29 @@
+import time
+
+from components.instrumentation import metrics
+
+
+class StartupProfiler:
+    def __init__(self, enabled, started=None):
+        self.enabled = enabled
+        self.started = started if started is not None else time.perf_counter()
+        self.last = self.started
+        self.phases = []
+
+    def mark(self, phase):
+        if not self.enabled:
+            return
+        now = time.perf_counter()
+        self.phases.append((phase, (now - self.last) * 1000))
+        self.last = now
+
+    def report(self):
+        if not self.enabled:
+            return
+        for phase, elapsed in self.phases:
+            metrics.gauge(f"startup.{phase.replace(' ', '_')}_ms", round(elapsed, 1))
+        metrics.gauge("startup.total_ms", round((self.last - self.started) * 1000, 1))
+        print("Startup profile:")
+        for phase, elapsed in self.phases:
+            print(f"  {phase:<24}{elapsed:9.1f} ms")
+        print(f"  {'total':<24}{(self.last - self.started) * 1000:9.1f} ms")
@@ -0,0 +1,204 @@
+import time
+import logging
+from collections import OrderedDict
+
+from PyQt6.QtCore import Qt, QObject, QRunnable, QThreadPool, QBuffer, QByteArray, QIODevice, pyqtSignal
+from PyQt6.QtGui import QImageReader, QPixmap, QColor
+from PyQt6.QtWidgets import QLabel
+
+from components.cover_cache import CoverCache, pixmap_bytes
+from components.cover_store import COVER_SIZES, read_scaled, scale_cover
+from components.metadata import read_tags
+from components.instrumentation import metrics, span
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CACHE_BYTES = 64 * 1024 * 1024
+THUMBNAIL_THREADS = 2
+# Older requests than this are for items scrolled out of view long ago and are dropped
+MAX_PENDING = 256
+# Seconds before a cover that failed to load (I/O error, file being written) is tried again
+RETRY_FAILED_S = 30
+PLACEHOLDER_COLOR = "lightgray"
+
+
+def stored_size(size):
+    # The smallest thumbnail on disk that is still at least as large as wanted
+    return min((stored for stored in COVER_SIZES if stored >= size), default=max(COVER_SIZES))
+
+
+def decode_data(data, size):
+    buffer = QBuffer()
+    buffer.setData(QByteArray(data))
+    buffer.open(QIODevice.OpenModeFlag.ReadOnly)
+    return read_scaled(QImageReader(buffer), size)
+
+
+class ThumbnailSignals(QObject):
+    # key, size, image or None, and whether a later attempt may succeed
+    ready = pyqtSignal(str, int, object, bool)
+
+
+class ThumbnailTask(QRunnable):
+    def __init__(self, key, size, cover_hash, path, picture, cover_store):
+        super().__init__()
+        self.key = key
+        self.size = size
+        self.cover_hash = cover_hash
+        self.path = path
+        self.picture = picture
+        self.cover_store = cover_store
+        self.signals = ThumbnailSignals()
+
+    def run(self):
+        transient = False
+        try:
+            with span("thumbnail.decode"):
+                image = self.load()
+        except Exception as e:
+            logger.debug("Thumbnail of %s failed: %s", self.path or self.cover_hash, e)
+            image = None
+            transient = True
+        self.signals.ready.emit(self.key, self.size, image, transient)
+
+    def load(self):
+        if self.picture:
+            return read_scaled(QImageReader(self.path), self.size)
+        if self.cover_hash and self.cover_store is not None:
+            image = self.cover_store.load(self.cover_hash, stored_size(self.size), scaled_to=self.size)
+            if image is not None:
+                metrics.count("thumbnail.disk_hit")
+                return image
+        if not self.path:
+            return None
+        info = read_tags(self.path)
+        if not info["cover_data"]:
+            return None
+        metrics.count("thumbnail.extracted")
+        if self.cover_store is None:
+            return decode_data(info["cover_data"], self.size)
+        # Writes the stored sizes on the way, so the next request for this cover is a disk hit
+        image = self.cover_store.store(info["cover_hash"], info["cover_data"]).get(stored_size(self.size))
+        if image is not None and (image.width() > self.size or image.height() > self.size):
+            image = scale_cover(image, self.size)
+        return image
+
+
+class ThumbnailService(QObject):
+    # Shared by every widget that shows covers; pixmaps are kept per key (cover hash or file path) and size
+    thumbnailReady = pyqtSignal(str, int)
+
+    def __init__(self, cover_store=None, max_bytes=DEFAULT_CACHE_BYTES, parent=None):
+        super().__init__(parent)
+        self.cover_store = cover_store
+        self.cache = CoverCache(max_bytes, size_of=pixmap_bytes)
+        self.pool = QThreadPool(self)
+        self.pool.setMaxThreadCount(THUMBNAIL_THREADS)
+        self.pending = OrderedDict()
+        self.running = set()
+        # Key -> monotonic time until which it is not asked for again; inf for keys without a cover
+        self.missing = {}
+        self.placeholders = {}
+
+    def cover(self, cover_hash, path, size):
+        # The track's cover, the placeholder while it loads, None when the track has no cover
+        return self.request(cover_hash or path, size, cover_hash, path, False)
+
+    def picture(self, path, size):
+        # Same for an image file
+        return self.request(path, size, None, path, True)
+
+    def request(self, key, size, cover_hash, path, picture):
+        if not key or self.is_missing(key):
+            return None
+        pixmap = self.cache.get((key, size))
+        if pixmap is not None:
+            return pixmap
+        if (key, size) not in self.running:
+            self.pending[(key, size)] = (cover_hash, path, picture)
+            self.pending.move_to_end((key, size))
+            while len(self.pending) > MAX_PENDING:
+                self.pending.popitem(last=False)
+                metrics.count("thumbnail.dropped")
+            self.dispatch()
+        return self.placeholder(size)
+
+    def is_missing(self, key):
+        until = self.missing.get(key)
+        if until is None:
+            return False
+        if time.monotonic() < until:
+            return True
+        del self.missing[key]
+        return False
+
+    def forget_missing(self):
+        # After a rescan, covers may have been added to files that had none
+        self.missing.clear()
+
+    def dispatch(self):
+        # Newest first: while scrolling that is what is on screen now
+        while self.pending and len(self.running) < THUMBNAIL_THREADS:
+            (key, size), (cover_hash, path, picture) = self.pending.popitem(last=True)
+            task = ThumbnailTask(key, size, cover_hash, path, picture, self.cover_store)
+            task.signals.ready.connect(self.on_ready)
+            self.running.add((key, size))
+            self.pool.start(task)
+
+    def on_ready(self, key, size, image, transient):
+        self.running.discard((key, size))
+        if image is None:
+            if transient:
+                metrics.count("thumbnail.failed")
+            self.missing[key] = time.monotonic() + RETRY_FAILED_S if transient else float("inf")
+        else:
+            # Pixmaps can only be made on the GUI thread
+            self.cache.put((key, size), QPixmap.fromImage(image))
+        self.thumbnailReady.emit(key, size)
+        self.dispatch()
+
+    def from_image(self, key, size, image):
+        # Covers decoded elsewhere, like the metadata loader's, join the shared cache
+        pixmap = self.cache.get((key, size)) if key else None
+        if pixmap is None:
+            pixmap = QPixmap.fromImage(image)
+            if key:
+                self.cache.put((key, size), pixmap)
+        return pixmap
+
+    def placeholder(self, size):
+        pixmap = self.placeholders.get(size)
+        if pixmap is None:
+            pixmap = QPixmap(size, size)
+            pixmap.fill(QColor(PLACEHOLDER_COLOR))
+            self.placeholders[size] = pixmap
+        return pixmap
+
+    def cancel(self):
+        self.pending.clear()
+        self.pool.clear()
+
+
+class CoverLabel(QLabel):
+    # Shows a picture from the service and swaps it in once it has loaded
+    def __init__(self, thumbnails, size):
+        super().__init__()
+        self.thumbnails = thumbnails
+        self.cover_size = size
+        self.key = None
+        self.setMinimumSize(size, size)
+        self.setAlignment(Qt.AlignmentFlag.AlignCenter)
+        thumbnails.thumbnailReady.connect(self.thumbnail_ready)
+
+    def show_picture(self, path):
+        self.key = path
+        pixmap = self.thumbnails.picture(path, self.cover_size)
+        self.setPixmap(pixmap if pixmap is not None else self.thumbnails.placeholder(self.cover_size))
+
+    def show_pixmap(self, pixmap):
+        self.key = None
+        self.setPixmap(pixmap)
+
+    def thumbnail_ready(self, key, size):
+        if key == self.key and size == self.cover_size:
+            self.show_picture(key)
@@ -0,0 +1,71 @@
+from PyQt6.QtCore import QObject, QTimer, pyqtSignal
+
+# Upper bound on how often the position display repaints
+POSITION_REFRESH_MS = 250
+# Quiet time during a slider drag before the player is asked to seek
+SEEK_DEBOUNCE_MS = 150
+
+
+class PositionUpdateScheduler(QObject):
+    # Whole seconds, the only resolution the slider and labels show
+    positionDisplayed = pyqtSignal(int)
+
+    def __init__(self, parent=None, interval_ms=POSITION_REFRESH_MS):
+        super().__init__(parent)
+        self.displayed = None
+        self.pending = None
+        self.timer = QTimer(self)
+        self.timer.setSingleShot(True)
+        self.timer.setInterval(interval_ms)
+        self.timer.timeout.connect(self.flush)
+
+    def push(self, position):
+        second = position // 1000
+        if second == self.displayed:
+            self.pending = None
+            return
+        self.pending = second
+        # The first change after a quiet period is shown immediately, later ones wait for the timer
+        if not self.timer.isActive():
+            self.flush()
+
+    def flush(self):
+        if self.pending is None:
+            return
+        self.displayed = self.pending
+        self.pending = None
+        self.positionDisplayed.emit(self.displayed)
+        self.timer.start()
+
+    def reset(self):
+        self.displayed = None
+        self.pending = None
+        self.timer.stop()
+
+
+class SeekDebouncer(QObject):
+    seekRequested = pyqtSignal(int)
+
+    def __init__(self, parent=None, delay_ms=SEEK_DEBOUNCE_MS):
+        super().__init__(parent)
+        self.pending = None
+        self.timer = QTimer(self)
+        self.timer.setSingleShot(True)
+        self.timer.setInterval(delay_ms)
+        self.timer.timeout.connect(self.flush)
+
+    def moved(self, value):
+        self.pending = value
+        self.timer.start()
+
+    def released(self, value):
+        # The final position always lands, even if the drag ended inside the debounce window
+        self.timer.stop()
+        self.pending = None
+        self.seekRequested.emit(value)
+
+    def flush(self):
+        if self.pending is not None:
+            value = self.pending
+            self.pending = None
+            self.seekRequested.emit(value)
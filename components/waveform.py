@@ -0,0 +1,175 @@
+import os
+import tempfile
+import threading
+
+from PyQt6.QtCore import QObject, QRunnable, QThreadPool, QStandardPaths, pyqtSignal
+
+from components.instrumentation import metrics, span
+
+WAVEFORM_BUCKETS = 1024
+# Peaks are first collected at this many blocks per second, then folded into the final buckets
+BLOCKS_PER_SECOND = 100
+
+
+def default_waveform_dir():
+    cache_dir = QStandardPaths.writableLocation(QStandardPaths.StandardLocation.CacheLocation)
+    return os.path.join(cache_dir, "waveforms")
+
+
+def content_key(file_name):
+    # A hash over the coded audio only, as for exact duplicates: renames and retags keep the key, a re-encode changes it
+    from components.fingerprint import audio_hash
+
+    return audio_hash(file_name)
+
+
+class PeakReducer:
+    def __init__(self):
+        import numpy as np
+
+        self.block = None
+        self.carry = np.empty(0, np.float32)
+        self.mins = []
+        self.maxs = []
+
+    def feed(self, samples, rate):
+        import numpy as np
+
+        if self.block is None:
+            self.block = max(1, rate // BLOCKS_PER_SECOND)
+        samples = np.concatenate((self.carry, samples.reshape(-1)))
+        whole = len(samples) - len(samples) % self.block
+        self.carry = samples[whole:]
+        if whole:
+            blocks = samples[:whole].reshape(-1, self.block)
+            self.mins.append(blocks.min(axis=1))
+            self.maxs.append(blocks.max(axis=1))
+
+    def peaks(self, buckets=WAVEFORM_BUCKETS):
+        import numpy as np
+
+        if len(self.carry):
+            self.mins.append(self.carry.min(keepdims=True))
+            self.maxs.append(self.carry.max(keepdims=True))
+            self.carry = np.empty(0, np.float32)
+        if not self.mins:
+            return np.zeros((buckets, 2), np.int8)
+        mins = np.concatenate(self.mins)
+        maxs = np.concatenate(self.maxs)
+        # Short tracks have fewer blocks than buckets, those are stretched instead of folded
+        starts = (np.arange(buckets) * len(mins)) // buckets
+        peaks = np.empty((buckets, 2), np.float32)
+        peaks[:, 0] = np.minimum.reduceat(mins, starts)
+        peaks[:, 1] = np.maximum.reduceat(maxs, starts)
+        return np.round(np.clip(peaks, -1, 1) * 127).astype(np.int8)
+
+
+class WaveformStore:
+    def __init__(self, directory=None):
+        self.directory = directory or default_waveform_dir()
+        os.makedirs(self.directory, exist_ok=True)
+
+    def path(self, key):
+        return os.path.join(self.directory, key[:2], f"{key}.npy")
+
+    def load(self, key):
+        import numpy as np
+
+        try:
+            # Memory-mapped, the painter only touches the pages it draws
+            return np.load(self.path(key), mmap_mode="r")
+        except (OSError, ValueError):
+            return None
+
+    def store(self, key, peaks):
+        import numpy as np
+
+        path = self.path(key)
+        directory = os.path.dirname(path)
+        os.makedirs(directory, exist_ok=True)
+        fd, temp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                np.save(f, peaks)
+            os.replace(temp_path, path)
+        except OSError:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+
+
+class WaveformSignals(QObject):
+    finished = pyqtSignal(int, str, object)
+    failed = pyqtSignal(int, str, str)
+
+
+class WaveformTask(QRunnable):
+    def __init__(self, request_id, file_name, store, cancel_event):
+        super().__init__()
+        self.request_id = request_id
+        self.file_name = file_name
+        self.store = store
+        self.cancel_event = cancel_event
+        self.signals = WaveformSignals()
+
+    def run(self):
+        # numpy and the decoder are imported here, on the pool thread, to keep them off the startup path
+        from components.audio_decode import iter_pcm, DecodeCancelled
+
+        if self.cancel_event.is_set():
+            return
+        try:
+            key = content_key(self.file_name)
+            peaks = self.store.load(key)
+            if peaks is None:
+                with span("waveform.compute"):
+                    reducer = PeakReducer()
+                    for samples, rate in iter_pcm(self.file_name, self.cancel_event.is_set):
+                        reducer.feed(samples, rate)
+                    peaks = reducer.peaks()
+                    self.store.store(key, peaks)
+            else:
+                metrics.count("waveform.cache_hit")
+        except DecodeCancelled:
+            metrics.count("waveform.cancelled")
+            return
+        except Exception as e:
+            self.signals.failed.emit(self.request_id, self.file_name, str(e))
+            return
+        self.signals.finished.emit(self.request_id, self.file_name, peaks)
+
+
+class WaveformLoader(QObject):
+    loaded = pyqtSignal(str, object)
+    failed = pyqtSignal(str, str)
+
+    def __init__(self, parent=None, store=None):
+        super().__init__(parent)
+        # One decode at a time, a track change cancels the running one instead of queueing behind it
+        self.pool = QThreadPool(self)
+        self.pool.setMaxThreadCount(1)
+        self.request_id = 0
+        self.cancel_event = threading.Event()
+        self.store = store if store is not None else WaveformStore()
+
+    def load(self, file_name):
+        self.cancel()
+        self.request_id += 1
+        self.cancel_event = threading.Event()
+        task = WaveformTask(self.request_id, file_name, self.store, self.cancel_event)
+        task.signals.finished.connect(self.on_finished)
+        task.signals.failed.connect(self.on_failed)
+        self.pool.start(task)
+
+    def cancel(self):
+        self.cancel_event.set()
+
+    def is_current(self, request_id):
+        return request_id == self.request_id
+
+    def on_finished(self, request_id, file_name, peaks):
+        if self.is_current(request_id):
+            self.loaded.emit(file_name, peaks)
+
+    def on_failed(self, request_id, file_name, error):
+        if self.is_current(request_id):
+            self.failed.emit(file_name, error)
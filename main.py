@@ -1,25 +1,53 @@
 import sys
 import os
-import hashlib
-import tempfile
+import time
+import signal
+import logging
+import argparse
 
-from mutagen.mp3 import MP3
-from mutagen.easyid3 import EasyID3
-from mutagen.id3 import APIC, ID3
+# Taken before the remaining imports so --profile-startup can account for them
+STARTED = time.perf_counter()
 
-from PyQt6.QtMultimedia import QMediaPlayer, QAudioOutput
-from PyQt6.QtCore import Qt, QUrl
-from PyQt6.QtGui import QPixmap, QIcon, QAction, QDragEnterEvent, QDropEvent, QFont
-from PyQt6.QtWidgets import QApplication, QMainWindow, QWidget, QVBoxLayout, QHBoxLayout, QPushButton, QLabel, QFileDialog
+from PyQt6.QtCore import Qt, QTimer, QThreadPool, QSettings, QCoreApplication
+from PyQt6.QtGui import QAction, QActionGroup, QDragEnterEvent, QDropEvent, QFont
+from PyQt6.QtWidgets import QApplication, QMainWindow, QWidget, QVBoxLayout, QHBoxLayout, QPushButton, QLabel, QFileDialog, QTabWidget
 
 from components.about_dialog import AboutDialog
-from components.slider import CustomSlider
+from components.slider import CustomSlider, WaveformSlider
+from components.icons import icon
+from components.metadata_loader import MetadataLoader, PREFETCH_TRACKS
+from components.gapless_player import NORMALIZATION_MODES
+from components.player_engine import PlayerEngine
+from components.ipc_server import IpcServer, InstanceRunning, DEFAULT_SOCKET_NAME
+from components.update_scheduler import PositionUpdateScheduler, SeekDebouncer
+from components.playlist import PlaylistModel, PlaylistPanel
+from components.library_search import LibrarySearch, SearchIndexTask
+from components.album_grid import AlbumGrid
+from components.startup_profiler import StartupProfiler
+from components.cover_store import CoverStore, DEFAULT_MAX_BYTES, COVER_SIZE
+from components.thumbnails import ThumbnailService, CoverLabel, DEFAULT_CACHE_BYTES
+from components.library import Library, default_library_path
+from components.scanner import LibraryScanner
+from components.waveform import WaveformLoader
+from components.session import SessionStore
+from components.instrumentation import metrics, configure_logging
 
 ICON_PLAYBACK_START = "icons/media-playback-start.svg"
 ICON_PLAYBACK_STOP = "icons/media-playback-stop.svg"
 ICON_PLAYBACK_PAUSE = "icons/media-playback-pause.svg"
 ICON_VOLUME_HIGH = "icons/audio-volume-high.svg"
 ICON_VOLUME_MUTE = "icons/audio-volume-muted.svg"
+ICON_SKIP_BACKWARD = "icons/media-skip-backward.svg"
+ICON_SKIP_FORWARD = "icons/media-skip-forward.svg"
+PLACEHOLDER_IMAGE = "placeholder.png"
+
+PLAYLIST_WINDOW_HEIGHT = 650
+# Covers of this many recent tracks are loaded back into memory with a restored session
+WARM_COVERS = 32
+AUDIO_FILTER = "Audio Files (*.mp3 *.flac *.ogg *.oga *.opus *.m4a *.mp4 *.wav)"
+DEFAULT_METRICS_INTERVAL = 60
+
+logger = logging.getLogger("qt-music-player")
 
 
 class PlaybackDetail(QWidget):
@@ -63,7 +91,7 @@ class ProgressBar(QWidget):
 
         self.currentLabel = QLabel("--:--")
         self.totalLabel = QLabel("--:--")
-        self.playbackSlider = CustomSlider(Qt.Orientation.Horizontal)
+        self.playbackSlider = WaveformSlider(Qt.Orientation.Horizontal)
         self.playbackSlider.setRange(0, 100)
         self.playbackSlider.setDisabled(True)
 
@@ -84,8 +112,10 @@ class PlaybackControl(QWidget):
         media_button_layout = QHBoxLayout()
 
         # Button
+        self.button_previous = QPushButton()
         self.button_play_pause = QPushButton()
         self.button_stop = QPushButton()
+        self.button_next = QPushButton()
         self.button_mute = QPushButton()
 
         layout.setSpacing(5)
@@ -99,24 +129,32 @@ class PlaybackControl(QWidget):
         audio_volume_layout.setAlignment(Qt.AlignmentFlag.AlignRight)
         media_button_layout.setAlignment(Qt.AlignmentFlag.AlignLeft)
 
-        self.button_play_pause.setIcon(QIcon(ICON_PLAYBACK_START))
-        self.button_stop.setIcon(QIcon(ICON_PLAYBACK_STOP))
-        self.button_mute.setIcon(QIcon(ICON_VOLUME_HIGH))
+        self.button_previous.setIcon(icon(ICON_SKIP_BACKWARD))
+        self.button_play_pause.setIcon(icon(ICON_PLAYBACK_START))
+        self.button_stop.setIcon(icon(ICON_PLAYBACK_STOP))
+        self.button_next.setIcon(icon(ICON_SKIP_FORWARD))
+        self.button_mute.setIcon(icon(ICON_VOLUME_HIGH))
 
+        self.button_previous.setFixedSize(50, 50)
         self.button_play_pause.setFixedSize(50, 50)
         self.button_stop.setFixedSize(50, 50)
+        self.button_next.setFixedSize(50, 50)
         self.button_mute.setFixedSize(30, 30)
 
+        self.button_previous.setDisabled(True)
         self.button_play_pause.setDisabled(True)
         self.button_stop.setDisabled(True)
+        self.button_next.setDisabled(True)
 
         self.volume_slider = CustomSlider(Qt.Orientation.Horizontal)
         self.volume_slider.setRange(0, 100)
         self.volume_slider.setValue(100)
         self.volume_slider.setFixedWidth(100)
 
+        media_button_layout.addWidget(self.button_previous)
         media_button_layout.addWidget(self.button_play_pause)
         media_button_layout.addWidget(self.button_stop)
+        media_button_layout.addWidget(self.button_next)
 
         audio_volume_layout.addWidget(self.button_mute)
         audio_volume_layout.addWidget(self.volume_slider)
@@ -129,27 +167,27 @@ class PlaybackControl(QWidget):
 
 
 class albumCover(QWidget):
-    def __init__(self):
+    def __init__(self, thumbnails):
         super().__init__()
         layout = QVBoxLayout()
         layout.setSpacing(7)
         layout.setContentsMargins(0, 0, 0, 0)
         layout.setAlignment(Qt.AlignmentFlag.AlignCenter)
 
-        self.imageLabel = QLabel()
-        pixmap = QPixmap("placeholder.png")
-        pixmap = pixmap.scaled(250, 250, Qt.AspectRatioMode.KeepAspectRatio, Qt.TransformationMode.SmoothTransformation) 
-        self.imageLabel.setPixmap(pixmap)
-        self.imageLabel.setAlignment(Qt.AlignmentFlag.AlignCenter)
+        # The placeholder is loaded after the window is up, the label keeps its space until then
+        self.thumbnails = thumbnails
+        self.imageLabel = CoverLabel(thumbnails, COVER_SIZE)
 
         layout.addWidget(self.imageLabel)
 
         self.setLayout(layout)
 
-    def update(self, image_path):
-        pixmap = QPixmap(image_path)
-        pixmap = pixmap.scaled(250, 250, Qt.AspectRatioMode.KeepAspectRatio, Qt.TransformationMode.SmoothTransformation) 
-        self.imageLabel.setPixmap(pixmap)
+    def update(self, image=None, cover_hash=None):
+        # image arrives already decoded and scaled by the metadata loader
+        if image is None or image.isNull():
+            self.imageLabel.show_picture(PLACEHOLDER_IMAGE)
+        else:
+            self.imageLabel.show_pixmap(self.thumbnails.from_image(cover_hash, COVER_SIZE, image))
 
 class MainWindow(QMainWindow):
     def __init__(self):
@@ -159,14 +197,77 @@ class MainWindow(QMainWindow):
         self.setFixedSize(700, 300)
         self.setAcceptDrops(True)
 
-        # Initialize audio and player
-        self.player = QMediaPlayer()
-        self.audio = QAudioOutput()
-        self.player.setAudioOutput(self.audio)
+        # Persistent track index, only touched again when a scan is requested
+        self.library = Library(default_library_path())
+        self.library_scanner = None
+        self.loudness_scanner = None
+        self.duplicate_scanner = None
+        self.duplicates_dialog = None
+
+        # Playback lives in the engine, the window is one of its clients next to the IPC server
+        self.engine = PlayerEngine(self.library, self)
+        self.queue = self.engine.queue
+        self.player = self.engine.player
+        self.engine.trackChanged.connect(self.track_changed)
+        self.engine.stateChanged.connect(self.playback_state_changed)
+        self.engine.volumeChanged.connect(self.show_volume)
+        self.engine.mutedChanged.connect(self.show_muted)
+        self.player.transitionMeasured.connect(self.transition_measured)
+        self.ipc_server = None
+        self.diagnostics_dialog = None
+
+        # Position ticks only repaint when the shown second changes, drag seeks are debounced
+        self.position_scheduler = PositionUpdateScheduler(self)
+        self.position_scheduler.positionDisplayed.connect(self.show_position)
+        self.seek_debouncer = SeekDebouncer(self)
+        self.seek_debouncer.seekRequested.connect(self.seek)
+
+        # Scaled covers persist across sessions, the sweep runs in the background after startup
+        settings = QSettings()
+        cover_cache_mb = settings.value("cover_cache/max_mb", DEFAULT_MAX_BYTES // (1024 * 1024), type=int)
+        self.cover_store = CoverStore(max_bytes=cover_cache_mb * 1024 * 1024)
+        # Every cover on screen comes from one pixmap cache, decoded at the size it is shown
+        thumbnail_cache_mb = settings.value("cover_cache/thumbnail_mb", DEFAULT_CACHE_BYTES // (1024 * 1024), type=int)
+        self.thumbnails = ThumbnailService(self.cover_store, thumbnail_cache_mb * 1024 * 1024, self)
+
+        # Tags and cover art are read off the GUI thread
+        self.metadata_loader = MetadataLoader(self, cover_store=self.cover_store)
+        self.metadata_loader.loaded.connect(self.show_audio_info)
+        self.metadata_loader.failed.connect(self.show_audio_info_error)
+        # The next few tracks are read while the current one plays, so a track change shows them at once
+        self.prefetch_tracks = settings.value("playback/prefetch_tracks", PREFETCH_TRACKS, type=int)
+        self.queue.changed.connect(self.prefetch_upcoming)
+
+        # Waveform peaks are decoded in the background and cached on disk per file content
+        self.waveform_loader = WaveformLoader(self)
+        self.waveform_loader.loaded.connect(self.show_waveform)
+        self.waveform_loader.failed.connect(self.show_waveform_error)
+
+        # Playlist rows live in a column store next to the queue, the panel is shown on demand
+        self.playlist_model = PlaylistModel(self.queue, self.library.db_path, self.thumbnails, self)
+        self.playlist_model.playRequested.connect(self.play_row)
+        self.engine.set_playlist(self.playlist_model)
+
+        # Queue, position and volume survive a restart; the current track's details come back with them
+        self.current_info = None
+        self.session = SessionStore(self.engine, parent=self)
+        self.session.add_extra("track_info", self.session_track_info)
+        self.session.add_extra("warm_covers", lambda: self.metadata_loader.cover_cache.keys()[-WARM_COVERS:])
+        self.session.loaded.connect(self.restore_session)
+
+        # Playlist and search widgets are built the first time they are shown
+        self.lower_panel = None
+        self.playlist_panel = None
+        self.library_search = None
+        self.album_grid = None
+
+        # The search index is built on first use; pending collects scanner updates meanwhile
+        self.search_index = None
+        self.search_index_pending = None
 
         # Initialize widgets
         self.progress_bar = ProgressBar()
-        self.album_cover = albumCover()
+        self.album_cover = albumCover(self.thumbnails)
         self.playback_detail = PlaybackDetail()
         self.playback_control = PlaybackControl()
 
@@ -176,7 +277,6 @@ class MainWindow(QMainWindow):
         playbackControlLayout = QVBoxLayout()
 
         self.current_audio_file = None
-        self.temp_files = []
 
         # Setup menu bar and actions
         self.setup_menu_bar()
@@ -185,6 +285,8 @@ class MainWindow(QMainWindow):
         mainLayout.setContentsMargins(10, 20, 10, 20)
         self.playback_control.button_play_pause.clicked.connect(self.play_pause_audio)
         self.playback_control.button_stop.clicked.connect(self.stop_audio)
+        self.playback_control.button_previous.clicked.connect(self.engine.previous)
+        self.playback_control.button_next.clicked.connect(self.engine.next)
         self.playback_control.button_mute.clicked.connect(self.mute_audio)
         self.playback_control.volume_slider.valueChanged.connect(self.set_volume)
 
@@ -198,18 +300,28 @@ class MainWindow(QMainWindow):
         playbackControlLayout.addWidget(self.progress_bar)
         playbackControlLayout.addWidget(self.playback_control)
         self.progress_bar.playbackSlider.sliderMoved.connect(self.change_position)
-        self.player.positionChanged.connect(self.update_position)
-        self.player.durationChanged.connect(self.update_duration)
+        self.progress_bar.playbackSlider.sliderReleased.connect(self.finish_seek)
+        self.engine.positionChanged.connect(self.update_position)
+        self.engine.durationChanged.connect(self.update_duration)
 
         mainLayout.addLayout(playbackLayout, 1)
 
+        playerWidget = QWidget()
+        playerWidget.setLayout(mainLayout)
+
+        self.windowLayout = QVBoxLayout()
+        self.windowLayout.setSpacing(0)
+        self.windowLayout.setContentsMargins(0, 0, 0, 0)
+        self.windowLayout.addWidget(playerWidget)
+
         widget = QWidget()
-        widget.setLayout(mainLayout)
+        widget.setLayout(self.windowLayout)
         self.setCentralWidget(widget)
 
     def setup_menu_bar(self):
         menu = self.menuBar()
         file_menu = menu.addMenu("&File")
+        view_menu = menu.addMenu("&View")
         help_menu = menu.addMenu("&Help")
 
         button_open = QAction("&Open", self)
@@ -217,6 +329,32 @@ class MainWindow(QMainWindow):
         button_open.triggered.connect(self.load_audio)
         file_menu.addAction(button_open)
 
+        button_add_folder = QAction("Add &Folder to Library...", self)
+        button_add_folder.setStatusTip("Index a music folder")
+        button_add_folder.triggered.connect(self.add_library_folder)
+        file_menu.addAction(button_add_folder)
+
+        button_rescan = QAction("&Rescan Library", self)
+        button_rescan.setStatusTip("Pick up new and changed files in the library folders")
+        button_rescan.triggered.connect(self.rescan_library)
+        file_menu.addAction(button_rescan)
+
+        self.button_cancel_scan = QAction("&Cancel Library Scan", self)
+        self.button_cancel_scan.setStatusTip("Stop the running scan, it resumes on the next rescan")
+        self.button_cancel_scan.triggered.connect(self.cancel_library_scan)
+        self.button_cancel_scan.setDisabled(True)
+        file_menu.addAction(self.button_cancel_scan)
+
+        self.button_analyze_loudness = QAction("&Analyze Loudness", self)
+        self.button_analyze_loudness.setStatusTip("Measure the loudness of library tracks without ReplayGain tags")
+        self.button_analyze_loudness.triggered.connect(self.analyze_loudness)
+        file_menu.addAction(self.button_analyze_loudness)
+
+        self.button_find_duplicates = QAction("Find &Duplicates", self)
+        self.button_find_duplicates.setStatusTip("Find identical and near-identical recordings in the library")
+        self.button_find_duplicates.triggered.connect(self.find_duplicates)
+        file_menu.addAction(self.button_find_duplicates)
+
         file_menu.addSeparator()
 
         button_quit = QAction("&Quit", self)
@@ -224,148 +362,420 @@ class MainWindow(QMainWindow):
         button_quit.triggered.connect(self.close)
         file_menu.addAction(button_quit)
 
+        button_playlist = QAction("&Playlist and Search", self)
+        button_playlist.setStatusTip("Show or hide the playlist and library search")
+        button_playlist.setCheckable(True)
+        button_playlist.toggled.connect(self.toggle_playlist)
+        view_menu.addAction(button_playlist)
+
+        normalization_menu = view_menu.addMenu("Volume &Normalization")
+        normalization_group = QActionGroup(self)
+        for mode, label in zip(NORMALIZATION_MODES, ("&Off", "&Track Gain", "&Album Gain")):
+            action = QAction(label, self)
+            action.setCheckable(True)
+            action.setChecked(mode == self.engine.normalization)
+            action.triggered.connect(lambda checked, m=mode: self.engine.set_normalization(m))
+            normalization_group.addAction(action)
+            normalization_menu.addAction(action)
+
         button_about = QAction("&About", self)
         button_about.setStatusTip("About")
         button_about.triggered.connect(self.show_about_dialog)
         help_menu.addAction(button_about)
+
+        button_diagnostics = QAction("&Diagnostics", self)
+        button_diagnostics.setStatusTip("Show timings and counters of this session")
+        button_diagnostics.triggered.connect(self.show_diagnostics_dialog)
+        help_menu.addAction(button_diagnostics)
     
     def show_about_dialog(self):
         dialog = AboutDialog()
         dialog.exec()
+
+    def show_diagnostics_dialog(self):
+        if self.diagnostics_dialog is None:
+            from components.diagnostics_dialog import DiagnosticsDialog
+
+            self.diagnostics_dialog = DiagnosticsDialog(self)
+        self.diagnostics_dialog.show()
+        self.diagnostics_dialog.raise_()
     
-    def fetch_audio_info(self, file_name):
-        audio = MP3(file_name, ID3=EasyID3)
-        info_title = audio.get("title", ["Unknown"])[0]
-        info_artist = audio.get("artist", ["Unknown"])[0]
-        info_album = audio.get("album", ["Unknown"])[0]
-        info_genre = audio.get("genre", ["Unknown"])[0]
-
-        audio = MP3(file_name, ID3=ID3)
-        album_cover_path = None
-
-        for tag in audio.tags.values():
-            if isinstance(tag, APIC):
-                cover_hash = hashlib.md5(tag.data).hexdigest()
-                temp_dir = tempfile.gettempdir()
-                album_cover_path = os.path.join(temp_dir, f"{cover_hash}.jpg")
-
-                if not os.path.exists(album_cover_path):
-                    with open(album_cover_path, 'wb') as img:
-                        img.write(tag.data)
-                    self.temp_files.append(album_cover_path)
-                    print(self.temp_files)
-                    print("Created new album cover:", album_cover_path)
-                else:
-                    print("Using existing album cover:", album_cover_path)
-                break
-
-        print(album_cover_path)
-        if album_cover_path:
-            self.album_cover.update(album_cover_path)
-            self.playback_detail.update(info_title, info_artist, info_album)
+    def add_library_folder(self):
+        folder = QFileDialog.getExistingDirectory(self, "Add Folder to Library")
+        if folder:
+            self.library.add_root(os.path.abspath(folder))
+            self.rescan_library()
+
+    def rescan_library(self):
+        roots = self.library.roots()
+        if not roots or self.library_scanner is not None:
+            return
+        logger.info("Scanning library %s", roots)
+        self.library_scanner = LibraryScanner(self.library.db_path, roots, parent=self)
+        self.library_scanner.progress.connect(self.library_scan_progress)
+        self.library_scanner.finished_scan.connect(self.library_scan_finished)
+        self.library_scanner.failed.connect(self.library_scan_failed)
+        self.library_scanner.tracksChanged.connect(self.library_tracks_changed)
+        self.library_scanner.finished.connect(self.library_scanner_stopped)
+        self.library_scanner.start()
+        self.button_cancel_scan.setDisabled(False)
+        self.statusBar().showMessage("Scanning library...")
+
+    def finish_startup(self, restore=True):
+        # Work that used to run before the first paint
+        self.album_cover.update(None)
+        if restore and QSettings().value("session/restore", True, type=bool):
+            self.session.load()
+        self.session.start()
+        QThreadPool.globalInstance().start(self.cover_store.sweep)
+        self.resume_library_scan()
+
+    def session_track_info(self):
+        info = self.current_info
+        if info is None or info["file_name"] != self.queue.current():
+            return None
+        return {key: value for key, value in info.items() if key not in ("cover", "cover_data")}
+
+    def restore_session(self, state):
+        if state is None:
+            return
+        extras = state.get("extras") or {}
+        info = extras.get("track_info")
+        seeded = None
+        if info and info.get("file_name") == state.get("track"):
+            # Shown from the saved details and the cover store, without reading the file; restore loads
+            # the track right away, so the seed has to be in place before it
+            cover_hash = info.get("cover_hash")
+            seeded = info["file_name"]
+            self.metadata_loader.seed(seeded, dict(
+                info, cover=self.cover_store.load(cover_hash) if cover_hash else None))
+        if extras.get("warm_covers"):
+            self.metadata_loader.warm(extras["warm_covers"])
+        if self.session.restore(state):
+            logger.info("Restored session with %d queued tracks", len(self.queue))
+        elif seeded is not None:
+            # Saved details would otherwise stand in for the file the next time it is played
+            self.metadata_loader.unseed(seeded)
+
+    def resume_library_scan(self):
+        if self.library.get_meta("scan_pending"):
+            logger.info("Resuming interrupted library scan")
+            self.rescan_library()
+
+    def cancel_library_scan(self):
+        if self.library_scanner is not None:
+            logger.info("Cancelling library scan")
+            self.library_scanner.cancel()
+
+    def library_scan_progress(self, phase, done, total, rate, eta):
+        if phase == "walk":
+            self.statusBar().showMessage(f"Scanning library: {done} files checked")
         else:
-            self.album_cover.update("placeholder.png")
-            self.playback_detail.update(info_title, info_artist, info_album)
-
+            eta_text = f"{int(eta) // 60}:{int(eta) % 60:02}" if eta >= 0 else "--:--"
+            self.statusBar().showMessage(f"Reading tags: {done}/{total} files, {rate:.0f} files/s, ETA {eta_text}")
+
+    def library_scan_finished(self, stats):
+        logger.info("Library scan finished %s", stats)
+        state = "cancelled" if stats["cancelled"] else "done"
+        self.statusBar().showMessage(
+            f"Library scan {state}: {self.library.count()} tracks, {stats['added']} added, "
+            f"{stats['updated']} updated, {stats['removed']} removed"
+            + (f", {stats['unreadable']} folders unreadable" if stats["unreadable"] else ""), 5000)
+
+    def library_scan_failed(self, error):
+        logger.error("Library scan failed: %s", error)
+        self.statusBar().showMessage(f"Library scan failed: {error}", 5000)
+
+    def library_scanner_stopped(self):
+        self.library_scanner.deleteLater()
+        self.library_scanner = None
+        self.button_cancel_scan.setDisabled(True)
+
+    def analyze_loudness(self):
+        if self.loudness_scanner is not None:
+            return
+        # numpy comes with the analyzer, so it is only loaded once an analysis is asked for
+        from components.loudness import LoudnessScanner
+
+        logger.info("Analyzing loudness")
+        self.loudness_scanner = LoudnessScanner(self.library.db_path, parent=self)
+        self.loudness_scanner.progress.connect(self.loudness_progress)
+        self.loudness_scanner.finished_analysis.connect(self.loudness_finished)
+        self.loudness_scanner.failed.connect(self.loudness_failed)
+        self.loudness_scanner.gainsChanged.connect(self.engine.gains_changed)
+        self.loudness_scanner.finished.connect(self.loudness_scanner_stopped)
+        self.loudness_scanner.start()
+        self.button_analyze_loudness.setDisabled(True)
+
+    def loudness_progress(self, done, total, rate, eta):
+        eta_text = f"{int(eta) // 60}:{int(eta) % 60:02}" if eta >= 0 else "--:--"
+        self.statusBar().showMessage(f"Analyzing loudness: {done}/{total} files, {rate:.1f} files/s, ETA {eta_text}")
+
+    def loudness_finished(self, stats):
+        logger.info("Loudness analysis finished %s", stats)
+        self.statusBar().showMessage(f"Loudness analysis done: {stats['analyzed']} analyzed, {stats['failed']} failed", 5000)
+
+    def loudness_failed(self, error):
+        logger.error("Loudness analysis failed: %s", error)
+        self.statusBar().showMessage(f"Loudness analysis failed: {error}", 5000)
+
+    def loudness_scanner_stopped(self):
+        self.loudness_scanner.deleteLater()
+        self.loudness_scanner = None
+        self.button_analyze_loudness.setDisabled(False)
+
+    def find_duplicates(self):
+        if self.duplicate_scanner is not None:
+            return
+        # numpy and the fingerprinting code are only loaded once a search is requested
+        from components.fingerprint import DuplicateScanner
+
+        logger.info("Searching for duplicates")
+        self.duplicate_scanner = DuplicateScanner(self.library.db_path, parent=self)
+        self.duplicate_scanner.progress.connect(self.duplicates_progress)
+        self.duplicate_scanner.finished_search.connect(self.duplicates_finished)
+        self.duplicate_scanner.failed.connect(self.duplicates_failed)
+        self.duplicate_scanner.finished.connect(self.duplicate_scanner_stopped)
+        self.duplicate_scanner.start()
+        self.button_find_duplicates.setDisabled(True)
+
+    def duplicates_progress(self, phase, done, total, rate, eta):
+        eta_text = f"{int(eta) // 60}:{int(eta) % 60:02}" if eta >= 0 else "--:--"
+        label = "Hashing" if phase == "hash" else "Fingerprinting"
+        self.statusBar().showMessage(f"{label}: {done}/{total} files, {rate:.1f} files/s, ETA {eta_text}")
+
+    def duplicates_finished(self, stats):
+        groups = stats["groups"]
+        logger.info("Duplicate search finished: %d hashed, %d fingerprinted, %d failed, %d groups",
+                    stats["hashed"], stats["fingerprinted"], stats["failed"], len(groups))
+        if stats["cancelled"]:
+            self.statusBar().showMessage("Duplicate search cancelled", 5000)
+            return
+        self.statusBar().showMessage(f"Duplicate search done: {len(groups)} groups", 5000)
+        if self.duplicates_dialog is None:
+            from components.duplicates_dialog import DuplicatesDialog
+
+            self.duplicates_dialog = DuplicatesDialog(self)
+            self.duplicates_dialog.trackActivated.connect(lambda path: self.enqueue_files([path]))
+        self.duplicates_dialog.set_groups(groups)
+        self.duplicates_dialog.show()
+        self.duplicates_dialog.raise_()
+
+    def duplicates_failed(self, error):
+        logger.error("Duplicate search failed: %s", error)
+        self.statusBar().showMessage(f"Duplicate search failed: {error}", 5000)
+
+    def duplicate_scanner_stopped(self):
+        self.duplicate_scanner.deleteLater()
+        self.duplicate_scanner = None
+        self.button_find_duplicates.setDisabled(False)
+
+    def start_ipc_server(self, name=DEFAULT_SOCKET_NAME):
+        server = IpcServer(self.engine, name, self)
+        try:
+            logger.info("Listening for commands on %s", server.listen())
+        except InstanceRunning as e:
+            # The running instance keeps its commands, this window just plays
+            logger.warning("Not accepting IPC commands: %s", e)
+            self.statusBar().showMessage(f"Not accepting IPC commands: {e}", 5000)
+            server.deleteLater()
+            return
+        self.ipc_server = server
+
+    def show_audio_info(self, info):
+        self.current_info = info
+        self.album_cover.update(info["cover"], info["cover_hash"])
+        self.playback_detail.update(info["title"], info["artist"], info["album"])
+        # Files outside the library still get their ReplayGain tags applied
+        self.engine.remember_gains(info["file_name"], info)
+
+    def show_audio_info_error(self, file_name, error):
+        logger.warning("Failed to read tags from %s: %s", file_name, error)
+        self.current_info = None
+        self.album_cover.update(None)
+        self.playback_detail.update("Unknown", "Unknown", "Unknown")
 
     def load_audio(self, file_name=None):
         if not file_name:
-            # wav and ogg is not supported yet
-            # file_name, _ = QFileDialog.getOpenFileName(self, "Open Audio File", "", "Audio Files (*.mp3 *.wav *.ogg)")
-            file_name, _ = QFileDialog.getOpenFileName(self, "Open Audio File", "", "Audio Files (*.mp3)")
+            file_name, _ = QFileDialog.getOpenFileName(self, "Open Audio File", "", AUDIO_FILTER)
         if file_name:
-            self.current_audio_file = file_name
-            self.player.setSource(QUrl.fromLocalFile(file_name))
-            print("Loading", file_name)
-            self.fetch_audio_info(file_name)
-            # audio = MP3(file_name, ID3=EasyID3)
-            # info_title = audio.get("title", ["Unknown"])[0]
-            # info_artist = audio.get("artist", ["Unknown"])[0]
-            # info_album = audio.get("album", ["Unknown"])[0]
-            # info_genre = audio.get("genre", ["Unknown"])[0]
-
-            # audio = MP3(file_name, ID3=ID3)
-            # album_cover_path = None
-
-            # for tag in audio.tags.values():
-            #     if isinstance(tag, APIC):
-            #         cover_hash = hashlib.md5(tag.data).hexdigest()
-            #         temp_dir = tempfile.gettempdir()
-            #         album_cover_path = os.path.join(temp_dir, f"{cover_hash}.jpg")
-
-            #         if not os.path.exists(album_cover_path):
-            #             with open(album_cover_path, 'wb') as img:
-            #                 img.write(tag.data)
-            #             self.temp_files.append(album_cover_path)
-            #             print(self.temp_files)
-            #             print("Created new album cover:", album_cover_path)
-            #         else:
-            #             print("Using existing album cover:", album_cover_path)
-            #         break
-            
-            # print(album_cover_path)
-            # if album_cover_path:
-            #     self.album_cover.update(album_cover_path)
-            #     self.playback_detail.update(info_title, info_artist, info_album)
-            # else:
-            #     self.album_cover.update("placeholder.png")
-            #     self.playback_detail.update(info_title, info_artist, info_album)
-
-
-            self.playback_control.button_play_pause.setDisabled(False)
-            self.playback_control.button_stop.setDisabled(False)
-            self.progress_bar.playbackSlider.setDisabled(False)
-            self.player.play()
-            self.playback_control.button_play_pause.setIcon(QIcon(ICON_PLAYBACK_PAUSE))
+            self.play_files([file_name])
+
+    def play_files(self, file_names):
+        logger.info("Loading %s", file_names[0])
+        self.engine.play_files(file_names)
+
+    def enqueue_files(self, file_names):
+        self.engine.enqueue(file_names)
+
+    def play_row(self, row):
+        self.engine.play_index(row)
+
+    def ensure_lower_panel(self):
+        if self.lower_panel is not None:
+            return
+        self.playlist_panel = PlaylistPanel(self.playlist_model)
+        self.playlist_panel.rowActivated.connect(self.play_row)
+
+        self.library_search = LibrarySearch(self.library)
+        self.library_search.trackActivated.connect(lambda path: self.enqueue_files([path]))
+        if self.search_index is not None:
+            self.library_search.set_index(self.search_index)
+        else:
+            self.start_search_index()
+
+        self.album_grid = AlbumGrid(self.library.db_path, self.thumbnails)
+        self.album_grid.albumActivated.connect(
+            lambda album, directory: self.enqueue_files(self.library.album_paths(album, directory)))
+
+        self.lower_panel = QTabWidget()
+        self.lower_panel.addTab(self.playlist_panel, "Playlist")
+        self.lower_panel.addTab(self.library_search, "Search")
+        self.lower_panel.addTab(self.album_grid, "Albums")
+        self.windowLayout.addWidget(self.lower_panel, 1)
+
+    def start_search_index(self):
+        if self.search_index is not None or self.search_index_pending is not None:
+            return
+        self.search_index_pending = []
+        task = SearchIndexTask(self.library.db_path)
+        task.signals.ready.connect(self.search_index_ready)
+        QThreadPool.globalInstance().start(task)
+
+    def search_index_ready(self, index):
+        for records, removed in self.search_index_pending:
+            index.apply_changes(records, removed)
+        self.search_index = index
+        self.search_index_pending = None
+        if self.library_search is not None:
+            self.library_search.set_index(index)
+
+    def library_tracks_changed(self, records, removed):
+        if records:
+            self.engine.gains_changed([record["path"] for record in records])
+        if self.search_index_pending is not None:
+            self.search_index_pending.append((records, removed))
+        elif self.search_index is not None:
+            self.search_index.apply_changes(records, removed)
+        self.thumbnails.forget_missing()
+        if self.album_grid is not None:
+            self.album_grid.invalidate()
+
+    def toggle_playlist(self, visible):
+        if visible:
+            self.ensure_lower_panel()
+        if self.lower_panel is not None:
+            self.lower_panel.setVisible(visible)
+        self.setFixedSize(700, PLAYLIST_WINDOW_HEIGHT if visible else 300)
+
+    def track_changed(self, file_name):
+        self.current_audio_file = file_name
+        self.position_scheduler.reset()
+        self.playback_control.button_play_pause.setDisabled(False)
+        self.playback_control.button_stop.setDisabled(False)
+        self.playback_control.button_previous.setDisabled(self.queue.peek(-1) is None)
+        self.playback_control.button_next.setDisabled(self.queue.peek() is None)
+        self.progress_bar.playbackSlider.setDisabled(False)
+        # A restored session opens its track paused
+        self.playback_state_changed(self.engine.state)
+
+        # Playback is already running, details follow once the loader is done
+        self.playback_detail.update(os.path.basename(file_name), "-", "-")
+        self.metadata_loader.load(file_name)
+        self.prefetch_upcoming()
+        self.progress_bar.playbackSlider.setPeaks(None)
+        self.waveform_loader.load(file_name)
+
+    def prefetch_upcoming(self):
+        self.metadata_loader.prefetch([self.queue.peek(offset) for offset in range(1, self.prefetch_tracks + 1)])
+
+    def show_waveform(self, file_name, peaks):
+        if file_name == self.current_audio_file:
+            self.progress_bar.playbackSlider.setPeaks(peaks)
+
+    def show_waveform_error(self, file_name, error):
+        logger.warning("Failed to compute waveform for %s: %s", file_name, error)
+
+    def playback_state_changed(self, state):
+        if state == "playing":
+            self.playback_control.button_play_pause.setIcon(icon(ICON_PLAYBACK_PAUSE))
+        else:
+            self.playback_control.button_play_pause.setIcon(icon(ICON_PLAYBACK_START))
+
+    def transition_measured(self, gap):
+        logger.info("Track transition took %.1f ms", gap)
 
     def mute_audio(self):
-        if self.audio.isMuted():
-            print("Unmuting audio")
-            self.audio.setMuted(False)
-            self.playback_control.button_mute.setIcon(QIcon(ICON_VOLUME_HIGH))
+        if self.player.isMuted():
+            logger.debug("Unmuting audio")
+            self.engine.set_muted(False)
         else:
-            print("Muting audio")
-            self.audio.setMuted(True)
-            self.playback_control.button_mute.setIcon(QIcon(ICON_VOLUME_MUTE))
+            logger.debug("Muting audio")
+            self.engine.set_muted(True)
+
+    def show_muted(self, muted):
+        self.playback_control.button_mute.setIcon(icon(ICON_VOLUME_MUTE if muted else ICON_VOLUME_HIGH))
 
     def set_volume(self, position):
-        print("Setting volume to", position)
-        self.audio.setVolume(position * 0.01)
+        logger.debug("Setting volume to %d", position)
+        self.engine.set_volume(position * 0.01)
+
+    def show_volume(self, volume):
+        # Changes that came in over IPC move the slider without feeding back into set_volume
+        slider = self.playback_control.volume_slider
+        slider.blockSignals(True)
+        slider.setValue(round(volume * 100))
+        slider.blockSignals(False)
 
     def stop_audio(self):
-        print("Stopping audio")
-        self.player.stop()
-        self.playback_control.button_play_pause.setIcon(QIcon(ICON_PLAYBACK_START))
+        logger.debug("Stopping audio")
+        self.engine.stop()
+        self.playback_control.button_play_pause.setIcon(icon(ICON_PLAYBACK_START))
         self.playback_control.button_stop.setDisabled(True)
 
     def change_position(self, value):
-        print("Position changed to", value)
-        self.player.setPosition(value * 1000)
+        if self.progress_bar.playbackSlider.isSliderDown():
+            self.seek_debouncer.moved(value)
+        else:
+            self.seek(value)
+
+    def finish_seek(self):
+        self.seek_debouncer.released(self.progress_bar.playbackSlider.value())
+
+    def seek(self, value):
+        logger.debug("Position changed to %d", value)
+        self.engine.seek(value * 1000)
+        self.position_scheduler.reset()
+        self.show_position(value)
 
 
     def play_pause_audio(self):
-        if self.player.playbackState() == QMediaPlayer.PlaybackState.PlayingState:
-            print("Pausing audio")
-            self.player.pause()
-            self.playback_control.button_play_pause.setIcon(QIcon(ICON_PLAYBACK_START))
+        if self.player.is_playing():
+            logger.debug("Pausing audio")
+            self.engine.pause()
+            self.playback_control.button_play_pause.setIcon(icon(ICON_PLAYBACK_START))
         else:
             if self.current_audio_file:
-                print("Playing audio")
-                self.player.play()
-                self.playback_control.button_play_pause.setIcon(QIcon(ICON_PLAYBACK_PAUSE))
+                logger.debug("Playing audio")
+                self.engine.play()
+                self.playback_control.button_play_pause.setIcon(icon(ICON_PLAYBACK_PAUSE))
                 self.playback_control.button_stop.setDisabled(False)
         
     def duration_changed(self, duration):
-        print("Duration changed to", duration)
+        logger.debug("Duration changed to %d", duration)
         self.progress_bar.playbackSlider.setRange(0, duration)
 
     def update_position(self, position):
-        # print("Position set to ", position)
-        self.progress_bar.playbackSlider.setValue((position // 1000))
-        self.progress_bar.currentLabel.setText(f"{position // 60000}:{(position // 1000) % 60:02}")
+        self.position_scheduler.push(position)
+
+    def show_position(self, second):
+        # Leave the handle alone while the user is dragging it
+        if not self.progress_bar.playbackSlider.isSliderDown():
+            self.progress_bar.playbackSlider.setValue(second)
+        self.progress_bar.currentLabel.setText(f"{second // 60}:{second % 60:02}")
 
     def update_duration(self, duration):
-        print("music duration is", duration // 1000)
+        logger.debug("Track duration is %d s", duration // 1000)
         self.progress_bar.playbackSlider.setRange(0, (duration // 1000))
         self.progress_bar.totalLabel.setText(f"{duration // 60000}:{(duration // 1000) % 60:02}")
 
@@ -374,32 +784,146 @@ class MainWindow(QMainWindow):
             event.acceptProposedAction()
 
     def dropEvent(self, event: QDropEvent):
-        for url in event.mimeData().urls():
-            file_name = url.toLocalFile()
-            # wav and ogg is not supported yet
-            # if file_name.lower().endswith(('.mp3', '.wav', '.ogg')):
-            if file_name.lower().endswith(('.mp3')):
-                self.load_audio(file_name)
-                break
-
-    def cleanup_temp_files(self):
-        for temp_file in self.temp_files:
-            try:
-                if os.path.exists(temp_file):
-                    os.remove(temp_file)
-                    print(f"Deleted temporary file: {temp_file}")
-            except Exception as e:
-                print(f"Failed to delete temporary file {temp_file}: {e}")
-        self.temp_files = []
+        # Files and folders are resolved in the background and appended in chunks
+        file_names = [url.toLocalFile() for url in event.mimeData().urls() if url.isLocalFile()]
+        if file_names:
+            self.enqueue_files(file_names)
 
     def closeEvent(self, event):
-        print("Closing the app")
-        print(self.temp_files)
-        self.cleanup_temp_files()
+        logger.info("Closing the app")
+        self.session.save(wait=True)
+        self.engine.close()
+        if self.ipc_server is not None:
+            self.ipc_server.close()
+        self.waveform_loader.cancel()
+        self.metadata_loader.cancel_prefetch()
+        self.thumbnails.cancel()
+        self.playlist_model.cancel()
+        if self.library_scanner is not None:
+            self.library_scanner.cancel()
+            self.library_scanner.wait()
+        if self.loudness_scanner is not None:
+            self.loudness_scanner.cancel()
+            self.loudness_scanner.wait()
+        if self.duplicate_scanner is not None:
+            self.duplicate_scanner.cancel()
+            self.duplicate_scanner.wait()
+        self.library.close()
         event.accept()
 
 
-app = QApplication(sys.argv)
-window = MainWindow()
-window.show()
-app.exec()
+def run_headless(args, qt_args):
+    app = QCoreApplication(sys.argv[:1] + qt_args)
+    app.setApplicationName("qt-music-player")
+    library = Library(default_library_path())
+    engine = PlayerEngine(library)
+    server = IpcServer(engine, args.socket)
+    try:
+        logger.info("Listening for commands on %s", server.listen())
+    except InstanceRunning as e:
+        engine.close()
+        library.close()
+        if not args.play:
+            logger.error("%s", e)
+            sys.exit(1)
+        # Hand the files to the instance that is already running instead
+        from components.ipc_client import IpcClient
+
+        try:
+            client = IpcClient(args.socket)
+            try:
+                client.call("play_files", paths=[os.path.abspath(path) for path in args.play])
+            finally:
+                client.close()
+        except (OSError, RuntimeError) as e:
+            logger.error("Running player on %s did not take the files: %s", args.socket, e)
+            sys.exit(1)
+        logger.info("Sent %d paths to the running player on %s", len(args.play), args.socket)
+        return
+    session = SessionStore(engine)
+    if args.play:
+        engine.play_files(args.play)
+    else:
+        session.loaded.connect(session.restore)
+        session.load()
+    session.start()
+
+    # Python only handles SIGINT/SIGTERM between bytecodes, the timer gives it the chance
+    signal.signal(signal.SIGINT, lambda *_: app.quit())
+    signal.signal(signal.SIGTERM, lambda *_: app.quit())
+    wakeup = QTimer()
+    wakeup.start(500)
+    wakeup.timeout.connect(lambda: None)
+    dump_timer = start_metrics_dump(args)
+
+    app.exec()
+    session.save(wait=True)
+    engine.close()
+    server.close()
+    library.close()
+    if dump_timer is not None:
+        metrics.dump(args.metrics_dump)
+
+
+def start_metrics_dump(args):
+    if not args.metrics_dump:
+        return None
+    # Rewritten in place so a scraper or a tail -f always sees the current numbers
+    timer = QTimer()
+    timer.timeout.connect(lambda: metrics.dump(args.metrics_dump))
+    timer.start(int(args.metrics_interval * 1000))
+    return timer
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--profile-startup", action="store_true", help="print a per-phase startup timing breakdown")
+    parser.add_argument("--headless", action="store_true", help="run without a window, controlled over IPC only")
+    parser.add_argument("--ipc", action="store_true", help="also accept IPC commands while the window is up")
+    parser.add_argument("--socket", default=DEFAULT_SOCKET_NAME, help="local socket name or path for IPC")
+    parser.add_argument("--play", nargs="+", default=[], metavar="PATH", help="files or folders to play")
+    parser.add_argument("--log-level", default=os.environ.get("QMP_LOG_LEVEL", "INFO"),
+                        help="DEBUG, INFO, WARNING or ERROR (default: $QMP_LOG_LEVEL or INFO)")
+    parser.add_argument("--metrics-dump", metavar="PATH",
+                        help="write timings and counters to PATH, Prometheus text for .prom/.txt, JSON otherwise")
+    parser.add_argument("--metrics-interval", type=float, default=DEFAULT_METRICS_INTERVAL, metavar="SECONDS",
+                        help="how often --metrics-dump is rewritten (default %(default)s)")
+    args, qt_args = parser.parse_known_args()
+    configure_logging(args.log_level)
+
+    if args.headless:
+        run_headless(args, qt_args)
+        return
+
+    profiler = StartupProfiler(args.profile_startup, STARTED)
+    profiler.mark("imports")
+    app = QApplication(sys.argv[:1] + qt_args)
+    app.setApplicationName("qt-music-player")
+    profiler.mark("QApplication")
+    window = MainWindow()
+    profiler.mark("MainWindow")
+    window.show()
+    profiler.mark("show")
+
+    def finish_startup():
+        profiler.mark("first event loop pass")
+        # Files given on the command line replace the last session
+        window.finish_startup(restore=not args.play)
+        if args.ipc:
+            window.start_ipc_server(args.socket)
+        if args.play:
+            window.play_files(args.play)
+        profiler.mark("deferred startup")
+        profiler.report()
+
+    QTimer.singleShot(0, finish_startup)
+    dump_timer = start_metrics_dump(args)
+    app.exec()
+    if dump_timer is not None:
+        metrics.dump(args.metrics_dump)
+
+
+# The library scanner spawns worker processes that import this module
+if __name__ == "__main__":
+    main()
+
@@ -0,0 +1,82 @@
+import os
+import time
+import shutil
+import tempfile
+import unittest
+
+from PyQt6.QtCore import QCoreApplication
+
+from benchmarks.fixtures import write_mp3
+
+# Upper bound for the gap between two queued tracks; a cold load instead of the pre-opened player takes far longer
+MAX_GAP_MS = 50
+TRACKS = 3
+TRACK_SECONDS = 2
+# Short enough that every track arms the next one right after it starts
+PRELOAD_MS = 1500
+
+
+def wait_for(condition, timeout):
+    app = QCoreApplication.instance()
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            raise TimeoutError
+        app.processEvents()
+        time.sleep(0.001)
+
+
+class GaplessTransitionTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        try:
+            from PyQt6.QtMultimedia import QMediaDevices
+        except ImportError as e:
+            raise unittest.SkipTest(f"QtMultimedia unavailable: {e}")
+        cls.app = QCoreApplication.instance() or QCoreApplication([])
+        if not QMediaDevices.audioOutputs():
+            raise unittest.SkipTest("no audio output device")
+        cls.directory = tempfile.mkdtemp()
+        cls.paths = []
+        for i in range(TRACKS):
+            path = os.path.join(cls.directory, f"{i}.mp3")
+            write_mp3(path, f"Track {i}", "Gapless", "Gapless", seconds=TRACK_SECONDS)
+            cls.paths.append(path)
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.directory, ignore_errors=True)
+
+    def test_transition_gap(self):
+        from components.playback_queue import PlaybackQueue
+        from components.gapless_player import GaplessPlayer
+
+        queue = PlaybackQueue()
+        player = GaplessPlayer(queue, preload_ms=PRELOAD_MS)
+        player.setVolume(0.0)
+        gaps = []
+        tracks = []
+        swaps = []
+        player.transitionMeasured.connect(gaps.append)
+        player.trackChanged.connect(tracks.append)
+        swap = player.swap
+        player.swap = lambda: (swaps.append(queue.current()), swap())
+
+        queue.replace(self.paths)
+        player.play_current()
+        try:
+            wait_for(lambda: len(gaps) == TRACKS - 1, timeout=TRACKS * TRACK_SECONDS + 20)
+        except TimeoutError:
+            self.fail(f"{len(gaps)} of {TRACKS - 1} transitions measured")
+        finally:
+            player.stop()
+            player.close()
+
+        self.assertEqual(tracks, self.paths)
+        # Every transition went through the player opened ahead of time
+        self.assertEqual(swaps, self.paths[1:])
+        self.assertLess(max(gaps), MAX_GAP_MS, f"gaps: {', '.join(f'{gap:.1f} ms' for gap in gaps)}")
+
+
+if __name__ == "__main__":
+    unittest.main()
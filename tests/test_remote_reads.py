@@ -0,0 +1,177 @@
+import io
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+from PyQt6.QtCore import QCoreApplication
+
+from benchmarks.fixtures import write_mp3, cover_jpeg
+from benchmarks.throttled_fs import throttled_mount
+from components import read_ahead
+from components.file_io import RangedReader, open_for_tags
+from components.read_ahead import ReadAheadDevice
+
+# Small blocks so a few KB of data already cross many block boundaries
+BLOCK = 4096
+FILE_SIZE = 10 * BLOCK + 123
+# Fast enough that only correctness is under test, not the wait
+FAST = {"latency_ms": 0, "mbit_s": 100000}
+
+
+class RemoteReadTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, "data.bin")
+        self.data = os.urandom(FILE_SIZE)
+        with open(self.path, "wb") as f:
+            f.write(self.data)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+
+class RangedReaderTest(RemoteReadTest):
+    def test_reads_match_file(self):
+        with throttled_mount(self.directory, **FAST):
+            reader = RangedReader(self.path, BLOCK)
+            try:
+                # Within a block, across boundaries, from a block start, and a long run
+                for start, size in ((10, 100), (BLOCK - 5, 10), (3 * BLOCK, BLOCK), (BLOCK + 1, 5 * BLOCK + 7), (0, 1)):
+                    reader.seek(start)
+                    self.assertEqual(reader.read(size), self.data[start:start + size], (start, size))
+                    self.assertEqual(reader.tell(), start + size)
+            finally:
+                reader.close()
+
+    def test_short_reads_at_end(self):
+        with throttled_mount(self.directory, **FAST):
+            reader = RangedReader(self.path, BLOCK)
+            try:
+                reader.seek(-50, io.SEEK_END)
+                self.assertEqual(reader.read(1000), self.data[-50:])
+                self.assertEqual(reader.read(1000), b"")
+                reader.seek(FILE_SIZE + 100)
+                self.assertEqual(reader.read(10), b"")
+                self.assertEqual(reader.readall(), b"")
+                reader.seek(0)
+                self.assertEqual(reader.readall(), self.data)
+                with self.assertRaises(ValueError):
+                    reader.seek(-1)
+            finally:
+                reader.close()
+
+    def test_blocks_are_read_once(self):
+        with throttled_mount(self.directory, **FAST) as throttle:
+            reader = RangedReader(self.path, BLOCK)
+            try:
+                reader.seek(BLOCK // 2)
+                reader.read(3 * BLOCK)
+                calls = throttle.calls
+                # Consecutive missing blocks go out as one read
+                self.assertEqual(calls, 1)
+                reader.seek(BLOCK)
+                self.assertEqual(reader.read(BLOCK), self.data[BLOCK:2 * BLOCK])
+                self.assertEqual(throttle.calls, calls)
+            finally:
+                reader.close()
+
+    def test_truncated_file(self):
+        with throttled_mount(self.directory, **FAST):
+            reader = RangedReader(self.path, BLOCK)
+            try:
+                os.truncate(self.path, 2 * BLOCK)
+                reader.seek(BLOCK)
+                # What is left is returned, the rest reads as the end of the file
+                self.assertEqual(reader.read(4 * BLOCK), self.data[BLOCK:2 * BLOCK])
+                self.assertEqual(reader.read(BLOCK), b"")
+            finally:
+                reader.close()
+
+    def test_read_error(self):
+        with throttled_mount(self.directory, **FAST):
+            reader = RangedReader(self.path, BLOCK)
+            try:
+                with mock.patch("os.pread", side_effect=OSError(5, "Input/output error")):
+                    with self.assertRaises(OSError):
+                        reader.read(10)
+                # Nothing half-read was kept, the next read goes out again
+                self.assertEqual(reader.read(10), self.data[:10])
+            finally:
+                reader.close()
+
+    def test_tags_match_local_read(self):
+        from components.metadata import read_tags
+
+        path = os.path.join(self.directory, "track.mp3")
+        write_mp3(path, "Title", "Artist", "Album", seconds=2, tag_bytes=100 * 1024, cover=cover_jpeg(300))
+        local = read_tags(path)
+        with throttled_mount(self.directory, **FAST):
+            reader = open_for_tags(path)
+            self.assertIsInstance(reader, RangedReader)
+            reader.close()
+            remote = read_tags(path)
+        self.assertEqual(remote, local)
+
+
+class ReadAheadDeviceTest(RemoteReadTest):
+    @classmethod
+    def setUpClass(cls):
+        cls.app = QCoreApplication.instance() or QCoreApplication([])
+
+    def open_device(self):
+        device = ReadAheadDevice(self.path, chunk_size=BLOCK, read_ahead=3 * BLOCK)
+        self.assertTrue(device.open())
+        self.addCleanup(device.close)
+        return device
+
+    def test_reads_match_file(self):
+        with throttled_mount(self.directory, **FAST):
+            device = self.open_device()
+            self.assertEqual(device.size(), FILE_SIZE)
+            read = bytearray()
+            while not device.atEnd():
+                part = bytes(device.read(1000))
+                self.assertTrue(part)
+                read += part
+            self.assertEqual(bytes(read), self.data)
+            self.assertEqual(bytes(device.read(10)), b"")
+
+    def test_seeks(self):
+        with throttled_mount(self.directory, **FAST):
+            device = self.open_device()
+            # Forward past the read-ahead window, back behind it, and into the last chunk
+            for start, size in ((7 * BLOCK + 5, 2 * BLOCK), (100, 300), (BLOCK - 1, 2), (FILE_SIZE - 10, 100)):
+                self.assertTrue(device.seek(start))
+                expected = self.data[start:start + size]
+                read = bytearray()
+                while len(read) < len(expected):
+                    part = bytes(device.read(size - len(read)))
+                    self.assertTrue(part, (start, size))
+                    read += part
+                self.assertEqual(bytes(read), expected, (start, size))
+
+    def test_read_error(self):
+        with throttled_mount(self.directory, **FAST):
+            with mock.patch("os.pread", side_effect=OSError(5, "Input/output error")):
+                device = self.open_device()
+                # readData failed, which the decoder sees as an I/O error
+                self.assertIsNone(device.read(10))
+            self.assertIn("Input/output error", device.errorString())
+
+    def test_read_timeout(self):
+        with mock.patch.object(read_ahead, "READ_TIMEOUT", 0.05), \
+                throttled_mount(self.directory, latency_ms=500):
+            device = self.open_device()
+            self.assertIsNone(device.read(10))
+            self.assertEqual(device.errorString(), "read timed out")
+
+    def test_missing_file(self):
+        device = ReadAheadDevice(os.path.join(self.directory, "missing.bin"))
+        self.assertFalse(device.open())
+        self.assertTrue(device.errorString())
+
+
+if __name__ == "__main__":
+    unittest.main()